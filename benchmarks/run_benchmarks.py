@@ -0,0 +1,393 @@
+"""
+This module times the hot paths of a strategy run on synthetic candles and compares them with a baseline.
+
+Run from the root of the repository:
+
+    python -m benchmarks.run_benchmarks --save-baseline      # record benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks                      # compare with it, exits with 1 on a regression
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_data import INDEX, SyntheticMarket, SyntheticTickerDataService
+from model.market_regime_filter import LongTermMovingAverageMarketRegimeFilter
+from model.Ohlcv import OhlcData
+from model.portfolio.holding import Holding
+from model.portfolio.portfolio import Portfolio
+from model.position_sizing.position_sizing_strategies import EqualRiskPositionSizingStrategy
+from model.ranking.ranking_result import RankingTable
+from model.ranking.ranking_strategies import VolatilityAdjustedReturnsRankingStrategy
+from model.rebalancing.portfolio_rebalancing import PortfolioRebalancingStrategyStrategyImpl
+from model.scheduling.frequency import DayOfWeek, Frequency
+from model.scheduling.schedule import Schedule
+from repositories.ohlc_file_store import OhlcFileStore
+from services.cache_service import CacheService
+from services.feature_store import FeatureStore
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+DEFAULT_SIZES = [50, 500, 2000, 5000]
+DEFAULT_YEARS = [1, 5, 10]
+BENCHMARKS = ['rank', 'position_sizing', 'rebalance', 'ohlc_from_json', 'ohlc_to_df', 'cache_save', 'cache_get_store',
+              'cache_get_memory']
+# parameters of the strategy, the defaults of app.properties
+NUM_DAYS = 90
+TICKER_EMA_SPAN = 100
+MAX_GAP_PERCENT = 19.1
+ATR_PERIOD = 20
+INDEX_EMA_SPAN = 200
+RISK_FACTOR = 0.003
+TOP_N_PERCENT = 20
+THRESHOLD = 0.0025
+ACCOUNT_VALUE = 10000000.0
+# payloads of ohlc_from_json are built for this many tickers at most and reused, to bound the memory of the inputs
+MAX_JSON_PAYLOADS = 200
+# a benchmark regresses when it is slower (or larger) than the baseline by the tolerance and by at least this many
+# seconds (or bytes), so that the noise of the fast benchmarks is not flagged
+MIN_REGRESSION_SECONDS = 0.005
+MIN_REGRESSION_BYTES = 1024 * 1024
+
+
+class BenchmarkCase:
+    """
+    This class holds the inputs shared by the benchmarks of one universe size and history length: the synthetic
+    market, the candles of every ticker of the lookup window (the fetch is not timed) and the ranking of the universe
+    """
+
+    def __init__(self, num_tickers: int, num_years: int, work_dir: str) -> None:
+        super().__init__()
+        self.num_tickers = num_tickers
+        self.num_years = num_years
+        self.work_dir = work_dir
+        self.market = SyntheticMarket(num_tickers, num_years)
+        self.ticker_data_service = SyntheticTickerDataService(self.market)
+        self.as_of = self.market.end_date
+        self.lookup_days = num_years * 365
+        warm_store = FeatureStore(ticker_data_service=self.ticker_data_service, as_of=self.as_of)
+        warm_store.get_data_many(self.market.tickers + [INDEX], self.lookup_days)
+        self.ohlc_data = dict(warm_store.ohlc_data)
+        self.ranking_table: Optional[RankingTable] = None
+
+    def new_feature_store(self) -> FeatureStore:
+        # the candles are already fetched, the indicators are computed again by every run
+        feature_store = FeatureStore(ticker_data_service=self.ticker_data_service, as_of=self.as_of)
+        feature_store.ohlc_data = dict(self.ohlc_data)
+        return feature_store
+
+    def new_ranking_strategy(self, feature_store: FeatureStore) -> VolatilityAdjustedReturnsRankingStrategy:
+        return VolatilityAdjustedReturnsRankingStrategy(num_days=NUM_DAYS,
+                                                        default_historical_lookup_days=self.lookup_days,
+                                                        max_gap_percent=MAX_GAP_PERCENT,
+                                                        ticker_ema_span=TICKER_EMA_SPAN,
+                                                        feature_store=feature_store)
+
+    def get_ranking_table(self) -> RankingTable:
+        if self.ranking_table is None:
+            self.ranking_table = self.new_ranking_strategy(self.new_feature_store()).rank(self.market.tickers)
+        return self.ranking_table
+
+    def get_top_symbols(self) -> list[str]:
+        ranking_table = self.get_ranking_table()
+        return [row.symbol for row in ranking_table.rows[:len(ranking_table.rows) * TOP_N_PERCENT // 100]]
+
+
+def setup_rank(case: BenchmarkCase) -> Callable[[], None]:
+    ranking_strategy = case.new_ranking_strategy(case.new_feature_store())
+    return lambda: ranking_strategy.rank(case.market.tickers)
+
+
+def setup_position_sizing(case: BenchmarkCase) -> Callable[[], None]:
+    ranking_table = case.get_ranking_table()
+    candidates = case.get_top_symbols()
+    position_sizing_strategy = EqualRiskPositionSizingStrategy(default_historical_lookup_days=case.lookup_days,
+                                                               atr_period=ATR_PERIOD,
+                                                               risk_factor=RISK_FACTOR,
+                                                               feature_store=case.new_feature_store())
+    return lambda: position_sizing_strategy.calculate_position_sizes(ranking_table, ACCOUNT_VALUE, candidates)
+
+
+def setup_rebalance(case: BenchmarkCase) -> Callable[[], None]:
+    ranking_table = case.get_ranking_table()
+    feature_store = case.new_feature_store()
+    trade_day = DayOfWeek.from_string(case.as_of.strftime('%A').upper(), default=DayOfWeek.WEDNESDAY)
+    position_sizing_strategy = EqualRiskPositionSizingStrategy(default_historical_lookup_days=case.lookup_days,
+                                                               atr_period=ATR_PERIOD,
+                                                               risk_factor=RISK_FACTOR,
+                                                               feature_store=feature_store)
+    market_regime_filter = LongTermMovingAverageMarketRegimeFilter(index=INDEX,
+                                                                   index_ema_span=INDEX_EMA_SPAN,
+                                                                   default_historical_lookup_days=case.lookup_days,
+                                                                   feature_store=feature_store)
+    # positions are rebalanced on the as-of date, so every branch of the rebalancing runs
+    rebalancing_strategy = PortfolioRebalancingStrategyStrategyImpl(
+        top_n_percent=TOP_N_PERCENT,
+        ticker_ema_span=TICKER_EMA_SPAN,
+        market_regime_filter=market_regime_filter,
+        risk_factor=RISK_FACTOR,
+        position_sizing_strategy=position_sizing_strategy,
+        position_rebalance_schedule=Schedule(start_date=case.market.start_date, end_date=case.as_of,
+                                             frequency=Frequency.WEEKLY, day_of_week=trade_day),
+        threshold=THRESHOLD,
+        persist_results=False)
+    # half of the holdings stay in the top ranks, the other half are sold
+    top_symbols = case.get_top_symbols()
+    bottom_symbols = [row.symbol for row in ranking_table.rows[-len(top_symbols):]]
+    portfolio = Portfolio(name='benchmark')
+    portfolio.cash = ACCOUNT_VALUE / 2
+    for symbol in top_symbols[::2] + bottom_symbols[::2]:
+        portfolio.add_holding(Holding(symbol=symbol, quantity=10))
+    return lambda: rebalancing_strategy.rebalance_portfolio(portfolio, ranking_table, 0.0, as_of=case.as_of)
+
+
+def setup_ohlc_from_json(case: BenchmarkCase) -> Callable[[], None]:
+    tickers = case.market.tickers
+    payloads = [case.market.get_candles_json(ticker) for ticker in tickers[:MAX_JSON_PAYLOADS]]
+
+    def run() -> None:
+        for position, ticker in enumerate(tickers):
+            OhlcData.from_json(ticker, payloads[position % len(payloads)])
+
+    return run
+
+
+def setup_ohlc_to_df(case: BenchmarkCase) -> Callable[[], None]:
+    ohlc_data = [case.market.get_ohlc_data(ticker) for ticker in case.market.tickers]
+
+    def run() -> None:
+        for data in ohlc_data:
+            data.to_df()
+
+    return run
+
+
+def new_cache_service(case: BenchmarkCase) -> CacheService:
+    store_dir = os.path.join(case.work_dir, 'ohlc')
+    shutil.rmtree(store_dir, ignore_errors=True)
+    OhlcFileStore.instance = OhlcFileStore(path=store_dir, max_bytes=16 * 1024 * 1024 * 1024)
+    return CacheService()
+
+
+def setup_cache_save(case: BenchmarkCase) -> Callable[[], None]:
+    cache_service = new_cache_service(case)
+    market = case.market
+
+    def run() -> None:
+        for ticker in market.tickers:
+            cache_service.save_data(ticker, market.start_date, market.end_date, market.get_ohlc_data(ticker))
+
+    return run
+
+
+def setup_cache_get_store(case: BenchmarkCase) -> Callable[[], None]:
+    # the candles are in the store but not in memory, e.g. after a restart or in another worker
+    setup_cache_save(case)()
+    cache_service = CacheService()
+    return lambda: read_cache(cache_service, case)
+
+
+def setup_cache_get_memory(case: BenchmarkCase) -> Callable[[], None]:
+    setup_cache_save(case)()
+    cache_service = CacheService()
+    read_cache(cache_service, case)
+    return lambda: read_cache(cache_service, case)
+
+
+def read_cache(cache_service: CacheService, case: BenchmarkCase) -> None:
+    start_date, end_date = case.as_of - timedelta(case.lookup_days), case.as_of
+    for ticker in case.market.tickers:
+        if not cache_service.get_missing_ranges(ticker, start_date, end_date):
+            cache_service.get_data(ticker, start_date, end_date)
+
+
+SETUPS = {
+    'rank': setup_rank,
+    'position_sizing': setup_position_sizing,
+    'rebalance': setup_rebalance,
+    'ohlc_from_json': setup_ohlc_from_json,
+    'ohlc_to_df': setup_ohlc_to_df,
+    'cache_save': setup_cache_save,
+    'cache_get_store': setup_cache_get_store,
+    'cache_get_memory': setup_cache_get_memory
+}
+
+
+def measure(setup: Callable[[], Callable[[], None]], repeat: int) -> dict:
+    """
+    This function times a benchmark and measures the memory it allocates. The setup is not measured. The time is
+    the best of repeat runs, the peak memory is measured in a separate run as tracemalloc slows the code down
+    :param setup: returns the code to measure
+    :param repeat: number of timed runs
+    :return: seconds and peak_bytes
+    """
+    timings = []
+    for _ in range(repeat):
+        run = setup()
+        gc.collect()
+        start_time = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start_time)
+    run = setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(timings), 'median_seconds': float(np.median(timings)), 'peak_bytes': peak_bytes}
+
+
+def run_benchmarks(sizes: list[int], years: list[int], benchmarks: list[str], repeat: int, work_dir: str) -> list[dict]:
+    results = []
+    for num_years in years:
+        for num_tickers in sizes:
+            case = BenchmarkCase(num_tickers, num_years, work_dir)
+            for name in benchmarks:
+                result = {'benchmark': name, 'num_tickers': num_tickers, 'num_years': num_years,
+                          **measure(lambda: SETUPS[name](case), repeat)}
+                print(f'{name:<18} {num_tickers:>6} tickers {num_years:>3} years {result["seconds"]:>10.4f} s '
+                      f'{result["peak_bytes"] / 1024 / 1024:>10.1f} MB', flush=True)
+                results.append(result)
+            del case
+            gc.collect()
+    return results
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float, memory_tolerance: float) -> list[dict]:
+    """
+    This function flags the benchmarks that are slower, or allocate more memory, than in the baseline
+    :param results: results of this run
+    :param baseline: results of a previous run (see save_results)
+    :param tolerance: allowed relative increase of the time
+    :param memory_tolerance: allowed relative increase of the peak memory
+    :return: the results that regressed, with the baseline values
+    """
+    baseline_results = {get_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        baseline_result = baseline_results.get(get_key(result))
+        if baseline_result is None:
+            continue
+        slower = result['seconds'] > baseline_result['seconds'] * (1 + tolerance) and \
+            result['seconds'] - baseline_result['seconds'] > MIN_REGRESSION_SECONDS
+        larger = result['peak_bytes'] > baseline_result['peak_bytes'] * (1 + memory_tolerance) and \
+            result['peak_bytes'] - baseline_result['peak_bytes'] > MIN_REGRESSION_BYTES
+        if slower or larger:
+            regressions.append({**result, 'baseline_seconds': baseline_result['seconds'],
+                                'baseline_peak_bytes': baseline_result['peak_bytes']})
+    return regressions
+
+
+def get_key(result: dict) -> tuple:
+    return result['benchmark'], result['num_tickers'], result['num_years']
+
+
+def get_environment() -> dict:
+    # timings are only comparable on the same machine and library versions
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count()}
+
+
+def save_results(file_name: str, results: list[dict]) -> None:
+    with open(file_name, 'w', encoding='utf-8') as json_file:
+        json.dump({'created_at': datetime.now().isoformat(timespec='seconds'),
+                   'environment': get_environment(),
+                   'results': results}, json_file, indent=2)
+
+
+def prepare_work_dir(work_dir: str) -> None:
+    # the strategy reads app.properties and writes ranking.csv in the working directory, the benchmarks run in a
+    # scratch directory so that neither the real config nor the real files are touched
+    os.makedirs(work_dir, exist_ok=True)
+    with open(os.path.join(ROOT_DIR, 'app.properties.sample'), 'r', encoding='utf-8') as text_file:
+        properties = [line for line in text_file.read().splitlines()
+                      if not line.startswith(('cookie_file_path_pattern=', 'cache.store.path='))]
+    properties += [f'cookie_file_path_pattern={os.path.join(work_dir, "cookie_*.txt")}',
+                   f'cache.store.path={os.path.join(work_dir, "ohlc")}']
+    with open(os.path.join(work_dir, 'app.properties'), 'w', encoding='utf-8') as text_file:
+        text_file.write('\n'.join(properties) + '\n')
+    os.chdir(work_dir)
+
+
+def parse_list(text: str) -> list[int]:
+    return [int(value) for value in text.split(',') if value]
+
+
+def main(args: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Time ranking, position sizing, rebalancing, OhlcData and '
+                                                 'CacheService on synthetic candles')
+    parser.add_argument('--sizes', type=parse_list, default=DEFAULT_SIZES, help='universe sizes, e.g. 50,500')
+    parser.add_argument('--years', type=parse_list, default=DEFAULT_YEARS, help='years of history, e.g. 1,5,10')
+    parser.add_argument('--benchmarks', type=lambda text: text.split(','), default=BENCHMARKS,
+                        help=f'benchmarks to run, among {",".join(BENCHMARKS)}')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark, the best one is kept')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline json file')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the new baseline')
+    parser.add_argument('--output', default=None, help='json file the results are written to')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown')
+    parser.add_argument('--memory-tolerance', type=float, default=0.2, help='allowed relative memory increase')
+    parser.add_argument('--work-dir', default=None, help='scratch directory, a temporary one by default')
+    options = parser.parse_args(args)
+    unknown = set(options.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'unknown benchmarks {sorted(unknown)}, use {",".join(BENCHMARKS)}')
+
+    # the services log every ticker at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+    baseline_file = os.path.abspath(options.baseline)
+    output_file = os.path.abspath(options.output) if options.output else None
+    work_dir = options.work_dir or tempfile.mkdtemp(prefix='momentum-benchmarks-')
+    prepare_work_dir(os.path.abspath(work_dir))
+    try:
+        results = run_benchmarks(options.sizes, options.years, options.benchmarks, options.repeat, os.getcwd())
+    finally:
+        os.chdir(ROOT_DIR)
+        if options.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if output_file:
+        save_results(output_file, results)
+    if options.save_baseline:
+        save_results(baseline_file, results)
+        print(f'Saved the baseline to {baseline_file}')
+        return 0
+    if not os.path.exists(baseline_file):
+        print(f'No baseline at {baseline_file}, run with --save-baseline to record one')
+        return 0
+    with open(baseline_file, 'r', encoding='utf-8') as json_file:
+        baseline = json.load(json_file)
+    if baseline.get('environment') != get_environment():
+        print('The baseline was recorded in another environment, the comparison may not be meaningful')
+    regressions = compare(results, baseline, options.tolerance, options.memory_tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression["benchmark"]} {regression["num_tickers"]} tickers '
+              f'{regression["num_years"]} years: {regression["seconds"]:.4f} s '
+              f'(baseline {regression["baseline_seconds"]:.4f} s), '
+              f'{regression["peak_bytes"] / 1024 / 1024:.1f} MB '
+              f'(baseline {regression["baseline_peak_bytes"] / 1024 / 1024:.1f} MB)')
+    if not regressions:
+        print('No regression against the baseline')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+This module generates deterministic synthetic candles for the benchmarks
+"""
+
+from datetime import date, timedelta
+from typing import Callable, Optional
+
+import numpy as np
+
+from model.bulk_fetch_result import BulkFetchResult
+from model.Ohlcv import OhlcData
+
+EPOCH = date(1970, 1, 1)
+TRADING_DAYS_PER_YEAR = 250
+INDEX = 'NIFTY 50'
+
+
+class SyntheticMarket:
+    """
+    This class generates the daily candles of a universe with geometric Brownian motion. Every ticker has its own
+    drift and volatility, opens with an overnight gap (now and then a large one, so that the max gap filter has
+    something to filter), misses a few sessions (suspensions) and some tickers list after the first date. The
+    candles of a ticker depend only on the seed and the position of the ticker, so a ticker is the same in every
+    universe size
+    """
+
+    def __init__(self, num_tickers: int, num_years: int, end_date: date = date(2024, 12, 31), seed: int = 42,
+                 missing_probability: float = 0.01, jump_probability: float = 0.004,
+                 late_listing_fraction: float = 0.1) -> None:
+        """
+        This method initializes SyntheticMarket object
+        :param num_tickers: number of tickers of the universe
+        :param num_years: years of history, ending at end_date
+        :param end_date: last date of the history
+        :param seed: seed of the generators
+        :param missing_probability: probability that a ticker has no candle on a session
+        :param jump_probability: probability of a large overnight gap
+        :param late_listing_fraction: share of the tickers that list during the first half of the history
+        """
+        super().__init__()
+        self.num_tickers = num_tickers
+        self.end_date = end_date
+        self.seed = seed
+        self.missing_probability = missing_probability
+        self.jump_probability = jump_probability
+        self.late_listing_fraction = late_listing_fraction
+        self.tickers = [f'SYN{position:05d}' for position in range(num_tickers)]
+        self.positions = {ticker: position for position, ticker in enumerate(self.tickers)}
+        # sessions are the weekdays, the most recent num_years * TRADING_DAYS_PER_YEAR of them
+        end_day = (end_date - EPOCH).days
+        days = np.arange(end_day - num_years * 366 - 30, end_day + 1, dtype=np.int64)
+        days = days[(days + 3) % 7 < 5]
+        self.dates = days[-num_years * TRADING_DAYS_PER_YEAR:]
+        self.ohlc_data: dict[str, OhlcData] = {}
+
+    @property
+    def start_date(self) -> date:
+        return EPOCH + timedelta(int(self.dates[0]))
+
+    def get_ohlc_data(self, ticker: str) -> OhlcData:
+        """
+        This method returns the whole history of a ticker of the universe or of the index
+        :param ticker: ticker symbol
+        :return: OhlcData
+        """
+        ohlc_data = self.ohlc_data.get(ticker)
+        if ohlc_data is None:
+            position = -1 if ticker == INDEX else self.positions[ticker]
+            ohlc_data = self.ohlc_data[ticker] = self.generate(ticker, position)
+        return ohlc_data
+
+    def generate(self, ticker: str, position: int) -> OhlcData:
+        is_index = position < 0
+        rng = np.random.default_rng([self.seed, position + 1])
+        num_days = len(self.dates)
+        drift = rng.normal(0.12, 0.05 if is_index else 0.2) / TRADING_DAYS_PER_YEAR
+        volatility = (0.15 if is_index else rng.uniform(0.15, 0.6)) / np.sqrt(TRADING_DAYS_PER_YEAR)
+        # the variance of a day is split between the night (gap) and the session
+        overnight = rng.normal(0.0, volatility * 0.4, num_days)
+        if not is_index:
+            jumps = rng.random(num_days) < self.jump_probability
+            overnight[jumps] += rng.normal(0.0, 0.12, int(jumps.sum()))
+        intraday = rng.normal(drift - volatility ** 2 / 2, volatility * 0.9, num_days)
+        log_close = np.log(rng.uniform(50, 3000) * (100 if is_index else 1)) + np.cumsum(overnight + intraday)
+        close = np.exp(log_close)
+        open_ = np.exp(log_close - intraday)
+        high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0.0, volatility * 0.5, num_days)))
+        low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0.0, volatility * 0.5, num_days)))
+        volume = np.round(rng.lognormal(12, 1, num_days))
+        present = np.ones(num_days, dtype=bool)
+        if not is_index:
+            present = rng.random(num_days) >= self.missing_probability
+            if rng.random() < self.late_listing_fraction:
+                present[:rng.integers(1, max(2, num_days // 2))] = False
+        values = np.vstack([open_, high, low, close, volume])[:, present]
+        return OhlcData.from_columns(ticker, self.dates[present], np.ascontiguousarray(values))
+
+    def get_candles_json(self, ticker: str) -> list[list]:
+        """
+        This method returns the candles of a ticker the way the kite historical API sends them
+        :param ticker: ticker symbol
+        :return: [timestamp, open, high, low, close, volume] per session
+        """
+        ohlc_data = self.get_ohlc_data(ticker)
+        timestamps = [f'{day}T00:00:00+0530' for day in ohlc_data.dates.astype('datetime64[D]').astype(str)]
+        return [[timestamp] + candle for timestamp, candle in zip(timestamps, ohlc_data.values.T.tolist())]
+
+
+class SyntheticTickerDataService:
+    """
+    This class serves the candles of a SyntheticMarket in place of TickerDataService, so that the strategy code runs
+    without a network call
+    """
+
+    def __init__(self, market: SyntheticMarket) -> None:
+        super().__init__()
+        self.market = market
+
+    def get_data(self, ticker: str, start_date: date, end_date: date) -> OhlcData:
+        ohlc_data = self.market.get_ohlc_data(ticker)
+        start, end = np.searchsorted(ohlc_data.dates, [(start_date - EPOCH).days, (end_date - EPOCH).days + 1])
+        # a copy, like the candles of a fetch
+        return OhlcData(ticker, ohlc_data.dates[start:end].copy(), ohlc_data.values[:, start:end].copy())
+
+    def get_data_many(self, tickers: list[str], start_date: date, end_date: date,
+                      on_progress: Callable[[int, int, str, Optional[bool]], None] = None) -> BulkFetchResult:
+        fetch_result = BulkFetchResult(tickers)
+        for done, ticker in enumerate(tickers, start=1):
+            fetch_result.add_result(ticker, self.get_data(ticker, start_date, end_date))
+            if on_progress is not None:
+                on_progress(done, len(tickers), ticker, True)
+        return fetch_result
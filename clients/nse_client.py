@@ -2,10 +2,11 @@
 This module contains NSEClient class which is a wrapper around nsepy library.
 """
 
+import io
 import logging
 import random
+import threading
 import time
-from datetime import date
 from typing import Any
 
 import pandas as pd
@@ -14,6 +15,10 @@ from nsepy import get_history
 
 from exceptions.nse_client_exceptions import NSEClientException
 from model.company_info import CompanyInfo
+from model.scheduling.trading_calendar import TradingCalendar
+from services.config_service import ConfigService
+from services.memory_cache import MemoryCache
+from services.metrics import count_retries, instrumented_request
 
 
 class NSEClient:
@@ -26,11 +31,19 @@ class NSEClient:
     def __init__(self) -> None:
         super().__init__()
         self.cookie = None
+        self.cookie_lock = threading.Lock()
         self.logger = logging.getLogger(__name__)
         self.get_history = get_history
         self.nse_archives_base_url: str = "https://archives.nseindia.com"
         self.nse_base_url: str = "https://www.nseindia.com"
-        self.cache = {}
+        # company info is valid till the next market close, then it is refreshed in the background while the
+        # previous value is served for cache.memory.stale_seconds
+        config_service = ConfigService.get_instance()
+        self.cache = MemoryCache(
+            'company_info',
+            max_bytes=int(config_service.get_or_default('nse.cache.max_bytes', default=16 * 1024 * 1024)),
+            expiry=TradingCalendar.get_instance().next_close,
+            stale_seconds=float(config_service.get_or_default('cache.memory.stale_seconds', default=3600)))
 
     def get_data(self, symbol, start_date, end_date):
         """
@@ -50,11 +63,33 @@ class NSEClient:
         :param index: index name (e.g. NIFTY 50)
         :return: list of stocks in the index
         """
+        response = self.fetch_stock_universe(index)
+        return parse_stock_universe(response.content)
+
+    def fetch_stock_universe(self, index: str, etag: str = None, last_modified: str = None) -> requests.Response:
+        """
+        This method downloads the constituents file of an index from NSE archives. With etag or last_modified the
+        request is conditional and the response is 304 (without a body) if the file did not change
+        :param index: index name (e.g. NIFTY 50)
+        :param etag: ETag of the last download
+        :param last_modified: Last-Modified of the last download
+        :return: response with status 200 or 304
+        """
         self.logger.info("Fetching stock universe for index: %s", index)
-        url_template = "https://archives.nseindia.com/content/indices/ind_{index}list.csv"
+        url_template = self.nse_archives_base_url + "/content/indices/ind_{index}list.csv"
         url = url_template.format(index=index.lower().replace(' ', ''))
-        csv_df = pd.read_csv(url)
-        return csv_df["Symbol"].tolist()
+        headers = {
+            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36',
+        }
+        if etag:
+            headers['if-none-match'] = etag
+        if last_modified:
+            headers['if-modified-since'] = last_modified
+        response = instrumented_request('nse', 'index_constituents', 'GET', url, headers=headers, timeout=10)
+        if response.status_code not in [200, 304]:
+            raise NSEClientException(
+                f"Error fetching stock universe for index: {index}. Status code: {response.status_code}")
+        return response
 
     def get_company_info(self, ticker: str) -> CompanyInfo:
         """
@@ -62,11 +97,18 @@ class NSEClient:
         :param ticker: company ticker
         :return: company info
         """
-        key = ticker + "_" + str(date.today())
-        if key in self.cache:
-            return self.cache[key]
+        return self.cache.get_or_load(ticker, lambda: self.fetch_company_info(ticker))
 
-        self.sleep_for_a_while()
+    def fetch_company_info(self, ticker: str, wait: bool = True) -> CompanyInfo:
+        """
+        This method fetches company info from NSE website
+        :param ticker: company ticker
+        :param wait: sleep for a random while before the request. Callers that rate limit the requests themselves
+        pass False
+        :return: company info
+        """
+        if wait:
+            self.sleep_for_a_while()
         self.logger.info("Fetching company info for symbol: %s", ticker)
         url_template = self.nse_base_url + "/api" + f"/quote-equity?symbol={ticker}&section=trade_info"
         url = url_template.format(symbol=ticker)
@@ -88,14 +130,12 @@ class NSEClient:
             'upgrade-insecure-requests': '1',
             'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36',
         }
-        response = requests.request("GET", url, headers=headers, data=payload, timeout=5, cookies=self.get_cookie())
+        response = instrumented_request('nse', 'quote_equity', "GET", url, headers=headers, data=payload, timeout=5,
+                                        cookies=self.get_cookie())
 
         if response.status_code == 200:
-            company_info = CompanyInfo.from_json(ticker, response.json())
-            # update cache. key = symbol + date
-            self.cache[key] = company_info
-            return company_info
-        message = f"Error fetching company info for symbol: {ticker}"
+            return CompanyInfo.from_json(ticker, response.json())
+        message = f"Error fetching company info for symbol: {ticker}. Status code: {response.status_code}"
         raise NSEClientException(message)
 
     @staticmethod
@@ -112,9 +152,11 @@ class NSEClient:
         This method gets cookie from NSE website if not already present and returns it
         :return:
         """
-        if not self.cookie:
-            self.cookie = self.get_cookie_from_nse()
-        return self.cookie
+        # company info can be fetched from many threads, only one of them gets the cookie
+        with self.cookie_lock:
+            if not self.cookie:
+                self.cookie = self.get_cookie_from_nse()
+            return self.cookie
 
     def get_cookie_from_nse(self) -> dict[Any, Any]:
         """
@@ -128,7 +170,8 @@ class NSEClient:
             'accept-encoding': 'gzip, deflate, br',
         }
         session = requests.Session()
-        dummy_response_to_get_cookies = session.get(self.nse_base_url, headers=headers, timeout=30)
+        dummy_response_to_get_cookies = instrumented_request('nse', 'cookie', 'GET', self.nse_base_url,
+                                                             session=session, headers=headers, timeout=30)
         return dict(dummy_response_to_get_cookies.cookies)
 
     def try_to_get_company_info(self, ticker):
@@ -146,6 +189,7 @@ class NSEClient:
                 self.logger.error("Error fetching company info for symbol: %s", ticker)
                 self.logger.error(ex)
                 retry_count += 1
+                count_retries('nse', 'company_info')
                 self.cookie = None
                 time.sleep(10)
         raise NSEClientException(f"Error fetching company info for symbol: {ticker}")
@@ -159,3 +203,13 @@ class NSEClient:
         if cls.instance is None:
             cls.instance = NSEClient()
         return cls.instance
+
+
+def parse_stock_universe(content: bytes) -> list[str]:
+    """
+    This function reads the symbols of an index constituents file
+    :param content: csv downloaded from NSE archives
+    :return: list of symbols
+    """
+    csv_df = pd.read_csv(io.BytesIO(content))
+    return csv_df["Symbol"].tolist()
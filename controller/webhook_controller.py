@@ -1,9 +1,21 @@
-from flask import jsonify, request
+import json
+import time
+from datetime import date
+
+from flask import Response, g, jsonify, request, stream_with_context
 from config.app_config import AppConfig
-from services.strategy_executor import StrategyExecutor
+from clients.nse_client import NSEClient
+from services.backtest_service import BacktestService
+from services.cache_service import CacheService
+from services.job_service import JobService
+from services.metrics import MetricsRegistry
 from services.portfolio_service import PortfolioService
+from services.profiler import ProfilerService
 from services.ticker_historical_data import TickerDataService
 
+# seconds between heartbeats of an idle event stream, keeps proxies from closing the connection
+HEARTBEAT_INTERVAL = 15
+
 
 def update_request_token(request_token):
     app_config = AppConfig('app.properties')
@@ -23,16 +35,83 @@ def post_endpoint():
 
 
 def init():
-    # read the cash_flow query param and pass it to the strategy executor
+    # read the cash_flow query param and submit the strategy execution as a background job
     cash_flow_query_param = request.args.get('cash_flow')
     if cash_flow_query_param is not None:
         cash_flow = float(cash_flow_query_param)
     else:
         cash_flow = 0.0
-    executor = StrategyExecutor()
-    result = executor.execute(cash_flow=cash_flow)
-    message = 'Strategy executed successfully'
-    return jsonify(success=True, message=message, data=result)
+    job_service = JobService.get_instance()
+    job_id = job_service.submit_strategy_execution(cash_flow=cash_flow)
+    message = f'Strategy execution submitted. Poll /api/jobs/{job_id} for the result'
+    job = job_service.get_job(job_id)
+    if job is None:
+        # an identical submission is running in another worker process
+        if request.args.get('stream', 'false').lower() == 'true':
+            message = f'Job {job_id} runs in another worker, poll /api/jobs/{job_id}'
+            return jsonify(success=False, message=message, data=job_service.get_job_snapshot(job_id)), 409
+        return jsonify(success=True, message=message, data=job_service.get_job_snapshot(job_id)), 202
+    # with stream=true the progress of the run is streamed back instead of polling /api/jobs/<id>
+    if request.args.get('stream', 'false').lower() == 'true':
+        return stream_job_events(job)
+    return jsonify(success=True, message=message, data=job.to_dict()), 202
+
+
+def get_job(job_id):
+    job_service = JobService.get_instance()
+    job = job_service.get_job(job_id)
+    if job is not None:
+        return jsonify(success=True, data=job.to_dict())
+    # the job may have been submitted to another worker process
+    snapshot = job_service.get_job_snapshot(job_id)
+    if snapshot is None:
+        return jsonify(success=False, message=f'Job {job_id} not found'), 404
+    return jsonify(success=True, data=snapshot)
+
+
+def get_job_events(job_id):
+    job_service = JobService.get_instance()
+    job = job_service.get_job(job_id)
+    if job is None:
+        if job_service.get_job_snapshot(job_id) is not None:
+            message = f'Job {job_id} runs in another worker, poll /api/jobs/{job_id} or use /api/init?stream=true'
+            return jsonify(success=False, message=message), 409
+        return jsonify(success=False, message=f'Job {job_id} not found'), 404
+    return stream_job_events(job)
+
+
+def stream_job_events(job):
+    # events are sent as NDJSON, or as server-sent events when the client accepts text/event-stream.
+    # A client that reconnects passes the seq of the last event it got (after query param or Last-Event-ID)
+    sse = request.args.get('format') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+    last_seq = request.args.get('after', request.headers.get('Last-Event-ID'))
+    try:
+        after = int(last_seq) + 1 if last_seq is not None else 0
+    except ValueError:
+        after = -1
+    if after < 0:
+        return jsonify(success=False, message=f'Invalid event id {last_seq}, expected the seq of an event'), 400
+
+    def generate():
+        next_seq = after
+        finished = False
+        while not finished:
+            events, finished = job.wait_for_events(next_seq, HEARTBEAT_INTERVAL)
+            if not events and not finished:
+                events = [{'event': 'heartbeat', 'time': time.time()}]
+            for event in events:
+                data = json.dumps(event, default=str)
+                if sse:
+                    seq = f'id: {event["seq"]}\n' if 'seq' in event else ''
+                    yield f'{seq}event: {event["event"]}\ndata: {data}\n\n'
+                else:
+                    yield data + '\n'
+                if 'seq' in event:
+                    next_seq = event['seq'] + 1
+
+    mimetype = 'text/event-stream' if sse else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={'Cache-Control': 'no-cache',
+                                                                                 'X-Accel-Buffering': 'no'})
 
 
 def get_portfolio():
@@ -43,8 +122,94 @@ def get_portfolio():
     return jsonify(success=True, data=portfolio.to_dict(last_close_prices))
 
 
+def backtest():
+    # start_date is required, end_date defaults to today and initial_capital to 10 lakh
+    start_date_query_param = request.args.get('start_date')
+    if start_date_query_param is None:
+        return jsonify(success=False, message='start_date query param is required'), 400
+    try:
+        start_date = date.fromisoformat(start_date_query_param)
+        end_date = date.fromisoformat(request.args.get('end_date', date.today().isoformat()))
+        initial_capital = float(request.args.get('initial_capital', 1000000))
+        if end_date < start_date:
+            raise ValueError(f'end_date {end_date} is before start_date {start_date}')
+        result = BacktestService().run(start_date, end_date, initial_capital)
+    except ValueError as e:
+        # malformed dates or amounts, or a date range without trading dates
+        return jsonify(success=False, message=str(e)), 400
+    message = 'Backtest executed successfully'
+    return jsonify(success=True, message=message, data=result.to_dict())
+
+
+def get_cache_stats():
+    # size and hit, miss and eviction counters of the in-memory caches of this worker
+    data = {'candles': CacheService.get_instance().get_stats(),
+            'company_info': NSEClient.get_instance().cache.get_stats()}
+    return jsonify(success=True, data=data)
+
+
+def get_metrics():
+    # stage timings, upstream calls, rate limiters and caches of this worker in the Prometheus text format
+    return Response(MetricsRegistry.get_instance().render(), mimetype='text/plain; version=0.0.4')
+
+
+def start_profile():
+    # a request asks to be profiled with the X-Profile header or the profile query param (true for the stacks and
+    # the allocations, cpu for the stacks only), honoured only when profiling.enabled is set
+    profiler_service = ProfilerService.get_instance()
+    mode = request.headers.get('X-Profile', request.args.get('profile', '')).lower()
+    if profiler_service.enabled and mode in ['1', 'true', 'cpu'] and not request.path.startswith('/api/profiles'):
+        g.profile = profiler_service.start(request.method, request.path, trace_memory=mode != 'cpu')
+
+
+def stop_profile(response):
+    # a streamed response is profiled until it is fully sent
+    profile = g.pop('profile', None)
+    if profile is not None:
+        response.headers['X-Profile-Id'] = profile.id
+        response.call_on_close(lambda: profile.stop(response.status_code))
+    return response
+
+
+def abandon_profile(error=None):
+    # the response was never sent (e.g. the request failed before after_request)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+
+
+def get_profiles():
+    return jsonify(success=True, data=ProfilerService.get_instance().get_profiles())
+
+
+def get_profile(profile_id):
+    profile = ProfilerService.get_instance().get_profile(profile_id)
+    if profile is None:
+        return jsonify(success=False, message=f'Profile {profile_id} not found'), 404
+    return jsonify(success=True, data=profile)
+
+
+def get_profile_stacks(profile_id):
+    # collapsed stacks, the input of flamegraph.pl and speedscope
+    collapsed_stacks = ProfilerService.get_instance().get_collapsed_stacks(profile_id)
+    if collapsed_stacks is None:
+        return jsonify(success=False, message=f'Profile {profile_id} not found'), 404
+    return Response(collapsed_stacks, mimetype='text/plain')
+
+
 def create_webhook_routes(app):
+    app.before_request(start_profile)
+    app.after_request(stop_profile)
+    app.teardown_request(abandon_profile)
     app.route('/api/test', methods=['GET'])(get_endpoint)
     app.route('/api/init', methods=['GET'])(init)
+    app.route('/api/jobs/<job_id>', methods=['GET'])(get_job)
+    app.route('/api/jobs/<job_id>/events', methods=['GET'])(get_job_events)
     app.route('/api/webhook', methods=['POST'])(post_endpoint)
     app.route('/api/portfolio', methods=['GET'])(get_portfolio)
+    app.route('/api/backtest', methods=['GET'])(backtest)
+    app.route('/api/cache/stats', methods=['GET'])(get_cache_stats)
+    app.route('/api/metrics', methods=['GET'])(get_metrics)
+    app.route('/api/profiles', methods=['GET'])(get_profiles)
+    app.route('/api/profiles/<profile_id>', methods=['GET'])(get_profile)
+    app.route('/api/profiles/<profile_id>/stacks', methods=['GET'])(get_profile_stacks)
@@ -0,0 +1,18 @@
+"""
+gunicorn settings of the production serving mode. The worker processes share the candle store on disk, so adding
+workers adds request throughput without fetching the candles once per worker
+"""
+
+from services.config_service import ConfigService
+
+config_service = ConfigService.get_instance()
+
+bind = f"{config_service.get_or_default('app.host', default='localhost')}:" \
+       f"{config_service.get_or_default('app.port', default=7999)}"
+workers = int(config_service.get_or_default('app.workers', default=4))
+# threads let a worker serve other requests while one waits on zerodha or streams job events
+worker_class = 'gthread'
+threads = int(config_service.get_or_default('app.threads', default=4))
+timeout = 120
+# the app is not preloaded: every worker builds its own singletons (thread pools, locks) after the fork
+preload_app = False
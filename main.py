@@ -3,6 +3,22 @@ from flask_cors import CORS
 
 from services.config_service import ConfigService
 from controller.webhook_controller import create_webhook_routes
+from services.metrics import MetricsRegistry
+
+
+def create_app() -> Flask:
+    # used by the development server below and by the production server (see wsgi.py)
+    app = Flask(__name__)
+    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    create_webhook_routes(app)
+    # a scrape reaches one worker process, the workers share their metrics so that it returns all of them
+    config_service = ConfigService.get_instance()
+    metrics_dir = config_service.get_or_default('metrics.dir', default='data/metrics')
+    if metrics_dir:
+        MetricsRegistry.get_instance().share(
+            metrics_dir, flush_interval=float(config_service.get_or_default('metrics.flush_seconds', default=5)))
+    return app
+
 
 if __name__ == '__main__':
     config_service = ConfigService.get_instance()
@@ -10,7 +26,5 @@ if __name__ == '__main__':
     host = config_service.get('app.host')
     port = config_service.get('app.port')
 
-    app = Flask(__name__)
-    cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
-    create_webhook_routes(app)
+    app = create_app()
     app.run(debug=debug, port=port, host=host)
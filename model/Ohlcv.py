@@ -1,88 +1,100 @@
 from datetime import datetime
 
+import numpy as np
 from pandas import DataFrame
-from typing import List
 
 import constants.column_names as column_names
 
+EPOCH = datetime(1970, 1, 1)
 
-class Ohlcv:
-    def __init__(self, open_price, high, low, close, volume, date_time: datetime) -> None:
-        super().__init__()
-        self.open = open_price
-        self.high = high
-        self.low = low
-        self.close = close
-        self.volume = volume
-        self.date_time = date_time
-
-    def __str__(self) -> str:
-        return f"Open: {self.open}, High: {self.high}, Low: {self.low}, Close: {self.close}, Volume: {self.volume}, Date: {self.date_time}"
+PRICE_COLUMNS = [column_names.open, column_names.high, column_names.low, column_names.close, column_names.volume]
 
 
 class OhlcData:
-    def __init__(self, ticker: str, data: List[Ohlcv]) -> None:
+    """
+    Candles of a ticker stored as contiguous numpy columns. Dates are days since epoch (int64) sorted in ascending
+    order and prices are a (5, n) float64 matrix with open, high, low, close and volume rows.
+    """
+
+    def __init__(self, ticker: str, dates: np.ndarray, values: np.ndarray) -> None:
         self.ticker = ticker
-        self.data = data
+        self.dates = dates
+        self.values = values
+        # the columns are shared with the cache and the data frames built on top of them, so they must not change
+        self.dates.setflags(write=False)
+        self.values.setflags(write=False)
 
     @classmethod
     def default_obj(cls, ticker):
-        return cls(ticker, [])
+        return cls(ticker, np.empty(0, dtype=np.int64), np.empty((5, 0), dtype=np.float64))
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.values[0]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.values[1]
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.values[2]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.values[3]
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.values[4]
+
+    def __len__(self) -> int:
+        return len(self.dates)
 
     def to_df(self) -> DataFrame:
-        df = DataFrame()
-        df[column_names.date] = [x.date_time.date() for x in self.data]
-        df[column_names.open] = [x.open for x in self.data]
-        df[column_names.high] = [x.high for x in self.data]
-        df[column_names.low] = [x.low for x in self.data]
-        df[column_names.close] = [x.close for x in self.data]
-        df[column_names.volume] = [x.volume for x in self.data]
-        df.sort_values(by=column_names.date, inplace=True, ascending=True)  # Sort by date desc
-        df.reset_index(inplace=True, drop=True)  # Reset index
+        # the price columns of the data frame are a view on self.values, nothing is copied
+        df = DataFrame(self.values.T, columns=PRICE_COLUMNS, copy=False)
+        df.insert(0, column_names.date, self.dates.astype('datetime64[D]'))
         return df
 
     @classmethod
     def from_json(cls, ticker: str, candles_data):
-        # List to store OHLCV objects
-        ohlcvs = []
-
-        # Iterate through the "candles" array and convert each row to OHLCV objects
-        date_format = "%Y-%m-%dT%H:%M:%S%z"
-        for candle in candles_data:
-            timestamp = datetime.strptime(candle[0], date_format)
-            open_price = candle[1]
-            high = candle[2]
-            low = candle[3]
-            close = candle[4]
-            volume = candle[5]
-
-            ohlcv_obj = Ohlcv(open_price, high, low, close, volume, timestamp)
-            ohlcvs.append(ohlcv_obj)
-        return OhlcData(ticker, ohlcvs)
+        # candles are [timestamp, open, high, low, close, volume(, oi)]. Timestamps look like
+        # 2023-10-04T00:00:00+0530, the first 10 characters are the (local) trading date
+        if len(candles_data) == 0:
+            return cls.default_obj(ticker)
+        candles = np.array(candles_data, dtype=object)
+        dates = candles[:, 0].astype('U10').astype('datetime64[D]').astype(np.int64)
+        values = candles[:, 1:6].astype(np.float64).T
+        return cls.from_columns(ticker, dates, values)
 
     @classmethod
     def from_kite_trade_api_response(cls, ticker: str, response: list[dict[str, datetime]]):
-        ohlcvs = []
-        for line in response:
-            open = line[column_names.open]
-            high = line[column_names.high]
-            low = line[column_names.low]
-            close = line[column_names.close]
-            volume = line[column_names.volume]
-            timestamp = line[column_names.date]
-            ohlcv_obj = Ohlcv(open, high, low, close, volume, timestamp)
-            ohlcvs.append(ohlcv_obj)
-        return OhlcData(ticker, ohlcvs)
+        if len(response) == 0:
+            return cls.default_obj(ticker)
+        dates = np.array([line[column_names.date].date() for line in response],
+                         dtype='datetime64[D]').astype(np.int64)
+        values = np.array([[line[column] for column in PRICE_COLUMNS] for line in response], dtype=np.float64).T
+        return cls.from_columns(ticker, dates, values)
+
+    @classmethod
+    def from_columns(cls, ticker: str, dates: np.ndarray, values: np.ndarray):
+        # sort once when the data is built, so that readers can rely on the order
+        if len(dates) > 1 and np.any(dates[1:] < dates[:-1]):
+            order = np.argsort(dates, kind='stable')
+            dates, values = dates[order], values[:, order]
+        return cls(ticker, np.ascontiguousarray(dates), np.ascontiguousarray(values))
+
+    def to_matrix(self) -> np.ndarray:
+        # columnar representation. Rows are date (days since epoch), open, high, low, close and volume
+        return np.vstack([self.dates.astype(np.float64)[np.newaxis, :], self.values])
+
+    @classmethod
+    def from_matrix(cls, ticker: str, matrix: np.ndarray):
+        # the price rows are a view on the matrix (e.g. a memory mapped file), only the dates are converted
+        return cls(ticker, matrix[0].astype(np.int64), matrix[1:6])
 
     def get_last_price(self):
-        # data might not be sorted. Iterate through the data and get the last price
-        last_price = None
-        date = None
-        for ohlcv in self.data:
-            if date is None:
-                date = ohlcv.date_time.date()
-                last_price = ohlcv.close
-            elif ohlcv.date_time.date() > date:
-                last_price = ohlcv.close
-                date = ohlcv.date_time.date()
-        return last_price
+        if len(self.dates) == 0:
+            return None
+        return float(self.values[3, -1])
@@ -0,0 +1,99 @@
+"""
+BacktestData class
+"""
+
+import json
+import os
+
+import numpy as np
+
+from model.Ohlcv import OhlcData
+from model.panel import PricePanel
+
+FIELDS = ['high', 'low', 'close']
+
+
+class BacktestData:
+    """
+    This class holds the history a backtest replays: (dates x tickers) high, low and close matrices of the universe
+    and the closes of the index used by the market regime filter, on the same trading dates. The matrices can be
+    saved as .npy files and loaded back memory-mapped, so several processes can share one read-only copy
+    """
+
+    def __init__(self,
+                 dates: np.ndarray,
+                 tickers: list[str],
+                 high: np.ndarray,
+                 low: np.ndarray,
+                 close: np.ndarray,
+                 index_name: str,
+                 index_close: np.ndarray) -> None:
+        """
+        This method initializes BacktestData object
+        :param dates: sorted int64 days since epoch
+        :param tickers: column labels
+        :param high: (dates x tickers) matrix, NaN where missing
+        :param low: (dates x tickers) matrix, NaN where missing
+        :param close: (dates x tickers) matrix, NaN where missing
+        :param index_name: name of the index
+        :param index_close: closes of the index on every date, NaN where missing
+        """
+        super().__init__()
+        self.dates = dates
+        self.tickers = tickers
+        self.high = high
+        self.low = low
+        self.close = close
+        self.index_name = index_name
+        self.index_close = index_close
+
+    @classmethod
+    def from_ohlc_data(cls, ohlc_dataset: list[OhlcData], index_data: OhlcData) -> 'BacktestData':
+        """
+        This method aligns the candles of the universe and of the index on the trading dates of the universe
+        :param ohlc_dataset: candles of every ticker of the universe
+        :param index_data: candles of the index
+        :return: BacktestData
+        """
+        panel = PricePanel.from_ohlc_data(ohlc_dataset, fields=FIELDS)
+        index_close = np.full(len(panel.dates), np.nan)
+        on_trading_date = np.isin(index_data.dates, panel.dates)
+        rows = np.searchsorted(panel.dates, index_data.dates[on_trading_date])
+        index_close[rows] = index_data.close[on_trading_date]
+        return cls(panel.dates, panel.tickers, panel.get('high'), panel.get('low'), panel.close,
+                   index_data.ticker, index_close)
+
+    def save(self, directory: str) -> None:
+        """
+        This method saves the matrices as .npy files and the labels as json
+        :param directory: directory to write to
+        :return: None
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ['dates', 'high', 'low', 'close', 'index_close']:
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as json_file:
+            json.dump({'tickers': self.tickers, 'index_name': self.index_name}, json_file)
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str = 'r') -> 'BacktestData':
+        """
+        This method loads data saved by save()
+        :param directory: directory to read from
+        :param mmap_mode: numpy memory map mode, None reads the matrices into memory
+        :return: BacktestData
+        """
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as json_file:
+            meta = json.load(json_file)
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+                  for name in ['dates', 'high', 'low', 'close', 'index_close']}
+        return cls(arrays['dates'], meta['tickers'], arrays['high'], arrays['low'], arrays['close'],
+                   meta['index_name'], arrays['index_close'])
+
+    def get_row(self, epoch_day: int) -> int:
+        """
+        This method returns the row of the last trading date on or before the day
+        :param epoch_day: days since epoch
+        :return: row number, -1 if the day is before the first date
+        """
+        return int(np.searchsorted(self.dates, epoch_day, side='right')) - 1
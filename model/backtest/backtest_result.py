@@ -0,0 +1,106 @@
+"""
+BacktestResult class
+"""
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from model.utils import rounding_function
+
+
+class BacktestResult:
+    """
+    This class holds the daily equity curve of a backtest and the value traded at every rebalance, and computes
+    the return, drawdown and turnover metrics from them
+    """
+
+    def __init__(self,
+                 dates: np.ndarray,
+                 equity: np.ndarray,
+                 rebalance_dates: np.ndarray,
+                 traded_values: np.ndarray,
+                 parameters: dict) -> None:
+        """
+        This method initializes BacktestResult object
+        :param dates: trading dates of the backtest (days since epoch)
+        :param equity: account value at the close of every date
+        :param rebalance_dates: dates on which the portfolio was rebalanced (days since epoch)
+        :param traded_values: value bought plus value sold at every rebalance
+        :param parameters: parameters of the backtest
+        """
+        super().__init__()
+        self.dates = dates
+        self.equity = equity
+        self.rebalance_dates = rebalance_dates
+        self.traded_values = traded_values
+        self.parameters = parameters
+
+    @property
+    def years(self) -> float:
+        if len(self.dates) < 2:
+            return 0.0
+        return float(self.dates[-1] - self.dates[0]) / 365.25
+
+    @property
+    def total_return(self) -> float:
+        """Return over the whole backtest in percent"""
+        if len(self.equity) == 0:
+            return 0.0
+        return float(self.equity[-1] / self.equity[0] - 1) * 100
+
+    @property
+    def cagr(self) -> float:
+        """Compound annual growth rate in percent"""
+        if self.years == 0 or len(self.equity) == 0 or self.equity[-1] <= 0:
+            return 0.0
+        return float((self.equity[-1] / self.equity[0]) ** (1 / self.years) - 1) * 100
+
+    @property
+    def drawdown(self) -> np.ndarray:
+        """Drawdown from the running peak of the equity curve on every date, in percent (<= 0)"""
+        if len(self.equity) == 0:
+            return np.empty(0)
+        return (self.equity / np.maximum.accumulate(self.equity) - 1) * 100
+
+    @property
+    def max_drawdown(self) -> float:
+        drawdown = self.drawdown
+        return float(drawdown.min()) if len(drawdown) else 0.0
+
+    @property
+    def annual_turnover(self) -> float:
+        """Value traded per year as a percentage of the average account value"""
+        if self.years == 0 or len(self.equity) == 0:
+            return 0.0
+        return float(self.traded_values.sum() / self.equity.mean() / self.years) * 100
+
+    def get_metrics(self) -> dict:
+        return {
+            'total_return': self.total_return,
+            'cagr': self.cagr,
+            'max_drawdown': self.max_drawdown,
+            'annual_turnover': self.annual_turnover,
+            'final_value': float(self.equity[-1]) if len(self.equity) else 0.0,
+            'num_rebalances': len(self.rebalance_dates)
+        }
+
+    def to_df(self) -> DataFrame:
+        """
+        This method returns the equity curve as a data frame with date, equity and drawdown columns
+        """
+        return pd.DataFrame({'date': self.dates.astype('datetime64[D]'),
+                             'equity': self.equity,
+                             'drawdown': self.drawdown})
+
+    def to_dict(self) -> dict:
+        metrics = {name: rounding_function(value) for name, value in self.get_metrics().items()}
+        return {
+            'parameters': self.parameters,
+            'metrics': metrics,
+            'equity_curve': [{'date': str(day), 'equity': rounding_function(float(value))}
+                             for day, value in zip(self.dates.astype('datetime64[D]'), self.equity)]
+        }
+
+    def save(self, file_name: str) -> None:
+        self.to_df().to_csv(file_name, index=False)
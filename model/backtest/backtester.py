@@ -0,0 +1,418 @@
+"""
+This module replays MomentumStrategy over a date range from precomputed indicator matrices
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+
+from model import indicators
+from model.Ohlcv import OhlcData
+from model.backtest.backtest_data import BacktestData
+from model.backtest.backtest_result import BacktestResult
+from model.bulk_fetch_result import BulkFetchResult
+from model.index_membership import IndexMembership
+from model.market_regime_filter import LongTermMovingAverageMarketRegimeFilter
+from model.momentum_strategy import MomentumStrategy
+from model.portfolio.portfolio import Portfolio
+from model.position_sizing.position_sizing_strategies import EqualRiskPositionSizingStrategy
+from model.ranking.ranking_result import RankingTable
+from model.ranking.ranking_strategies import RankingStrategy
+from model.ranking.rolling_regression import RollingExponentialRegression
+from model.rebalancing.portfolio_rebalancing import PortfolioRebalancingStrategyStrategyImpl
+from model.scheduling.frequency import DayOfWeek, Frequency
+from model.scheduling.schedule import Schedule
+from model.scheduling.trading_calendar import TradingCalendar
+from services.feature_store import FeatureStore
+
+EPOCH = date(1970, 1, 1)
+
+
+class BacktestParameters:
+    """
+    This class holds the knobs of the strategy, with the same defaults as StrategyExecutor
+    """
+
+    def __init__(self,
+                 num_days: int = 90,
+                 top_n_percent: int = 20,
+                 risk_factor: float = 0.003,
+                 ticker_ema_span: int = 100,
+                 atr_period: int = 20,
+                 index_ema_span: int = 200,
+                 threshold: float = 0.0025,
+                 max_gap_percent: float = 19.1,
+                 num_historical_lookup_days: int = 365,
+                 default_historical_lookup_days: int = 365,
+                 trade_day: DayOfWeek = DayOfWeek.WEDNESDAY) -> None:
+        super().__init__()
+        self.num_days = num_days
+        self.top_n_percent = top_n_percent
+        self.risk_factor = risk_factor
+        self.ticker_ema_span = ticker_ema_span
+        self.atr_period = atr_period
+        self.index_ema_span = index_ema_span
+        self.threshold = threshold
+        self.max_gap_percent = max_gap_percent
+        self.num_historical_lookup_days = num_historical_lookup_days
+        self.default_historical_lookup_days = default_historical_lookup_days
+        self.trade_day = trade_day
+
+    def to_dict(self) -> dict:
+        parameters = dict(vars(self))
+        parameters['trade_day'] = self.trade_day.name
+        return parameters
+
+    def replace(self, **changes) -> 'BacktestParameters':
+        """
+        This method returns a copy of the parameters with some of them changed
+        """
+        parameters = dict(vars(self))
+        parameters.update(changes)
+        return BacktestParameters(**parameters)
+
+
+class BacktestFeatureStore(FeatureStore):
+    """
+    This feature store serves the stages of the strategy from matrices computed once over the whole history of a
+    BacktestData. set_as_of() moves the store to a date and every read is a slice of the matrices at that row.
+
+    Gaps in the candles of a ticker are forward filled and the moving averages and scores run over the whole
+    history instead of restarting at every lookup window, so values can differ slightly from a live run.
+    """
+
+    def __init__(self, data: BacktestData, membership: IndexMembership = None) -> None:
+        """
+        This method initializes BacktestFeatureStore object
+        :param data: history of the universe and of the index
+        :param membership: point-in-time membership of the index, None if every ticker is always eligible
+        """
+        as_of = EPOCH + timedelta(int(data.dates[-1])) if len(data.dates) else None
+        super().__init__(as_of=as_of)
+        self.data = data
+        self.membership = membership
+        self.columns: dict[str, int] = {ticker: column for column, ticker in enumerate(data.tickers)}
+        self.row = len(data.dates) - 1
+
+    def set_as_of(self, as_of: date) -> None:
+        self.as_of = as_of
+        self.row = self.data.get_row((as_of - EPOCH).days)
+
+    def get_columns(self, tickers: list[str]) -> tuple[list[str], np.ndarray]:
+        """
+        This method returns the tickers that are in the data and their columns
+        :param tickers: ticker symbols
+        :return: tuple of known tickers and their columns
+        """
+        known = [ticker for ticker in tickers if ticker in self.columns]
+        return known, np.array([self.columns[ticker] for ticker in known], dtype=np.int64)
+
+    @property
+    def close_filled(self) -> np.ndarray:
+        return self.get_feature(('close_filled',), lambda: indicators.forward_fill(self.data.close))
+
+    @property
+    def candle_count(self) -> np.ndarray:
+        """Number of candles of every ticker up to every date"""
+        return self.get_feature(('candle_count',),
+                                lambda: np.cumsum(~np.isnan(self.data.close), axis=0, dtype=np.int32))
+
+    @property
+    def membership_mask(self) -> Optional[np.ndarray]:
+        """Whether every ticker was a constituent of the index on every date, None without a membership"""
+        if self.membership is None:
+            return None
+        return self.get_feature(('membership_mask',), lambda: self.membership.mask(self.data.dates, self.data.tickers))
+
+    def score_matrix(self, num_days: int) -> np.ndarray:
+        return self.get_feature(('score_matrix', num_days),
+                                lambda: RollingExponentialRegression(num_days=num_days).fit(self.close_filled))
+
+    def trend_matrix(self, span: int) -> np.ndarray:
+        def build() -> np.ndarray:
+            close = self.close_filled
+            with np.errstate(invalid='ignore'):
+                return np.nan_to_num(np.sign(close - indicators.ema(close, span))).astype(np.int8)
+
+        return self.get_feature(('trend_matrix', span), build)
+
+    def max_gap_matrix(self, num_days: int) -> np.ndarray:
+        return self.get_feature(('max_gap_matrix', num_days),
+                                lambda: indicators.rolling_max(indicators.percent_change(self.close_filled), num_days))
+
+    def atr_matrix(self, period: int) -> np.ndarray:
+        def build() -> np.ndarray:
+            high = indicators.forward_fill(self.data.high)
+            low = indicators.forward_fill(self.data.low)
+            return indicators.atr(high, low, self.close_filled, period)
+
+        return self.get_feature(('atr_matrix', period), build)
+
+    def get_atr_and_close(self, tickers: list[str], lookup_days: int,
+                          period: int) -> tuple[list[str], np.ndarray, np.ndarray]:
+        known, columns = self.get_columns(tickers)
+        last_close = self.close_filled[self.row, columns]
+        traded = ~np.isnan(last_close)
+        return ([ticker for ticker, is_traded in zip(known, traded) if is_traded],
+                self.atr_matrix(period)[self.row, columns][traded], last_close[traded])
+
+    def get_series(self, ticker: str) -> tuple[np.ndarray, np.ndarray]:
+        # rows and values of the candles of a ticker (or of the index) over the whole history
+        def build() -> tuple[np.ndarray, np.ndarray]:
+            if ticker == self.data.index_name:
+                values = np.asarray(self.data.index_close)
+            elif ticker in self.columns:
+                values = np.asarray(self.data.close[:, self.columns[ticker]])
+            else:
+                raise ValueError(f'{ticker} is not part of the backtest data')
+            rows = np.flatnonzero(~np.isnan(values))
+            return rows, values[rows]
+
+        return self.get_feature(('series', ticker), build)
+
+    def get_slice(self, ticker: str, lookup_days: int) -> slice:
+        rows, _ = self.get_series(ticker)
+        first_row = self.data.get_row((self.as_of - EPOCH).days - lookup_days - 1) + 1
+        return slice(int(np.searchsorted(rows, first_row)), int(np.searchsorted(rows, self.row, side='right')))
+
+    def close(self, ticker: str, lookup_days: int) -> np.ndarray:
+        return self.get_series(ticker)[1][self.get_slice(ticker, lookup_days)]
+
+    def ema(self, ticker: str, lookup_days: int, span: int) -> np.ndarray:
+        ema = self.get_feature(('ema_series', ticker, span), lambda: indicators.ema(self.get_series(ticker)[1], span))
+        return ema[self.get_slice(ticker, lookup_days)]
+
+    def percent_change(self, ticker: str, lookup_days: int) -> np.ndarray:
+        return indicators.percent_change(self.close(ticker, lookup_days))
+
+    def atr(self, ticker: str, lookup_days: int, period: int) -> np.ndarray:
+        rows, _ = self.get_series(ticker)
+        return self.atr_matrix(period)[rows, self.columns[ticker]][self.get_slice(ticker, lookup_days)]
+
+    def get_data(self, ticker: str, lookup_days: int) -> OhlcData:
+        """
+        This method returns the candles of the ticker (or of the index) for the lookup window from the matrices.
+        BacktestData keeps no open and volume, they are NaN, and only the closes of the index are kept
+        :param ticker: ticker symbol
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :return: OhlcData
+        """
+        rows, close = self.get_series(ticker)
+        window = self.get_slice(ticker, lookup_days)
+        rows, close = rows[window], close[window]
+        missing = np.full(len(rows), np.nan)
+        if ticker in self.columns:
+            high = self.data.high[rows, self.columns[ticker]]
+            low = self.data.low[rows, self.columns[ticker]]
+        else:
+            high, low = missing, missing
+        values = np.vstack([missing, high, low, close, missing])
+        return OhlcData(ticker, self.data.dates[rows].astype(np.int64), values)
+
+    def get_data_many(self, tickers: list[str], lookup_days: int) -> BulkFetchResult:
+        fetch_result = BulkFetchResult(tickers)
+        for ticker in tickers:
+            try:
+                fetch_result.add_result(ticker, self.get_data(ticker, lookup_days))
+            except ValueError as e:
+                fetch_result.add_failure(ticker, str(e))
+        return fetch_result
+
+
+class BacktestRankingStrategy(RankingStrategy):
+    """
+    This ranking strategy applies the rules of VolatilityAdjustedReturnsRankingStrategy (exponential regression
+    score, trend over the moving average, max gap and minimum history) to the row of precomputed matrices at the
+    as-of date of the feature store
+    """
+
+    def __init__(self,
+                 feature_store: BacktestFeatureStore,
+                 num_days: int = 90,
+                 max_gap_percent: float = 20,
+                 ticker_ema_span: int = 100) -> None:
+        super().__init__(feature_store)
+        self.num_days = num_days
+        self.max_gap_percent = max_gap_percent
+        self.ticker_ema_span = ticker_ema_span
+        self.universe_columns: dict[tuple, tuple[list[str], np.ndarray]] = {}
+
+    def rank(self, stock_universe: list[str]) -> RankingTable:
+        store = self.feature_store
+        key = tuple(stock_universe)
+        if key not in self.universe_columns:
+            self.universe_columns[key] = store.get_columns(stock_universe)
+        tickers, columns = self.universe_columns[key]
+        row = store.row
+
+        eligible = store.candle_count[row, columns] >= self.ticker_ema_span
+        # only the constituents of the index on the date can be ranked
+        membership_mask = store.membership_mask
+        if membership_mask is not None:
+            eligible &= membership_mask[row, columns]
+        columns = columns[eligible]
+        score = store.score_matrix(self.num_days)[row, columns]
+        trend = store.trend_matrix(self.ticker_ema_span)[row, columns]
+        max_gap_up = store.max_gap_matrix(self.num_days)[row, columns]
+        with np.errstate(invalid='ignore'):
+            included = (trend == 1) & (max_gap_up < self.max_gap_percent) & ~np.isnan(score)
+        # best score first, tickers without a score last
+        order = np.argsort(-np.where(np.isnan(score), -np.inf, score), kind='stable')
+        symbols = np.asarray(tickers, dtype=object)[eligible][order].tolist()
+        return RankingTable.from_columns(symbols, score[order], trend[order], included[order],
+                                         store.close_filled[row, columns][order])
+
+
+class Backtester:
+    """
+    This class replays MomentumStrategy, with the equal risk position sizing, the long term moving average market
+    regime filter and the weekly / bi-weekly schedules of StrategyExecutor, on every trade day of a date range
+    """
+
+    def __init__(self, data: BacktestData, parameters: BacktestParameters = None,
+                 feature_store: BacktestFeatureStore = None, trading_calendar: TradingCalendar = None,
+                 membership: IndexMembership = None) -> None:
+        """
+        This method initializes Backtester object
+        :param data: history of the universe and of the index
+        :param parameters: parameters of the strategy
+        :param feature_store: store of precomputed matrices, can be shared by backtests of the same data
+        :param trading_calendar: calendar the schedules are expanded with
+        :param membership: point-in-time membership of the index, used when the feature store is built here
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.data = data
+        self.parameters = parameters or BacktestParameters()
+        self.feature_store = feature_store or BacktestFeatureStore(data, membership)
+        self.trading_calendar = trading_calendar or TradingCalendar.get_instance()
+
+    def build_strategy(self) -> MomentumStrategy:
+        parameters = self.parameters
+        inception_date = date(2000, 1, 1)
+        end_date = date(2100, 1, 1)
+        ranking_strategy = BacktestRankingStrategy(feature_store=self.feature_store,
+                                                   num_days=parameters.num_days,
+                                                   max_gap_percent=parameters.max_gap_percent,
+                                                   ticker_ema_span=parameters.ticker_ema_span)
+        position_size_strategy = EqualRiskPositionSizingStrategy(
+            default_historical_lookup_days=parameters.num_historical_lookup_days,
+            atr_period=parameters.atr_period,
+            risk_factor=parameters.risk_factor,
+            feature_store=self.feature_store)
+        market_regime_filter = LongTermMovingAverageMarketRegimeFilter(
+            index=self.data.index_name,
+            index_ema_span=parameters.index_ema_span,
+            default_historical_lookup_days=parameters.default_historical_lookup_days,
+            feature_store=self.feature_store)
+        position_rebalance_schedule = Schedule(start_date=inception_date, end_date=end_date,
+                                               frequency=Frequency.BI_WEEKLY, day_of_week=parameters.trade_day)
+        portfolio_rebalance_schedule = Schedule(start_date=inception_date, end_date=end_date,
+                                                frequency=Frequency.WEEKLY, day_of_week=parameters.trade_day)
+        portfolio_rebalancing_strategy = PortfolioRebalancingStrategyStrategyImpl(
+            risk_factor=parameters.risk_factor,
+            top_n_percent=parameters.top_n_percent,
+            ticker_ema_span=parameters.ticker_ema_span,
+            market_regime_filter=market_regime_filter,
+            position_sizing_strategy=position_size_strategy,
+            position_rebalance_schedule=position_rebalance_schedule,
+            threshold=parameters.threshold,
+            persist_results=False,
+            trading_calendar=self.trading_calendar)
+        return MomentumStrategy(trade_day=parameters.trade_day,
+                                ranking_strategy=ranking_strategy,
+                                market_regime_filter=market_regime_filter,
+                                portfolio_rebalancing_strategy=portfolio_rebalancing_strategy,
+                                portfolio_rebalance_schedule=portfolio_rebalance_schedule,
+                                persist_results=False,
+                                trading_calendar=self.trading_calendar)
+
+    def get_trade_days(self, start_date: date, end_date: date) -> np.ndarray:
+        """
+        This method returns the trade days between two dates (inclusive), holidays rolled forward
+        :return: sorted datetime64[D] array
+        """
+        trade_day_schedule = Schedule(frequency=Frequency.WEEKLY, day_of_week=self.parameters.trade_day)
+        return self.trading_calendar.expand(trade_day_schedule, start_date, end_date)
+
+    def sell_removed_holdings(self, portfolio: Portfolio) -> int:
+        """
+        This method sells, at the close of the current date, the holdings that are no longer constituents of the
+        index, as the fund has to exit them before they drop out of the ranking
+        :param portfolio: portfolio of the backtest
+        :return: number of holdings sold
+        """
+        store = self.feature_store
+        membership_mask = store.membership_mask
+        if membership_mask is None:
+            return 0
+        removed = [holding.symbol for holding in portfolio.holdings
+                   if not membership_mask[store.row, store.columns[holding.symbol]]]
+        for symbol in removed:
+            portfolio.sell_stock(symbol, float(store.close_filled[store.row, store.columns[symbol]]))
+        return len(removed)
+
+    def run(self, start_date: date, end_date: date, initial_capital: float,
+            stock_universe: list[str] = None) -> BacktestResult:
+        """
+        This method runs the backtest
+        :param start_date: first date of the backtest
+        :param end_date: last date of the backtest
+        :param initial_capital: cash at the start of the backtest
+        :param stock_universe: tickers that can be bought, defaults to all the tickers of the data
+        :return: BacktestResult
+        """
+        data = self.data
+        store = self.feature_store
+        stock_universe = stock_universe or data.tickers
+        start_row = data.get_row((start_date - EPOCH).days - 1) + 1
+        end_row = data.get_row((end_date - EPOCH).days)
+        if end_row < start_row:
+            raise ValueError(f'No trading dates between {start_date} and {end_date}')
+
+        strategy = self.build_strategy()
+        portfolio = Portfolio(name='backtest')
+        portfolio.cash = initial_capital
+        close = store.close_filled
+        # (row, columns, quantities, cash) after every rebalance
+        snapshots = []
+        rebalance_dates = []
+        traded_values = []
+        # there is nothing to trade on after the last candle of the data
+        last_date = min(end_date, EPOCH + timedelta(int(data.dates[-1])))
+        for day in self.get_trade_days(start_date, last_date).tolist():
+            # a trade day without candles (e.g. a weekend) trades on the last close before it
+            store.set_as_of(day)
+            row = store.row
+            if row < start_row:
+                continue
+            quantities_before = {holding.symbol: holding.quantity for holding in portfolio.holdings}
+            num_removed = self.sell_removed_holdings(portfolio)
+            if strategy.execute(stock_universe, portfolio, 0.0, as_of=day) is None and num_removed == 0:
+                continue
+            quantities_after = {holding.symbol: holding.quantity for holding in portfolio.holdings}
+            traded = [symbol for symbol in quantities_before.keys() | quantities_after.keys()
+                      if quantities_before.get(symbol, 0) != quantities_after.get(symbol, 0)]
+            _, traded_columns = store.get_columns(traded)
+            traded_quantities = np.array([abs(quantities_after.get(symbol, 0) - quantities_before.get(symbol, 0))
+                                          for symbol in traded], dtype=np.float64)
+            traded_values.append(float(np.nan_to_num(close[row, traded_columns]) @ traded_quantities))
+            rebalance_dates.append(data.dates[row])
+            symbols, columns = store.get_columns(list(quantities_after.keys()))
+            quantities = np.array([quantities_after[symbol] for symbol in symbols], dtype=np.float64)
+            snapshots.append((row, columns, quantities, portfolio.cash))
+
+        # the holdings are valued at the close of every date until the next rebalance
+        equity = np.full(end_row - start_row + 1, float(initial_capital))
+        for index, (row, columns, quantities, cash) in enumerate(snapshots):
+            next_row = snapshots[index + 1][0] if index + 1 < len(snapshots) else end_row + 1
+            prices = np.nan_to_num(close[row:next_row][:, columns])
+            equity[row - start_row:next_row - start_row] = cash + prices @ quantities
+
+        return BacktestResult(dates=np.asarray(data.dates[start_row:end_row + 1]),
+                              equity=equity,
+                              rebalance_dates=np.array(rebalance_dates, dtype=np.int64),
+                              traded_values=np.array(traded_values, dtype=np.float64),
+                              parameters=self.parameters.to_dict())
@@ -0,0 +1,41 @@
+"""
+BulkFetchResult class
+"""
+
+from model.Ohlcv import OhlcData
+
+
+class BulkFetchResult:
+    """
+    This class represents the result of fetching historical data for many tickers at once. Results are kept in
+    the order of the requested tickers and failures are reported per ticker
+    """
+
+    def __init__(self, tickers: list[str]) -> None:
+        """
+        This method initializes BulkFetchResult object
+        :param tickers: tickers in the requested (universe) order
+        """
+        super().__init__()
+        self.tickers: list[str] = list(tickers)
+        self.results: dict[str, OhlcData] = {}
+        self.failures: dict[str, str] = {}
+
+    def add_result(self, ticker: str, ohlc_data: OhlcData) -> None:
+        self.results[ticker] = ohlc_data
+
+    def add_failure(self, ticker: str, reason: str) -> None:
+        self.failures[ticker] = reason
+
+    def get_data(self) -> list[OhlcData]:
+        """
+        This method returns the fetched data in the requested order, skipping tickers that failed
+        :return: list of OhlcData
+        """
+        return [self.results[ticker] for ticker in self.tickers if ticker in self.results]
+
+    def has_failures(self) -> bool:
+        return len(self.failures) > 0
+
+    def __str__(self) -> str:
+        return f'Fetched: {len(self.results)}, Failed: {len(self.failures)}'
@@ -0,0 +1,93 @@
+"""
+DateRangeSet class
+"""
+
+from datetime import date, timedelta
+
+
+class DateRangeSet:
+    """
+    This class represents a set of closed date intervals. Overlapping and adjacent intervals are merged, so the
+    intervals are always sorted and disjoint
+    """
+
+    def __init__(self, ranges: list[tuple[date, date]] = None) -> None:
+        """
+        This method initializes DateRangeSet object
+        :param ranges: list of (start_date, end_date) tuples. Both dates are inclusive
+        """
+        super().__init__()
+        self.ranges: list[tuple[date, date]] = []
+        for start_date, end_date in ranges or []:
+            self.add(start_date, end_date)
+
+    def add(self, start_date: date, end_date: date) -> None:
+        """
+        This method adds an interval to the set and merges it with overlapping or adjacent intervals
+        :param start_date: start date (inclusive)
+        :param end_date: end date (inclusive)
+        :return: None
+        """
+        if start_date > end_date:
+            return
+        merged = []
+        one_day = timedelta(days=1)
+        for range_start, range_end in self.ranges:
+            if range_end + one_day < start_date or end_date + one_day < range_start:
+                merged.append((range_start, range_end))
+            else:
+                start_date = min(start_date, range_start)
+                end_date = max(end_date, range_end)
+        merged.append((start_date, end_date))
+        merged.sort()
+        self.ranges = merged
+
+    def contains(self, start_date: date, end_date: date) -> bool:
+        """
+        This method checks if the interval is fully covered by the set
+        :param start_date: start date (inclusive)
+        :param end_date: end date (inclusive)
+        :return: True if every day of the interval is covered
+        """
+        for range_start, range_end in self.ranges:
+            if range_start <= start_date and end_date <= range_end:
+                return True
+        return False
+
+    def missing(self, start_date: date, end_date: date) -> list[tuple[date, date]]:
+        """
+        This method returns the parts of the interval that are not covered by the set
+        :param start_date: start date (inclusive)
+        :param end_date: end date (inclusive)
+        :return: sorted list of (start_date, end_date) gaps
+        """
+        gaps = []
+        one_day = timedelta(days=1)
+        cursor = start_date
+        for range_start, range_end in self.ranges:
+            if range_end < cursor:
+                continue
+            if range_start > end_date:
+                break
+            if range_start > cursor:
+                gaps.append((cursor, range_start - one_day))
+            cursor = range_end + one_day
+            if cursor > end_date:
+                return gaps
+        if cursor <= end_date:
+            gaps.append((cursor, end_date))
+        return gaps
+
+    def is_empty(self) -> bool:
+        return len(self.ranges) == 0
+
+    def to_list(self) -> list[list[str]]:
+        return [[range_start.isoformat(), range_end.isoformat()] for range_start, range_end in self.ranges]
+
+    @classmethod
+    def from_list(cls, ranges: list[list[str]]) -> 'DateRangeSet':
+        return cls([(date.fromisoformat(range_start), date.fromisoformat(range_end))
+                    for range_start, range_end in ranges])
+
+    def __str__(self) -> str:
+        return ', '.join([f'{range_start} - {range_end}' for range_start, range_end in self.ranges])
@@ -0,0 +1,136 @@
+"""
+IndexMembership class
+"""
+
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+
+EPOCH = date(1970, 1, 1)
+# end of the intervals of the current constituents
+OPEN_END = np.iinfo(np.int64).max
+
+
+class IndexMembership:
+    """
+    This class knows the constituents of an index at any point in time. Memberships are intervals (symbol, from, to)
+    stored as arrays: the column of the symbol, the first day and the day after the last day (days since epoch,
+    OPEN_END for current members). The constituents on a date and the (dates x tickers) eligibility mask of a
+    history are computed with array operations, without looping over the dates
+    """
+
+    def __init__(self, index: str, symbols: list[str], interval_symbols: np.ndarray, starts: np.ndarray,
+                 ends: np.ndarray) -> None:
+        """
+        This method initializes IndexMembership object
+        :param index: index name (e.g. NIFTY 200)
+        :param symbols: every symbol that was ever a member
+        :param interval_symbols: position in symbols of the symbol of every interval
+        :param starts: first day of every interval (days since epoch)
+        :param ends: day after the last day of every interval (days since epoch), OPEN_END if still a member
+        """
+        super().__init__()
+        self.index = index
+        self.symbols = list(symbols)
+        # intervals sorted by start, the date index of the membership
+        order = np.argsort(starts, kind='stable')
+        self.interval_symbols = np.asarray(interval_symbols, dtype=np.int64)[order]
+        self.starts = np.asarray(starts, dtype=np.int64)[order]
+        self.ends = np.asarray(ends, dtype=np.int64)[order]
+
+    @classmethod
+    def from_intervals(cls, index: str, intervals: list[tuple[str, date, Optional[date]]]) -> 'IndexMembership':
+        """
+        This method builds the membership from intervals
+        :param index: index name
+        :param intervals: (symbol, first day, last day or None if still a member), both days inclusive
+        :return: IndexMembership
+        """
+        symbols = list(dict.fromkeys(symbol for symbol, _, _ in intervals))
+        positions = {symbol: position for position, symbol in enumerate(symbols)}
+        interval_symbols = np.array([positions[symbol] for symbol, _, _ in intervals], dtype=np.int64)
+        starts = np.array([(start - EPOCH).days for _, start, _ in intervals], dtype=np.int64)
+        ends = np.array([OPEN_END if end is None else (end - EPOCH).days + 1 for _, _, end in intervals],
+                        dtype=np.int64)
+        return cls(index, symbols, interval_symbols, starts, ends)
+
+    @classmethod
+    def from_snapshots(cls, index: str, snapshots: list[tuple[date, list[str]]]) -> 'IndexMembership':
+        """
+        This method builds the membership from dated lists of constituents. A symbol is a member from the date of
+        the snapshot it appears in up to the day before the first later snapshot it is missing from
+        :param index: index name
+        :param snapshots: (date, constituents) in any order
+        :return: IndexMembership
+        """
+        intervals = []
+        # symbol -> first day of its open interval
+        open_intervals: dict[str, date] = {}
+        for day, constituents in sorted(snapshots, key=lambda snapshot: snapshot[0]):
+            members = set(constituents)
+            for symbol in [symbol for symbol in open_intervals if symbol not in members]:
+                intervals.append((symbol, open_intervals.pop(symbol), day - timedelta(days=1)))
+            for symbol in constituents:
+                open_intervals.setdefault(symbol, day)
+        intervals.extend((symbol, start, None) for symbol, start in open_intervals.items())
+        return cls.from_intervals(index, intervals)
+
+    @property
+    def first_date(self) -> Optional[date]:
+        return EPOCH + timedelta(int(self.starts[0])) if len(self.starts) else None
+
+    def constituents(self, day: date) -> list[str]:
+        """
+        This method returns the constituents of the index on a date
+        :param day: date
+        :return: list of symbols
+        """
+        epoch_day = (day - EPOCH).days
+        # intervals are sorted by start, only the ones that started by the date can contain it
+        num_started = np.searchsorted(self.starts, epoch_day, side='right')
+        active = self.ends[:num_started] > epoch_day
+        return [self.symbols[position] for position in np.unique(self.interval_symbols[:num_started][active])]
+
+    def members_between(self, start_date: date, end_date: date) -> list[str]:
+        """
+        This method returns the symbols that were members at any time between two dates (inclusive), the universe
+        of a survivorship free history run
+        """
+        start_day, end_day = (start_date - EPOCH).days, (end_date - EPOCH).days
+        overlaps = (self.starts <= end_day) & (self.ends > start_day)
+        return [self.symbols[position] for position in np.unique(self.interval_symbols[overlaps])]
+
+    def mask(self, dates: np.ndarray, tickers: list[str]) -> np.ndarray:
+        """
+        This method returns whether every ticker was a member on every date
+        :param dates: sorted dates, days since epoch (int) or datetime64[D]
+        :param tickers: ticker symbols, the columns of the mask
+        :return: (dates x tickers) boolean matrix
+        """
+        dates = np.asarray(dates)
+        if np.issubdtype(dates.dtype, np.datetime64):
+            dates = dates.astype('datetime64[D]').astype(np.int64)
+        columns = {ticker: column for column, ticker in enumerate(tickers)}
+        symbol_columns = np.array([columns.get(symbol, -1) for symbol in self.symbols], dtype=np.int64)
+        interval_columns = symbol_columns[self.interval_symbols] if len(self.interval_symbols) else \
+            np.empty(0, dtype=np.int64)
+        requested = interval_columns >= 0
+        # +1 on the first row of every interval and -1 on the row after it, the running sum counts the intervals
+        # a ticker is in on every row
+        first_rows = np.searchsorted(dates, self.starts[requested], side='left')
+        end_rows = np.searchsorted(dates, self.ends[requested], side='left')
+        counts = np.zeros((len(dates) + 1, len(tickers)), dtype=np.int32)
+        np.add.at(counts, (first_rows, interval_columns[requested]), 1)
+        np.add.at(counts, (end_rows, interval_columns[requested]), -1)
+        return np.cumsum(counts[:-1], axis=0) > 0
+
+    def save(self, file_name: str) -> None:
+        np.savez(file_name, index=np.array(self.index), symbols=np.array(self.symbols, dtype=str),
+                 interval_symbols=self.interval_symbols, starts=self.starts, ends=self.ends)
+
+    @classmethod
+    def load(cls, file_name: str) -> 'IndexMembership':
+        with np.load(file_name) as arrays:
+            return cls(str(arrays['index']), np.asarray(arrays['symbols']).tolist(), arrays['interval_symbols'],
+                       arrays['starts'], arrays['ends'])
@@ -0,0 +1,117 @@
+"""
+Vectorized indicators. Every function works on a (dates x tickers) matrix and computes the indicator for all
+the tickers at once. Missing values (NaN) are only expected at the top of a column (before the ticker started
+trading), see model.panel.right_align
+"""
+
+import numpy as np
+from scipy.signal import lfilter
+
+
+def ema(values: np.ndarray, span: int) -> np.ndarray:
+    """
+    This function calculates the exponential moving average of every column, same as
+    pandas ewm(span=span, adjust=False).mean()
+    :param values: (dates x tickers) matrix
+    :param span: span of the moving average
+    :return: (dates x tickers) matrix, NaN where the input is NaN
+    """
+    alpha = 2 / (span + 1)
+    missing = np.isnan(values)
+    # fill the leading NaNs with the first value of the column. The average stays at the first value until the
+    # column starts, which is exactly how pandas starts the average
+    first_valid = np.argmax(~missing, axis=0)
+    first_values = np.take_along_axis(values, first_valid[np.newaxis, ...], axis=0)[0]
+    filled = np.where(missing, first_values, values)
+    initial_state = (1 - alpha) * filled[:1]
+    result, _ = lfilter([alpha], [1, alpha - 1], filled, axis=0, zi=initial_state)
+    result[missing] = np.nan
+    return result
+
+
+def percent_change(values: np.ndarray) -> np.ndarray:
+    """
+    This function calculates the percent change from the previous row of every column
+    :param values: (dates x tickers) matrix
+    :return: (dates x tickers) matrix, the first row is NaN
+    """
+    result = np.full(values.shape, np.nan)
+    result[1:] = (values[1:] - values[:-1]) / values[:-1] * 100
+    return result
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    This function calculates the rolling mean of every column, same as pandas rolling(window=window).mean(). A
+    window with a NaN is NaN
+    :param values: (dates x tickers) matrix
+    :param window: size of the window
+    :return: (dates x tickers) matrix
+    """
+    missing = np.isnan(values)
+    zeros = np.zeros_like(values[:1], dtype=np.float64)
+    sums = np.concatenate([zeros, np.cumsum(np.where(missing, 0.0, values), axis=0)])
+    counts = np.concatenate([zeros, np.cumsum(missing, axis=0)])
+    result = np.full(values.shape, np.nan)
+    if values.shape[0] >= window:
+        window_missing = counts[window:] - counts[:-window]
+        result[window - 1:] = np.where(window_missing == 0, (sums[window:] - sums[:-window]) / window, np.nan)
+    return result
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """
+    This function calculates the true range of every column, the largest of high - low, |high - previous close|
+    and |low - previous close|
+    :param high: (dates x tickers) matrix
+    :param low: (dates x tickers) matrix
+    :param close: (dates x tickers) matrix
+    :return: (dates x tickers) matrix
+    """
+    previous_close = np.full(close.shape, np.nan)
+    previous_close[1:] = close[:-1]
+    return np.fmax(np.fmax(high - low, np.abs(high - previous_close)), np.abs(low - previous_close))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int) -> np.ndarray:
+    """
+    This function calculates the average true range of every column
+    :param high: (dates x tickers) matrix
+    :param low: (dates x tickers) matrix
+    :param close: (dates x tickers) matrix
+    :param period: number of days to average
+    :return: (dates x tickers) matrix
+    """
+    return rolling_mean(true_range(high, low, close), period)
+
+
+def rolling_max(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    This function calculates the rolling maximum of every column ignoring NaNs, like np.nanmax over the last
+    window rows. The maximum of windows of doubling size is built with log2(window) passes over the matrix
+    :param values: (dates x tickers) matrix
+    :param window: size of the window
+    :return: (dates x tickers) matrix, NaN for the first window - 1 rows and windows without a value
+    """
+    maximum = values.astype(np.float64, copy=True)
+    size = 1
+    while size * 2 <= window:
+        # maximum[t] becomes the maximum of the rows t - 2 * size + 1 .. t
+        maximum[size:] = np.fmax(maximum[size:], maximum[:-size])
+        size *= 2
+    result = np.full(values.shape, np.nan)
+    if values.shape[0] >= window:
+        # two overlapping windows of the largest size cover the whole window
+        result[window - 1:] = np.fmax(maximum[window - 1:], maximum[size - 1:values.shape[0] - window + size])
+    return result
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """
+    This function replaces every NaN with the last value above it in the same column
+    :param values: (dates x tickers) matrix
+    :return: (dates x tickers) matrix, NaN only at the top of a column
+    """
+    rows = np.arange(values.shape[0]).reshape((-1,) + (1,) * (values.ndim - 1))
+    last_valid = np.maximum.accumulate(np.where(np.isnan(values), 0, rows), axis=0)
+    return np.take_along_axis(values, last_valid, axis=0)
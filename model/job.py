@@ -0,0 +1,144 @@
+"""
+Job class
+"""
+
+import threading
+import time
+import uuid
+from enum import Enum
+from typing import Optional
+
+
+class JobState(Enum):
+    PENDING = 1
+    RUNNING = 2
+    SUCCEEDED = 3
+    FAILED = 4
+
+
+class Job:
+    """
+    This class tracks a strategy run executed in the background: its state, the progress of every stage and the
+    result (or the error) once it is finished
+    """
+
+    def __init__(self, key: tuple, parameters: dict) -> None:
+        """
+        This method initializes Job object
+        :param key: identical submissions have the same key and share the job
+        :param parameters: parameters of the run
+        """
+        super().__init__()
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.parameters = parameters
+        self.state = JobState.PENDING
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # stage -> {'state', 'elapsed', 'done', 'total'}
+        self.stages: dict[str, dict] = {}
+        self.result = None
+        self.error: Optional[str] = None
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        # events of the run in the order they happened, streamed by /api/jobs/<id>/events
+        self.events: list[dict] = []
+        self.events_changed = threading.Condition(self.lock)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.state in (JobState.SUCCEEDED, JobState.FAILED)
+
+    def start(self) -> None:
+        with self.lock:
+            self.state = JobState.RUNNING
+            self.started_at = time.time()
+            self.add_event('job_start')
+
+    def succeed(self, result) -> None:
+        with self.lock:
+            self.result = result
+            self.state = JobState.SUCCEEDED
+            self.finished_at = time.time()
+            self.add_event('job_end', state=self.state.name, result=result)
+        self.finished.set()
+
+    def fail(self, error: str) -> None:
+        with self.lock:
+            self.error = error
+            self.state = JobState.FAILED
+            self.finished_at = time.time()
+            self.add_event('job_end', state=self.state.name, error=error)
+        self.finished.set()
+
+    def start_stage(self, stage: str) -> None:
+        with self.lock:
+            self.get_stage(stage)['state'] = 'RUNNING'
+            self.add_event('stage_start', stage=stage)
+
+    def end_stage(self, stage: str, elapsed: float, error: str = None) -> None:
+        # a stage can run more than once (e.g. persist), the elapsed time adds up
+        with self.lock:
+            stage_info = self.get_stage(stage)
+            stage_info['state'] = 'FAILED' if error else 'DONE'
+            stage_info['elapsed'] += elapsed
+            self.add_event('stage_end', stage=stage, elapsed=elapsed, total_elapsed=stage_info['elapsed'],
+                           error=error)
+
+    def update_progress(self, stage: str, done: int, total: int, event: str = 'progress', **fields) -> None:
+        """
+        This method records the progress of a stage
+        :param stage: name of the stage
+        :param done: number of items processed so far
+        :param total: number of items to process
+        :param event: type of the event sent to the event stream
+        :param fields: extra fields of the event, the numeric ones are kept on the stage as well (e.g. cache_hits)
+        """
+        with self.lock:
+            stage_info = self.get_stage(stage)
+            stage_info['done'] = done
+            stage_info['total'] = total
+            stage_info.update({name: value for name, value in fields.items() if isinstance(value, int)})
+            self.add_event(event, stage=stage, done=done, total=total, **fields)
+
+    def add_ranking_rows(self, rows: list[dict]) -> None:
+        with self.lock:
+            self.add_event('ranking_rows', stage='rank', rows=rows)
+
+    def add_event(self, event: str, **fields) -> None:
+        # callers hold the lock
+        self.events.append({'seq': len(self.events), 'time': time.time(), 'event': event, **fields})
+        self.events_changed.notify_all()
+
+    def wait_for_events(self, after: int, timeout: float) -> tuple[list[dict], bool]:
+        """
+        This method waits until the job has events with a sequence number of at least after, or it is finished
+        :param after: sequence number of the first event wanted
+        :param timeout: seconds to wait
+        :return: the events (empty if the timeout passed) and whether no more events will come
+        """
+        with self.events_changed:
+            self.events_changed.wait_for(lambda: len(self.events) > after or self.is_finished, timeout)
+            events = self.events[after:]
+            return events, self.is_finished and len(self.events) <= after + len(events)
+
+    def get_stage(self, stage: str) -> dict:
+        # callers hold the lock
+        if stage not in self.stages:
+            self.stages[stage] = {'state': 'RUNNING', 'elapsed': 0.0, 'done': None, 'total': None}
+        return self.stages[stage]
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                'id': self.id,
+                'state': self.state.name,
+                'parameters': self.parameters,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'stages': {stage: dict(stage_info) for stage, stage_info in self.stages.items()},
+                'result': self.result,
+                'error': self.error
+            }
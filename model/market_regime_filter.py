@@ -1,10 +1,9 @@
 from abc import ABC, abstractmethod
 from enum import Enum
-from datetime import date, timedelta
 from typing import List
 import logging
 
-from services.ticker_historical_data import TickerDataService
+from services.feature_store import FeatureStore
 
 
 class MarketRegime(Enum):
@@ -20,9 +19,9 @@ class MarketRegimeIndicatorType(Enum):
 
 
 class MarketRegimeFilter(ABC):
-    def __init__(self, indicator_type: MarketRegimeIndicatorType):
+    def __init__(self, indicator_type: MarketRegimeIndicatorType, feature_store: FeatureStore = None):
         self.indicator_type = indicator_type
-        self.ticker_data_service = TickerDataService()
+        self.feature_store = feature_store or FeatureStore()
 
     @abstractmethod
     def is_allowed(self) -> MarketRegime:
@@ -33,8 +32,9 @@ class LongTermMovingAverageMarketRegimeFilter(MarketRegimeFilter):
     def __init__(self,
                  index='NIFTY 50',
                  index_ema_span=200,
-                 default_historical_lookup_days=365):
-        super().__init__(MarketRegimeIndicatorType.LONG_TERM)
+                 default_historical_lookup_days=365,
+                 feature_store: FeatureStore = None):
+        super().__init__(MarketRegimeIndicatorType.LONG_TERM, feature_store)
         self.index_ema_span = index_ema_span
         self.default_historical_lookup_days = default_historical_lookup_days
         self.index = index
@@ -43,33 +43,14 @@ class LongTermMovingAverageMarketRegimeFilter(MarketRegimeFilter):
             raise ValueError(message)
 
     def is_allowed(self) -> MarketRegime:
-        end_date = date.today()
-        historical_data_lookup_start_date = date.today() - timedelta(self.default_historical_lookup_days)
+        lookup_days = self.default_historical_lookup_days
+        index_close = self.feature_store.close(self.index, lookup_days)
+        index_ewm = self.feature_store.ema(self.index, lookup_days, self.index_ema_span)
 
-        index_ohlcv_data = self.ticker_data_service.get_data(self.index, historical_data_lookup_start_date, end_date)
-        index_ohlc_df = index_ohlcv_data.to_df()
-
-        close_col = 'close'
-
-        final_df = index_ohlc_df.copy()
-
-        # rename the 'close' column to index_close
-        final_df.rename(columns={close_col: 'index_close'}, inplace=True)
-
-        # calculate the exponential moving average of the index
-        final_df['index_ewm'] = final_df['index_close'].ewm(span=self.index_ema_span, adjust=False).mean()
-
-        # Determine the trend 1 means bullish, -1 means bearish
-        final_df['index_trend'] = final_df.apply(
-            lambda row: 1 if row['index_close'] > row['index_ewm'] else (
-                -1 if row['index_close'] < row['index_ewm'] else 0), axis=1)
-
-        # Get the last row
-        last_row = final_df.iloc[-1]
-        # Determine the market regime
-        if last_row['index_trend'] == 1:
+        # Determine the trend of the last day, 1 means bullish, -1 means bearish
+        if index_close[-1] > index_ewm[-1]:
             return MarketRegime.BULL
-        elif last_row['index_trend'] == -1:
+        elif index_close[-1] < index_ewm[-1]:
             return MarketRegime.BEAR
         else:
             return MarketRegime.NEUTRAL
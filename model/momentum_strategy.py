@@ -1,3 +1,4 @@
+import contextlib
 import logging
 from datetime import date
 from typing import Optional
@@ -7,8 +8,11 @@ from model.portfolio.portfolio import Portfolio
 from model.ranking.ranking_strategies import RankingStrategy
 from model.rebalancing.portfolio_rebalancing import PortfolioRebalancingStrategy
 from model.rebalancing.rebalancing_result import RebalancingResult
-from model.scheduling.frequency import DayOfWeek
+from model.scheduling.frequency import DayOfWeek, Frequency
 from model.scheduling.schedule import Schedule
+from model.scheduling.trading_calendar import TradingCalendar
+from repositories.file_lock import FileLock
+from services.execution_listener import ExecutionListener
 
 
 class MomentumStrategy:
@@ -17,7 +21,11 @@ class MomentumStrategy:
                  ranking_strategy: RankingStrategy,
                  market_regime_filter: MarketRegimeFilter,
                  portfolio_rebalancing_strategy: PortfolioRebalancingStrategy,
-                 portfolio_rebalance_schedule: Schedule
+                 portfolio_rebalance_schedule: Schedule,
+                 persist_results: bool = True,
+                 trading_calendar: TradingCalendar = None,
+                 listener: ExecutionListener = None,
+                 persist_lock: FileLock = None
                  ):
         self.logger = logging.getLogger(__name__)
         self.trade_day = trade_day
@@ -25,16 +33,25 @@ class MomentumStrategy:
         self.portfolio_rebalancing_strategy = portfolio_rebalancing_strategy
         self.ranking_strategy = ranking_strategy
         self.portfolio_rebalance_schedule = portfolio_rebalance_schedule
+        # backtests replay the strategy without writing portfolio files
+        self.persist_results = persist_results
+        # a trade day on a holiday moves to the next trading day
+        self.trading_calendar = trading_calendar or TradingCalendar.get_instance()
+        self.trade_day_schedule = Schedule(frequency=Frequency.WEEKLY, day_of_week=trade_day)
+        self.listener = listener or ExecutionListener()
+        # serializes the writes of the portfolio files by the runs of the worker processes
+        self.persist_lock = persist_lock or contextlib.nullcontext()
 
     def execute(self,
                 stock_universe: list[str],
                 current_portfolio: Portfolio,
-                cash_flow: float) -> Optional[RebalancingResult]:
+                cash_flow: float,
+                as_of: date = None) -> Optional[RebalancingResult]:
         self.logger.info("Executing Momentum strategy")
 
         # 1. We only trade on a specific day of the week
-        today = date.today()
-        if today.weekday() != self.trade_day.value:
+        today = as_of or date.today()
+        if not self.trading_calendar.is_scheduled(self.trade_day_schedule, today):
             self.logger.info("Today is not a trade day. Today is %s, skip execution", today)
             return None
 
@@ -44,17 +61,23 @@ class MomentumStrategy:
         rebalancing_result = None
 
         # 3. Rebalance portfolio if schedule matches today
-        if self.portfolio_rebalance_schedule.matches(today):
-            rebalancing_result = self.portfolio_rebalancing_strategy.rebalance_portfolio(
-                current_portfolio,
-                ranking_table,
-                cash_flow)
+        if self.trading_calendar.is_scheduled(self.portfolio_rebalance_schedule, today):
+            with self.listener.stage('rebalance'):
+                rebalancing_result = self.portfolio_rebalancing_strategy.rebalance_portfolio(
+                    current_portfolio,
+                    ranking_table,
+                    cash_flow,
+                    as_of=today)
 
-        updated_portfolio = rebalancing_result.portfolio
-        updated_portfolio.save()
+        if rebalancing_result is None:
+            self.logger.info("Portfolio rebalance is not scheduled for %s", today)
+            return None
+
+        if self.persist_results:
+            with self.listener.stage('persist'), self.persist_lock:
+                updated_portfolio = rebalancing_result.portfolio
+                updated_portfolio.save()
 
         # 4. Rebalance position every second wednesday
-        last_close_data = {}
-        for row in ranking_table.rows:
-            last_close_data[row.symbol] = row.closing_price
+        last_close_data = ranking_table.get_last_close_data()
         return rebalancing_result.to_dict(last_close_data)
@@ -0,0 +1,71 @@
+"""
+PricePanel class
+"""
+
+import numpy as np
+
+from model.Ohlcv import OhlcData
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class PricePanel:
+    """
+    This class aligns the candles of a universe of tickers into (dates x tickers) matrices. Dates are the union of
+    the trading dates of all the tickers (days since epoch) and missing candles are NaN
+    """
+
+    def __init__(self, dates: np.ndarray, tickers: list[str], matrices: dict[str, np.ndarray]) -> None:
+        """
+        This method initializes PricePanel object
+        :param dates: sorted int64 days since epoch
+        :param tickers: column labels
+        :param matrices: field name (open, high, low, close, volume) -> (dates x tickers) matrix
+        """
+        super().__init__()
+        self.dates = dates
+        self.tickers = tickers
+        self.matrices = matrices
+
+    @classmethod
+    def from_ohlc_data(cls, ohlc_dataset: list[OhlcData], fields: list[str] = None) -> 'PricePanel':
+        """
+        This method builds the panel from the candles of every ticker
+        :param ohlc_dataset: candles of every ticker
+        :param fields: fields to align, defaults to all the fields
+        :return: PricePanel
+        """
+        fields = fields or FIELDS
+        tickers = [ohlc_data.ticker for ohlc_data in ohlc_dataset]
+        if not ohlc_dataset:
+            return cls(np.empty(0, dtype=np.int64), tickers, {field: np.empty((0, 0)) for field in fields})
+        all_dates = np.concatenate([ohlc_data.dates for ohlc_data in ohlc_dataset])
+        dates = np.unique(all_dates)
+        rows = np.searchsorted(dates, all_dates)
+        columns = np.repeat(np.arange(len(ohlc_dataset)), [len(ohlc_data) for ohlc_data in ohlc_dataset])
+        matrices = {}
+        for field in fields:
+            field_index = FIELDS.index(field)
+            matrix = np.full((len(dates), len(tickers)), np.nan)
+            matrix[rows, columns] = np.concatenate([ohlc_data.values[field_index] for ohlc_data in ohlc_dataset])
+            matrices[field] = matrix
+        return cls(dates, tickers, matrices)
+
+    def get(self, field: str) -> np.ndarray:
+        return self.matrices[field]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.matrices['close']
+
+
+def right_align(matrix: np.ndarray) -> np.ndarray:
+    """
+    This function moves the NaNs of every column to the top, keeping the order of the values. Each column then
+    ends with the latest values of the ticker, so the last n rows of the matrix are the last n candles of every
+    ticker even if the ticker did not trade on some of the dates
+    :param matrix: (dates x tickers) matrix
+    :return: right aligned (dates x tickers) matrix
+    """
+    order = np.argsort(~np.isnan(matrix), axis=0, kind='stable')
+    return np.take_along_axis(matrix, order, axis=0)
@@ -1,5 +1,6 @@
 import datetime
 
+import numpy as np
 import pandas as pd
 
 from model.portfolio.holding import Holding
@@ -11,11 +12,24 @@ from model.utils import rounding_function
 class Portfolio:
     def __init__(self, name):
         self.name = name
-        self.holdings: list[Holding] = []
+        # symbol -> holding, in the order the holdings were added
+        self.holdings_by_symbol: dict[str, Holding] = {}
         self.cash = 0
 
+    @property
+    def holdings(self) -> list[Holding]:
+        # a copy, so holdings can be sold while iterating over them
+        return list(self.holdings_by_symbol.values())
+
     def add_holding(self, holding: Holding):
-        self.holdings.append(holding)
+        existing_holding = self.holdings_by_symbol.get(holding.symbol)
+        if existing_holding is None:
+            self.holdings_by_symbol[holding.symbol] = holding
+        else:
+            existing_holding.quantity += holding.quantity
+
+    def get_holding(self, symbol: str) -> Holding:
+        return self.holdings_by_symbol.get(symbol)
 
     @staticmethod
     def from_df(df: DataFrame):
@@ -35,43 +49,40 @@ class Portfolio:
         return '\n'.join([str(holding) for holding in self.holdings]) + f'\nCash: {self.cash}'
 
     def sell_stock(self, symbol: str, selling_price: float, quantity=None) -> None:
-        for holding in self.holdings:
-            if holding.symbol == symbol:
-                if quantity is None or quantity == holding.quantity:
-                    quantity = holding.quantity
-                    self.holdings.remove(holding)
-                elif quantity > holding.quantity:
-                    raise ValueError(f'Cannot sell {quantity} of {symbol} because you only have {holding.quantity}')
-                else:
-                    holding.quantity -= quantity
-                self.cash += quantity * selling_price
+        holding = self.holdings_by_symbol.get(symbol)
+        if holding is None:
+            return
+        if quantity is None or quantity == holding.quantity:
+            quantity = holding.quantity
+            del self.holdings_by_symbol[symbol]
+        elif quantity > holding.quantity:
+            raise ValueError(f'Cannot sell {quantity} of {symbol} because you only have {holding.quantity}')
+        else:
+            holding.quantity -= quantity
+        self.cash += quantity * selling_price
 
     def is_present(self, symbol: str) -> bool:
-        for holding in self.holdings:
-            if holding.symbol == symbol:
-                return True
-        return False
+        return symbol in self.holdings_by_symbol
 
     def buy_stock(self, symbol: str, quantity: int, price: float):
-        if self.is_present(symbol):
+        holding = self.holdings_by_symbol.get(symbol)
+        if holding is not None:
             # add to existing holding
-            for holding in self.holdings:
-                if holding.symbol == symbol:
-                    holding.quantity += quantity
+            holding.quantity += quantity
         else:
             # create a new holding
-            holding = Holding(symbol=symbol, quantity=quantity)
-            self.holdings.append(holding)
+            self.holdings_by_symbol[symbol] = Holding(symbol=symbol, quantity=quantity)
         self.cash -= quantity * price
 
+    def get_quantities(self) -> np.ndarray:
+        """
+        This method returns the quantities of the holdings (in the order of get_tickers) for vectorized math
+        """
+        return np.array([holding.quantity for holding in self.holdings_by_symbol.values()], dtype=np.float64)
+
     def get_account_value(self, closing_price_data):
-        account_value = self.cash
-        for holding in self.holdings:
-            symbol = holding.symbol
-            quantity = holding.quantity
-            price = closing_price_data[symbol]
-            account_value += quantity * price
-        return account_value
+        prices = np.array([closing_price_data[symbol] for symbol in self.holdings_by_symbol], dtype=np.float64)
+        return self.cash + float(np.dot(self.get_quantities(), prices))
 
     def save(self):
         # save the portfolio to a file
@@ -129,4 +140,4 @@ class Portfolio:
                 }
 
     def get_tickers(self):
-        return [holding.symbol for holding in self.holdings]
+        return list(self.holdings_by_symbol.keys())
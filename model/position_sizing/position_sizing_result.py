@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class PositionSizingResultRow:
     def __init__(self, symbol: str, weight: float, atr: float, close: float) -> None:
         super().__init__()
@@ -8,25 +11,71 @@ class PositionSizingResultRow:
 
 
 class PositionSizingResult:
+    """
+    Position sizes keyed by symbol. The weight, ATR and close of every position are also kept as arrays (in the
+    order the positions were added) for vectorized rebalancing math
+    """
+
     def __init__(self) -> None:
         super().__init__()
         self.rows: list[PositionSizingResultRow] = []
+        # symbol -> position of the row in rows
+        self.index: dict[str, int] = {}
+        self.columns = None
 
     def add_position(self, symbol, weight, atr, last_close):
-        self.rows.append(PositionSizingResultRow(symbol, weight, atr, last_close))
+        if symbol in self.index:
+            self.rows[self.index[symbol]] = PositionSizingResultRow(symbol, weight, atr, last_close)
+        else:
+            self.index[symbol] = len(self.rows)
+            self.rows.append(PositionSizingResultRow(symbol, weight, atr, last_close))
+        self.columns = None
+
+    def get_row(self, symbol) -> PositionSizingResultRow:
+        position = self.index.get(symbol)
+        return None if position is None else self.rows[position]
 
     def get_weight(self, symbol) -> float:
-        for row in self.rows:
-            if row.symbol == symbol:
-                return row.weight
-        return 0.0
+        row = self.get_row(symbol)
+        return 0.0 if row is None else row.weight
 
     def get_atr(self, symbol) -> float:
-        for row in self.rows:
-            if row.symbol == symbol:
-                return row.atr
+        row = self.get_row(symbol)
+        return None if row is None else row.atr
 
     def get_last_close(self, symbol) -> float:
-        for row in self.rows:
-            if row.symbol == symbol:
-                return row.close
+        row = self.get_row(symbol)
+        return None if row is None else row.close
+
+    @property
+    def symbols(self) -> list[str]:
+        return list(self.index.keys())
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self.get_columns()[0]
+
+    @property
+    def atrs(self) -> np.ndarray:
+        return self.get_columns()[1]
+
+    @property
+    def closes(self) -> np.ndarray:
+        return self.get_columns()[2]
+
+    def get_weights(self, symbols: list[str]) -> np.ndarray:
+        """
+        This method returns the weights of the symbols, 0 for the symbols that were not sized
+        :param symbols: symbols
+        :return: array of weights in the order of symbols
+        """
+        positions = np.array([self.index.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        return np.where(positions >= 0, self.weights[positions], 0.0) if len(self.rows) else np.zeros(len(symbols))
+
+    def get_columns(self) -> np.ndarray:
+        # (3 x positions) matrix of weight, ATR and close, rebuilt after a position is added
+        if self.columns is None:
+            self.columns = np.array([[row.weight for row in self.rows],
+                                     [row.atr for row in self.rows],
+                                     [row.close for row in self.rows]], dtype=np.float64).reshape(3, len(self.rows))
+        return self.columns
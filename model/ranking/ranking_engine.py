@@ -0,0 +1,97 @@
+"""
+CrossSectionalRankingEngine class
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from model import indicators
+from model.panel import PricePanel, right_align
+
+RANKING_COLUMNS = ['ticker', 'slope', 'annualised_slope', 'r2', 'trend', 'max_gap_up', 'last_close', 'score',
+                   'included']
+
+
+class CrossSectionalRankingEngine:
+    """
+    This class ranks a whole universe at once. The closes are aligned into a (dates x tickers) matrix and the
+    trend, max gap and the exponential regression (slope and R^2 of the log closes) are computed for every ticker
+    with closed form numpy expressions, so the cost of ranking hardly grows with the size of the universe
+    """
+
+    def __init__(self, num_days: int, ticker_ema_span: int, max_gap_percent: float) -> None:
+        """
+        This method initializes the engine
+        :param num_days: number of days used for the regression
+        :param ticker_ema_span: span of the moving average a ticker must trade above
+        :param max_gap_percent: a ticker with a larger daily move in the last num_days days is not included
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.num_days = num_days
+        self.ticker_ema_span = ticker_ema_span
+        self.max_gap_percent = max_gap_percent
+
+    def rank(self, panel: PricePanel) -> DataFrame:
+        """
+        This method ranks the tickers of the panel
+        :param panel: price panel with close prices
+        :return: data frame with RANKING_COLUMNS sorted by score (descending)
+        """
+        close = right_align(panel.close)
+        num_candles = np.sum(~np.isnan(close), axis=0)
+        eligible = num_candles >= self.ticker_ema_span
+        for ticker in np.asarray(panel.tickers, dtype=object)[~eligible]:
+            self.logger.info('Skipping %s as it has less than %s rows', ticker, self.ticker_ema_span)
+        tickers = [ticker for ticker, is_eligible in zip(panel.tickers, eligible) if is_eligible]
+        close = close[:, eligible]
+        if len(tickers) == 0:
+            return pd.DataFrame(columns=RANKING_COLUMNS)
+
+        # the ticker must trade above its moving average
+        ema = indicators.ema(close, self.ticker_ema_span)
+        trend = np.sign(close[-1] - ema[-1]).astype(int)
+
+        # largest daily move in the regression window
+        max_gap_up = np.nanmax(indicators.percent_change(close)[-self.num_days:], axis=0)
+
+        slope, r2 = self.get_slope_and_r2(close[-self.num_days:])
+        annualised_slope = ((np.exp(slope) ** 250) - 1) * 100
+        included = (trend == 1) & (max_gap_up < self.max_gap_percent)
+
+        result_df = pd.DataFrame({'ticker': tickers,
+                                  'slope': slope,
+                                  'annualised_slope': annualised_slope,
+                                  'r2': r2,
+                                  'trend': trend,
+                                  'max_gap_up': max_gap_up,
+                                  'last_close': close[-1],
+                                  'score': r2 * annualised_slope,
+                                  'included': included})
+        result_df.sort_values(by=['score'], ascending=False, inplace=True, kind='stable')
+        result_df.reset_index(inplace=True, drop=True)
+        return result_df
+
+    @staticmethod
+    def get_slope_and_r2(close: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        This method fits log(close) = slope * x + intercept (x = 1..n) for every column using the closed form of
+        the least squares regression
+        :param close: (n x tickers) matrix of closes
+        :return: slope and R^2 of every column
+        """
+        num_rows = close.shape[0]
+        x_centered = np.arange(1, num_rows + 1) - (num_rows + 1) / 2
+        log_y = np.log(close)
+        y_centered = log_y - log_y.mean(axis=0)
+        sum_xx = np.sum(x_centered ** 2)
+        sum_xy = x_centered @ y_centered
+        sum_yy = np.sum(y_centered ** 2, axis=0)
+        slope = sum_xy / sum_xx
+        # R^2 of a least squares fit is the squared correlation. A flat series is fitted perfectly
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r2 = np.where(sum_yy > 0, sum_xy ** 2 / (sum_xx * sum_yy), 1.0)
+        return slope, r2
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class RankingTableRow:
     def __init__(self, symbol: str, rank: int, score: float, trend: int, included: bool, closing_price: float):
         super().__init__()
@@ -16,6 +19,8 @@ class RankingTable:
     def __init__(self, rows: list[RankingTableRow]):
         super().__init__()
         self.rows = rows
+        # symbol -> position of the row in rows
+        self.index: dict[str, int] = {row.symbol: position for position, row in enumerate(rows)}
 
     @classmethod
     def from_df(cls, sym_param_df):
@@ -29,17 +34,29 @@ class RankingTable:
                                         row['last_close']))
         return cls(rows)
 
+    @classmethod
+    def from_columns(cls, symbols: list[str], scores: np.ndarray, trends: np.ndarray, included: np.ndarray,
+                     closing_prices: np.ndarray) -> 'RankingTable':
+        """
+        This method builds the table from columns that are already sorted by rank
+        """
+        rows = [RankingTableRow(symbol, rank, score, trend, is_included, closing_price)
+                for rank, (symbol, score, trend, is_included, closing_price)
+                in enumerate(zip(symbols, scores.tolist(), trends.tolist(), included.tolist(),
+                                 closing_prices.tolist()), start=1)]
+        return cls(rows)
+
     def __str__(self) -> str:
         return '\n'.join([str(row) for row in self.rows])
 
     def get_last_close(self, ticker: str) -> float:
-        for row in self.rows:
-            if row.symbol == ticker:
-                return row.closing_price
-        raise ValueError(f'Could not find ticker {ticker} in ranking table')
+        return self.get_row(ticker).closing_price
 
     def get_row(self, ticker: str) -> RankingTableRow:
-        for row in self.rows:
-            if row.symbol == ticker:
-                return row
-        raise ValueError(f'Could not find ticker {ticker} in ranking table')
+        position = self.index.get(ticker)
+        if position is None:
+            raise ValueError(f'Could not find ticker {ticker} in ranking table')
+        return self.rows[position]
+
+    def get_last_close_data(self) -> dict[str, float]:
+        return {row.symbol: row.closing_price for row in self.rows}
@@ -0,0 +1,134 @@
+"""
+RollingExponentialRegression class
+"""
+
+from typing import Optional
+
+import numpy as np
+from pandas import DataFrame
+
+from model.panel import PricePanel
+
+
+class RollingExponentialRegression:
+    """
+    This class computes the momentum score (annualised slope of the exponential regression multiplied by R^2) of
+    every ticker for every date. The regression of log(close) on x = 1..num_days is evaluated from rolling sums,
+    so moving the window by a day is O(1) per ticker instead of a new polyfit. A window with a missing close is NaN.
+
+    fit() computes the score matrix of a whole history, append() then adds one trading day at a time.
+    """
+
+    def __init__(self, num_days: int = 90, annualisation_days: int = 250) -> None:
+        """
+        This method initializes RollingExponentialRegression object
+        :param num_days: length of the regression window
+        :param annualisation_days: number of trading days in a year
+        """
+        super().__init__()
+        self.num_days = num_days
+        self.annualisation_days = annualisation_days
+        num = num_days
+        self.sum_x = num * (num + 1) / 2
+        self.var_x = num * (num * (num + 1) * (2 * num + 1) / 6) - self.sum_x ** 2
+        # state of the last window, used by append()
+        self.reference: Optional[np.ndarray] = None
+        self.has_reference: Optional[np.ndarray] = None
+        self.window: Optional[np.ndarray] = None
+        self.window_missing: Optional[np.ndarray] = None
+        self.position = 0
+        self.sum_y: Optional[np.ndarray] = None
+        self.sum_yy: Optional[np.ndarray] = None
+        self.sum_xy: Optional[np.ndarray] = None
+
+    def fit(self, close: np.ndarray) -> np.ndarray:
+        """
+        This method computes the score of every ticker for every date
+        :param close: (dates x tickers) matrix of closes, NaN where missing
+        :return: (dates x tickers) score matrix, NaN for the first num_days - 1 dates and incomplete windows
+        """
+        num = self.num_days
+        log_close = np.log(close)
+        missing = np.isnan(log_close)
+        # the log closes are shifted by the first close of the ticker to keep the sums small and precise
+        first_valid = np.argmax(~missing, axis=0)
+        self.reference = np.nan_to_num(np.take_along_axis(log_close, first_valid[np.newaxis, :], axis=0)[0])
+        self.has_reference = (~missing).any(axis=0)
+        y = np.where(missing, 0.0, log_close - self.reference)
+        row_numbers = np.arange(close.shape[0], dtype=np.float64)[:, np.newaxis]
+
+        def window_sums(values: np.ndarray) -> np.ndarray:
+            cumulative = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(values, axis=0)])
+            return cumulative[num:] - cumulative[:-num]
+
+        scores = np.full(close.shape, np.nan)
+        if close.shape[0] < num:
+            self.init_window(y, missing)
+            return scores
+        num_missing = window_sums(missing.astype(np.float64))
+        sum_y = window_sums(y)
+        sum_yy = window_sums(y * y)
+        # x of row k in the window ending at row t is k - (t - num), so sum(x * y) = sum(k * y) - (t - num) * sum(y)
+        sum_xy = window_sums(row_numbers * y) - (row_numbers[num - 1:] - num) * sum_y
+        window_scores = self.score(sum_y, sum_yy, sum_xy)
+        window_scores[num_missing > 0] = np.nan
+        scores[num - 1:] = window_scores
+        self.init_window(y, missing)
+        return scores
+
+    def fit_panel(self, panel: PricePanel) -> DataFrame:
+        """
+        This method computes the score matrix of a panel as a data frame with dates as index and tickers as columns
+        :param panel: price panel with close prices
+        :return: score data frame
+        """
+        return DataFrame(self.fit(panel.close), index=panel.dates.astype('datetime64[D]'), columns=panel.tickers)
+
+    def append(self, close_row: np.ndarray) -> np.ndarray:
+        """
+        This method moves the window of every ticker by one trading day
+        :param close_row: closes of the new day (one per ticker, NaN where missing)
+        :return: score of every ticker for the new day
+        """
+        if self.window is None:
+            raise ValueError("fit must be called before append")
+        log_close = np.log(close_row)
+        missing = np.isnan(log_close)
+        # tickers that had no close so far use their first close as reference
+        new_reference = ~self.has_reference & ~missing
+        self.reference = np.where(new_reference, log_close, self.reference)
+        self.has_reference |= new_reference
+        y_new = np.where(missing, 0.0, log_close - self.reference)
+        y_old = self.window[self.position]
+        self.sum_xy = self.sum_xy - self.sum_y + self.num_days * y_new
+        self.sum_y = self.sum_y - y_old + y_new
+        self.sum_yy = self.sum_yy - y_old * y_old + y_new * y_new
+        self.window[self.position] = y_new
+        self.window_missing[self.position] = missing
+        self.position = (self.position + 1) % self.num_days
+        scores = self.score(self.sum_y, self.sum_yy, self.sum_xy)
+        scores[self.window_missing.any(axis=0)] = np.nan
+        return scores
+
+    def score(self, sum_y: np.ndarray, sum_yy: np.ndarray, sum_xy: np.ndarray) -> np.ndarray:
+        num = self.num_days
+        covariance = num * sum_xy - self.sum_x * sum_y
+        var_y = num * sum_yy - sum_y ** 2
+        slope = covariance / self.var_x
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r2 = np.where(var_y > 0, covariance ** 2 / (self.var_x * var_y), 1.0)
+        annualised_slope = ((np.exp(slope) ** self.annualisation_days) - 1) * 100
+        return r2 * annualised_slope
+
+    def init_window(self, y: np.ndarray, missing: np.ndarray) -> None:
+        # keep the last num_days rows (padded with missing rows) and the sums of the last window
+        num = self.num_days
+        num_tickers = y.shape[1]
+        padding = max(0, num - y.shape[0])
+        self.window = np.vstack([np.zeros((padding, num_tickers)), y[-num:]])
+        self.window_missing = np.vstack([np.ones((padding, num_tickers), dtype=bool), missing[-num:]])
+        self.position = 0
+        x = np.arange(1, num + 1, dtype=np.float64)
+        self.sum_y = self.window.sum(axis=0)
+        self.sum_yy = (self.window ** 2).sum(axis=0)
+        self.sum_xy = x @ self.window
@@ -9,6 +9,8 @@ from model.position_sizing.position_sizing_strategies import PositionSizingStrat
 from model.ranking.ranking_result import RankingTable, RankingTableRow
 from model.rebalancing.rebalancing_result import RebalancingResult
 from model.scheduling.schedule import Schedule
+from model.scheduling.trading_calendar import TradingCalendar
+from services.execution_listener import ExecutionListener
 from services.portfolio_service import PortfolioService
 
 
@@ -22,7 +24,8 @@ class PortfolioRebalancingStrategy(ABC):
     def rebalance_portfolio(self,
                             portfolio: Portfolio,
                             ranking_table: RankingTable,
-                            cash_flow: float) -> RebalancingResult:
+                            cash_flow: float,
+                            as_of: datetime.date = None) -> RebalancingResult:
         pass
 
 
@@ -40,7 +43,10 @@ class PortfolioRebalancingStrategyStrategyImpl(PortfolioRebalancingStrategy):
                  risk_factor: float,
                  position_sizing_strategy: PositionSizingStrategy,
                  position_rebalance_schedule: Schedule,
-                 threshold: float) -> None:
+                 threshold: float,
+                 persist_results: bool = True,
+                 trading_calendar: TradingCalendar = None,
+                 listener: ExecutionListener = None) -> None:
         super().__init__()
         self.threshold = threshold
         self.position_sizing_strategy = position_sizing_strategy
@@ -50,12 +56,16 @@ class PortfolioRebalancingStrategyStrategyImpl(PortfolioRebalancingStrategy):
         self.ticker_ema_span = ticker_ema_span
         self.market_regime_filter = market_regime_filter
         self.position_rebalance_schedule = position_rebalance_schedule
+        self.persist_results = persist_results
+        self.trading_calendar = trading_calendar or TradingCalendar.get_instance()
+        self.listener = listener or ExecutionListener()
         self.logger = logging.getLogger(__name__)
 
     def rebalance_portfolio(self,
                             portfolio: Portfolio,
                             ranking_table: RankingTable,
                             cash_flow: float,
+                            as_of: datetime.date = None
                             ) -> RebalancingResult:
         rebalancing_result = RebalancingResult()
         rebalancing_result.portfolio = portfolio
@@ -64,9 +74,7 @@ class PortfolioRebalancingStrategyStrategyImpl(PortfolioRebalancingStrategy):
         portfolio.cash += cash_flow
 
         # create a dictionary of stocks and their last close price
-        last_close_data = {}
-        for row in ranking_table.rows:
-            last_close_data[row.symbol] = row.closing_price
+        last_close_data = ranking_table.get_last_close_data()
 
         # Using the ranking table, get the top n% of stocks. e.g. top 20%
         # For each stock in the portfolio, check if it is in the top n% of stocks
@@ -74,11 +82,12 @@ class PortfolioRebalancingStrategyStrategyImpl(PortfolioRebalancingStrategy):
         stocks_to_sell = []
         top_n_percent_rows = self.get_top_n_percent(ranking_table, self.top_n_percent)
         stocks_in_top_n_percentile = [row.symbol for row in top_n_percent_rows]
+        top_n_percent_symbols = set(stocks_in_top_n_percentile)
         for holding in portfolio.holdings:
             # check if the stock is trending below its n-day moving average.
             ranking_table_row = ranking_table.get_row(holding.symbol)
             trending = ranking_table_row.trend == 1
-            if holding.symbol not in stocks_in_top_n_percentile or not trending:
+            if holding.symbol not in top_n_percent_symbols or not trending:
                 # closing_price = last_close_data[holding.symbol]
                 # closing_price = position_sizing_result.get_last_close(holding.symbol)
                 stocks_to_sell.append(holding.symbol)
@@ -89,9 +98,14 @@ class PortfolioRebalancingStrategyStrategyImpl(PortfolioRebalancingStrategy):
 
         account_value = portfolio.get_account_value(last_close_data)
         daily_risk = account_value * self.risk_factor
-        position_sizing_result = self.position_sizing_strategy.calculate_position_sizes(ranking_table, account_value)
-
-        if self.position_rebalance_schedule.matches(datetime.date.today()):
+        # only the remaining holdings and the buy candidates are sized
+        candidates = [holding.symbol for holding in portfolio.holdings] + stocks_in_top_n_percentile
+        with self.listener.stage('size'):
+            position_sizing_result = self.position_sizing_strategy.calculate_position_sizes(ranking_table,
+                                                                                            account_value,
+                                                                                            candidates)
+
+        if self.trading_calendar.is_scheduled(self.position_rebalance_schedule, as_of or datetime.date.today()):
             # we rebalance overweight positions first
             self.logger.info("Rebalance overweight positions")
             for holding in portfolio.holdings:
@@ -150,20 +164,26 @@ class PortfolioRebalancingStrategyStrategyImpl(PortfolioRebalancingStrategy):
             self.logger.info("No cash available. Skip execution")
             return rebalancing_result
 
-        if not self.market_regime_filter.is_allowed():
+        with self.listener.stage('regime'):
+            market_regime = self.market_regime_filter.is_allowed()
+        if not market_regime:
             self.logger.info("Market regime does not allow any buying. Skip execution")
             return rebalancing_result
 
+        sold_symbols = set(stocks_to_sell)
         # For each stock in the ranking_table, start from top and check if it is in the portfolio
         # If it is not, then buy the stock
         for row in ranking_table.rows:
             if not portfolio.is_present(row.symbol) and \
                     row.included is True and \
                     available_cash > 0 and \
-                    row.symbol not in stocks_to_sell and \
-                    row.symbol in stocks_in_top_n_percentile:
+                    row.symbol not in sold_symbols and \
+                    row.symbol in top_n_percent_symbols:
                 # buy stock
                 current_atr = position_sizing_result.get_atr(row.symbol)
+                if current_atr is None:
+                    self.logger.info("No position size for %s. Skip buying it", row.symbol)
+                    continue
                 last_close = position_sizing_result.get_last_close(row.symbol)
                 num_stocks_to_buy = math.floor(daily_risk / current_atr)
                 account_value_allotted = num_stocks_to_buy * last_close
@@ -174,12 +194,16 @@ class PortfolioRebalancingStrategyStrategyImpl(PortfolioRebalancingStrategy):
                 portfolio.buy_stock(row.symbol, num_stocks_to_buy, last_close)
                 rebalancing_result.add_stock_to_buy(row.symbol, num_stocks_to_buy, weight)
 
-        result = ResultBuilder() \
-            .with_ranking_results(ranking_table) \
-            .with_position_sizing_result(position_sizing_result) \
-            .build()
-
-        self.print_and_save(result)
+        if self.persist_results:
+            with self.listener.stage('persist'):
+                # result.csv lists the weight of every ranked stock, not only of the sized candidates
+                full_position_sizing_result = self.position_sizing_strategy.calculate_position_sizes(ranking_table,
+                                                                                                     account_value)
+                result = ResultBuilder() \
+                    .with_ranking_results(ranking_table) \
+                    .with_position_sizing_result(full_position_sizing_result) \
+                    .build()
+                self.print_and_save(result)
         return rebalancing_result
 
     def print_and_save(self, result: Result):
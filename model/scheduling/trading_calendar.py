@@ -0,0 +1,227 @@
+"""
+TradingCalendar class
+"""
+
+import logging
+import os
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+
+from model.scheduling.frequency import Frequency
+from model.scheduling.schedule import Schedule
+from services.config_service import ConfigService
+
+# NSE trades monday to friday
+WEEKMASK = '1111100'
+# the exchange closes at 15:30 IST, India has no daylight saving time
+MARKET_TIMEZONE = timezone(timedelta(hours=5, minutes=30))
+MARKET_CLOSE = time(15, 30)
+
+HOLIDAY_DATE_FORMATS = ['%Y-%m-%d', '%d-%b-%Y', '%d-%m-%Y', '%d/%m/%Y']
+
+
+class TradingCalendar:
+    """
+    This class knows the trading days of the exchange: weekdays that are not in the holiday file. It expands a
+    Schedule into a sorted numpy array of dates in one vectorized call. A scheduled date that falls on a holiday
+    rolls forward to the next trading day. Scheduled weekend days (e.g. a SUNDAY trade day that rebalances on the
+    friday close) are kept as they are, they were chosen on purpose
+    """
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self, holidays: list[date] = None, weekmask: str = WEEKMASK) -> None:
+        """
+        This method initializes TradingCalendar object
+        :param holidays: exchange holidays
+        :param weekmask: days of the week the exchange trades, monday first
+        """
+        super().__init__()
+        self.holidays = np.unique(np.array(holidays or [], dtype='datetime64[D]'))
+        self.weekmask = weekmask
+        self.business_days = np.busdaycalendar(weekmask=weekmask, holidays=self.holidays)
+
+    @classmethod
+    def get_instance(cls) -> 'TradingCalendar':
+        """
+        This method returns the singleton calendar built from calendar.holidays_file
+        :return: TradingCalendar instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                holidays_file = ConfigService.get_instance().get_or_default('calendar.holidays_file',
+                                                                            default='holidays.csv')
+                cls.instance = cls.from_file(holidays_file)
+            return cls.instance
+
+    @classmethod
+    def from_file(cls, file_name: str) -> 'TradingCalendar':
+        """
+        This method reads the holidays from a file with one date per line (the first comma separated column is
+        used, e.g. 2024-01-26 or 26-Jan-2024). Lines starting with '#' and lines that are not dates (a header) are
+        skipped. Without the file only the weekday rules are used
+        :param file_name: holiday file
+        :return: TradingCalendar
+        """
+        if not os.path.exists(file_name):
+            logging.getLogger(__name__).warning('Holiday file %s not found, only weekends are closed', file_name)
+            return cls()
+        holidays = []
+        with open(file_name, 'r', encoding='utf-8') as holiday_file:
+            for line in holiday_file:
+                text = line.split(',')[0].strip()
+                if not text or text.startswith('#'):
+                    continue
+                holiday = parse_date(text)
+                if holiday is not None:
+                    holidays.append(holiday)
+        return cls(holidays)
+
+    def is_trading_day(self, day: date) -> bool:
+        return bool(np.is_busday(np.datetime64(day, 'D'), busdaycal=self.business_days))
+
+    def next_trading_day(self, day: date) -> date:
+        """
+        This method returns the day itself if it is a trading day, otherwise the next trading day
+        """
+        return np.busday_offset(np.datetime64(day, 'D'), 0, roll='forward', busdaycal=self.business_days).item()
+
+    def previous_trading_day(self, day: date) -> date:
+        """
+        This method returns the day itself if it is a trading day, otherwise the previous trading day
+        """
+        return np.busday_offset(np.datetime64(day, 'D'), 0, roll='backward', busdaycal=self.business_days).item()
+
+    def trading_days(self, start_date: date, end_date: date) -> np.ndarray:
+        """
+        This method returns the trading days between two dates (inclusive)
+        :return: sorted datetime64[D] array
+        """
+        days = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+        return days[np.is_busday(days, busdaycal=self.business_days)]
+
+    def expand(self, schedule: Schedule, start_date: date, end_date: date) -> np.ndarray:
+        """
+        This method returns the dates of the schedule between two dates (inclusive), with the same rules as
+        Schedule.matches except for DAILY schedules. Dates on a holiday roll forward to the next trading day.
+        A DAILY schedule expands to the trading days only, whereas Schedule.matches is True on every day (weekends
+        and holidays included): there are no new candles to act on when the exchange is closed
+        :param schedule: schedule to expand
+        :param start_date: first date
+        :param end_date: last date
+        :return: sorted datetime64[D] array of unique dates
+        """
+        if schedule.start_date is not None:
+            start_date = max(start_date, schedule.start_date)
+        if schedule.end_date is not None:
+            end_date = min(end_date, schedule.end_date)
+        last_day = np.datetime64(end_date, 'D')
+        days = np.arange(np.datetime64(start_date, 'D'), last_day + 1)
+        if schedule.frequency == Frequency.DAILY:
+            return days[np.is_busday(days, busdaycal=self.business_days)]
+        days = days[schedule_mask(schedule, days)]
+        # holidays on a trading weekday roll forward, days outside the week mask are kept
+        holiday = np.isin(days, self.holidays)
+        days[holiday] = np.busday_offset(days[holiday], 0, roll='forward', busdaycal=self.business_days)
+        return np.unique(days[days <= last_day])
+
+    def next_close(self, timestamp: float = None) -> float:
+        """
+        This method returns the next market close: the close of the day if it is a trading day and the market has
+        not closed yet, otherwise the close of the next trading day. A daily bar stays valid until then
+        :param timestamp: epoch seconds, now by default
+        :return: epoch seconds of the close
+        """
+        now = datetime.fromtimestamp(timestamp, MARKET_TIMEZONE) if timestamp is not None \
+            else datetime.now(MARKET_TIMEZONE)
+        day = now.date()
+        if not self.is_trading_day(day) or now.time() >= MARKET_CLOSE:
+            day = self.next_trading_day(day + timedelta(1))
+        return datetime.combine(day, MARKET_CLOSE, MARKET_TIMEZONE).timestamp()
+
+    def last_closed_day(self, timestamp: float = None) -> date:
+        """
+        This method returns the last day whose daily candle is final: the day itself once the market has closed or
+        when it is not a trading day, otherwise the day before (the session is still running or about to start)
+        :param timestamp: epoch seconds, now by default
+        :return: date in the market timezone
+        """
+        now = datetime.fromtimestamp(timestamp, MARKET_TIMEZONE) if timestamp is not None \
+            else datetime.now(MARKET_TIMEZONE)
+        day = now.date()
+        if self.is_trading_day(day) and now.time() < MARKET_CLOSE:
+            return day - timedelta(1)
+        return day
+
+    def is_scheduled(self, schedule: Schedule, day: date) -> bool:
+        """
+        This method tells whether the schedule has a date on the day, after holiday rolling
+        """
+        # a date rolls forward at most over a long holiday stretch, a few weeks of history are enough
+        dates = self.expand(schedule, day - timedelta(31), day)
+        return len(dates) > 0 and dates[-1] == np.datetime64(day, 'D')
+
+    def next_scheduled(self, schedule: Schedule, day: date, horizon_days: int = 400) -> date:
+        """
+        This method returns the first date of the schedule on or after the day
+        :return: date, None if the schedule has no date within horizon_days
+        """
+        dates = self.expand(schedule, day, day + timedelta(horizon_days))
+        return dates[0].item() if len(dates) else None
+
+
+def schedule_mask(schedule: Schedule, days: np.ndarray) -> np.ndarray:
+    """
+    This function evaluates Schedule.matches for an array of days at once
+    :param schedule: schedule
+    :param days: datetime64[D] array
+    :return: boolean array
+    """
+    day_numbers = days.astype(np.int64)
+    # 1970-01-01 was a thursday, monday is 0
+    weekday = (day_numbers + 3) % 7
+    month_start = days.astype('datetime64[M]')
+    month = month_start.astype(np.int64) % 12 + 1
+    day_of_month = (days - month_start.astype('datetime64[D]')).astype(np.int64) + 1
+    frequency = schedule.frequency
+    if frequency in (Frequency.WEEKLY, Frequency.BI_WEEKLY):
+        if schedule.day_of_week is None:
+            return np.zeros(len(days), dtype=bool)
+        mask = weekday == schedule.day_of_week.value
+        if frequency == Frequency.BI_WEEKLY:
+            mask &= iso_week(days) % 2 == 0
+        return mask
+    if frequency in (Frequency.MONTHLY, Frequency.QUARTERLY, Frequency.YEARLY):
+        if schedule.day_of_month is None:
+            return np.zeros(len(days), dtype=bool)
+        mask = day_of_month == schedule.day_of_month
+        if frequency == Frequency.QUARTERLY:
+            mask &= np.isin(month, [3, 6, 9, 12])
+        elif frequency == Frequency.YEARLY:
+            mask &= month == 12
+        return mask
+    if frequency == Frequency.DAILY:
+        return np.ones(len(days), dtype=bool)
+    return np.zeros(len(days), dtype=bool)
+
+
+def iso_week(days: np.ndarray) -> np.ndarray:
+    """
+    This function returns the ISO week number of every day, like date.isocalendar()[1]
+    """
+    weekday = (days.astype(np.int64) + 3) % 7
+    # the ISO year of a day is the year of the thursday of its week
+    thursday = days - weekday + 3
+    year_start = thursday.astype('datetime64[Y]').astype('datetime64[D]')
+    return (thursday - year_start).astype(np.int64) // 7 + 1
+
+
+def parse_date(text: str):
+    for date_format in HOLIDAY_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
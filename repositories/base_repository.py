@@ -1,17 +1,44 @@
-import psycopg2
+import threading
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
 
 from services.config_service import ConfigService
 
 
 class BaseRepository:
-    def __init__(self):
-        config_service = ConfigService.get_instance()
+    # one connection pool is shared by all the repositories in the process
+    pool = None
+    pool_lock = threading.Lock()
+
+    @classmethod
+    def get_pool(cls) -> ThreadedConnectionPool:
+        with cls.pool_lock:
+            if BaseRepository.pool is None:
+                config_service = ConfigService.get_instance()
+                db_params = {
+                    "dbname": config_service.get('database.name'),
+                    "user": config_service.get('database.username'),
+                    "password": config_service.get('database.password'),
+                    "host": config_service.get('database.host'),
+                    "port": config_service.get('database.port')
+                }
+                BaseRepository.pool = ThreadedConnectionPool(
+                    minconn=int(config_service.get_or_default('database.pool.min_connections', default=1)),
+                    maxconn=int(config_service.get_or_default('database.pool.max_connections', default=8)),
+                    **db_params)
+            return BaseRepository.pool
 
-        db_params = {
-            "dbname": config_service.get('database.name'),
-            "user": config_service.get('database.username'),
-            "password": config_service.get('database.password'),
-            "host": config_service.get('database.host'),
-            "port": config_service.get('database.port')
-        }
-        self.conn = psycopg2.connect(**db_params)
+    @contextmanager
+    def connection(self):
+        # borrow a connection from the pool. The transaction is committed if the block succeeds
+        pool = self.get_pool()
+        conn = pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool.putconn(conn)
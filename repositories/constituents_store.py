@@ -0,0 +1,162 @@
+"""
+This module contains ConstituentsStore class which keeps the constituents of the indices on the local disk
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import date
+from typing import Optional
+from urllib.parse import quote, unquote
+
+from repositories.file_lock import FileLock
+from repositories.ohlc_file_store import OhlcFileStore
+from services.config_service import ConfigService
+
+META_FILE = 'meta.json'
+WRITE_LOCK_FILE = '.write.lock'
+
+
+class ConstituentsStore:
+    """
+    This class stores the constituents of every index as dated snapshots, one csv per date on which the list changed,
+    along with a meta file holding the fetch time, the sha256 of the last downloaded file and its ETag and
+    Last-Modified headers. The constituents as of a date are those of the latest snapshot on or before the date
+    """
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        """
+        This method initializes ConstituentsStore object
+        :param path: root directory of the store, one directory per index
+        """
+        super().__init__()
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self.write_lock = FileLock(os.path.join(self.path, WRITE_LOCK_FILE))
+
+    @classmethod
+    def get_instance(cls) -> 'ConstituentsStore':
+        """
+        This method returns the singleton instance of ConstituentsStore
+        :return: ConstituentsStore instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                config_service = ConfigService.get_instance()
+                cls.instance = ConstituentsStore(
+                    path=config_service.get_or_default('constituents.store.path', default='data/constituents'))
+            return cls.instance
+
+    def get_meta(self, index: str) -> Optional[dict]:
+        """
+        This method returns the meta of the index: fetched_at (epoch seconds), sha256, etag, last_modified and the
+        sorted snapshot dates
+        :param index: index name (e.g. NIFTY 50)
+        :return: dict, None if the index is not in the store
+        """
+        meta_file = self.get_file(index, META_FILE)
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, 'r', encoding='utf-8') as text_file:
+            return json.load(text_file)
+
+    def get_indices(self) -> list[str]:
+        return [unquote(entry.name) for entry in os.scandir(self.path) if entry.is_dir()]
+
+    def get_snapshot_dates(self, index: str) -> list[date]:
+        meta = self.get_meta(index)
+        if meta is None:
+            return []
+        return [date.fromisoformat(day) for day in meta['snapshots']]
+
+    def get(self, index: str) -> Optional[list[str]]:
+        """
+        This method returns the latest constituents of the index
+        :param index: index name
+        :return: list of symbols, None if the index is not in the store
+        """
+        snapshot_dates = self.get_snapshot_dates(index)
+        if not snapshot_dates:
+            return None
+        return self.read_snapshot(index, snapshot_dates[-1])
+
+    def get_as_of(self, index: str, day: date) -> Optional[list[str]]:
+        """
+        This method returns the constituents of the index as of a date, from the latest snapshot on or before it
+        :param index: index name
+        :param day: date
+        :return: list of symbols, None if the store has no snapshot of the index on or before the date
+        """
+        snapshot_dates = [snapshot_date for snapshot_date in self.get_snapshot_dates(index) if snapshot_date <= day]
+        if not snapshot_dates:
+            return None
+        return self.read_snapshot(index, snapshot_dates[-1])
+
+    def save(self, index: str, symbols: list[str], sha256: str, etag: str = None, last_modified: str = None,
+             day: date = None) -> bool:
+        """
+        This method saves a downloaded constituents file. A snapshot is added only if the content changed
+        :param index: index name
+        :param symbols: constituents
+        :param sha256: hash of the downloaded file
+        :param etag: ETag header of the response
+        :param last_modified: Last-Modified header of the response
+        :param day: date of the snapshot, today by default
+        :return: True if a snapshot was added
+        """
+        day = day or date.today()
+        with self.write_lock:
+            meta = self.get_meta(index) or {'snapshots': [], 'sha256': None}
+            changed = meta['sha256'] != sha256
+            if changed:
+                self.write_snapshot(index, day, symbols, meta)
+            meta.update({'fetched_at': time.time(), 'sha256': sha256, 'etag': etag, 'last_modified': last_modified})
+            self.save_meta(index, meta)
+        return changed
+
+    def save_snapshot(self, index: str, day: date, symbols: list[str]) -> None:
+        """
+        This method adds a snapshot of the constituents on a date, e.g. to import the history of an index
+        :param index: index name
+        :param day: date from which the constituents apply
+        :param symbols: constituents
+        """
+        with self.write_lock:
+            meta = self.get_meta(index) or {'snapshots': [], 'sha256': None}
+            self.write_snapshot(index, day, symbols, meta)
+            self.save_meta(index, meta)
+
+    def touch(self, index: str) -> None:
+        """
+        This method records that the constituents were checked and did not change
+        :param index: index name
+        """
+        with self.write_lock:
+            meta = self.get_meta(index)
+            if meta is not None:
+                meta['fetched_at'] = time.time()
+                self.save_meta(index, meta)
+
+    def write_snapshot(self, index: str, day: date, symbols: list[str], meta: dict) -> None:
+        # callers hold the write lock and save the meta afterwards
+        os.makedirs(self.get_dir(index), exist_ok=True)
+        data = ''.join(f'{symbol}\n' for symbol in ['Symbol'] + list(symbols)).encode('utf-8')
+        OhlcFileStore.atomic_write(self.get_file(index, f'{day.isoformat()}.csv'), lambda f: f.write(data))
+        meta['snapshots'] = sorted(set(meta['snapshots']) | {day.isoformat()})
+
+    def read_snapshot(self, index: str, day: date) -> list[str]:
+        with open(self.get_file(index, f'{day.isoformat()}.csv'), 'r', encoding='utf-8') as text_file:
+            return [line.strip() for line in text_file.readlines()[1:] if line.strip()]
+
+    def save_meta(self, index: str, meta: dict) -> None:
+        data = json.dumps(meta).encode('utf-8')
+        OhlcFileStore.atomic_write(self.get_file(index, META_FILE), lambda f: f.write(data))
+
+    def get_dir(self, index: str) -> str:
+        return os.path.join(self.path, quote(index, safe=''))
+
+    def get_file(self, index: str, file_name: str) -> str:
+        return os.path.join(self.get_dir(index), file_name)
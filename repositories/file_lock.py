@@ -0,0 +1,69 @@
+"""
+This module contains FileLock class which serializes work across the worker processes of the server
+"""
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # windows has no flock, the lock only works between the threads of one process there
+    fcntl = None
+
+
+class FileLock:
+    """
+    This class is an exclusive lock shared by all the processes that open the same lock file. It is taken with
+    flock, so it is released by the OS if the process dies while holding it. The lock is reentrant within a thread
+    and the threads of a process also exclude each other. Use it as a context manager
+    """
+    # one thread lock and one per-thread hold count per lock file, shared by all the FileLock objects of the file.
+    # flock does not exclude two threads sharing a file descriptor, and a second flock of the same file from the
+    # thread that already holds it would block forever
+    thread_locks: dict[str, tuple[threading.RLock, threading.local]] = {}
+    thread_locks_lock = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        """
+        This method initializes FileLock object
+        :param path: lock file, created if it does not exist
+        """
+        super().__init__()
+        self.path = os.path.abspath(path)
+        with FileLock.thread_locks_lock:
+            self.thread_lock, self.local = FileLock.thread_locks.setdefault(self.path,
+                                                                            (threading.RLock(), threading.local()))
+
+    def acquire(self) -> None:
+        self.thread_lock.acquire()
+        depth = getattr(self.local, 'depth', 0)
+        if depth == 0 and fcntl is not None:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                file_descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except Exception:
+                self.thread_lock.release()
+                raise
+            try:
+                fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            except Exception:
+                os.close(file_descriptor)
+                self.thread_lock.release()
+                raise
+            self.local.file_descriptor = file_descriptor
+        self.local.depth = depth + 1
+
+    def release(self) -> None:
+        self.local.depth -= 1
+        if self.local.depth == 0 and fcntl is not None:
+            # closing the file descriptor releases the flock
+            os.close(self.local.file_descriptor)
+        self.thread_lock.release()
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
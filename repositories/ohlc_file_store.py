@@ -0,0 +1,364 @@
+"""
+This module contains OhlcFileStore class which persists OHLCV candles on the local disk
+"""
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date
+from typing import Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from model.date_range_set import DateRangeSet
+from repositories.file_lock import FileLock
+from services.config_service import ConfigService
+
+EPOCH = date(1970, 1, 1)
+BASE_FILE = 'base.npy'
+META_FILE = 'meta.json'
+WRITE_LOCK_FILE = '.write.lock'
+GENERATION_FILE = '.generation'
+FETCH_LOCKS_DIR = '.locks'
+
+
+class OhlcFileStore:
+    """
+    This class stores candles on the local disk with one directory per ticker. Candles are stored column wise in a
+    (6, n) float64 matrix (date as days since epoch, open, high, low, close and volume) so that reads can memory map
+    the file instead of parsing it. New data is appended as small segment files which are merged into the base
+    file by compaction. The total size of the store is capped and the least recently used tickers are evicted.
+
+    The store can be shared by several worker processes. Files are replaced atomically and the meta file is written
+    last, so readers take no lock. Writers (write, compact and evict) hold a lock file, and every process notices
+    the changes of the others through the stat of the meta files.
+    """
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self, path: str, max_bytes: int, max_segments: int = 8) -> None:
+        """
+        This method initializes the store
+        :param path: root directory of the store
+        :param max_bytes: maximum size of the store on disk
+        :param max_segments: number of appended segments after which a ticker is compacted
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.lock = threading.RLock()
+        # symbol -> (stat of the meta file, meta)
+        self.meta_cache: dict[str, tuple[tuple, dict]] = {}
+        self.sizes: Optional[dict[str, int]] = None
+        # number of writes to the store (by any process) known to this process, see writing
+        self.generation = None
+        os.makedirs(self.path, exist_ok=True)
+        self.write_lock = FileLock(os.path.join(self.path, WRITE_LOCK_FILE))
+
+    @classmethod
+    def get_instance(cls) -> 'OhlcFileStore':
+        """
+        This method returns the singleton instance of OhlcFileStore
+        :return: OhlcFileStore instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                config_service = ConfigService.get_instance()
+                cls.instance = OhlcFileStore(
+                    path=config_service.get_or_default('cache.store.path', default='data/ohlc'),
+                    max_bytes=int(config_service.get_or_default('cache.store.max_bytes',
+                                                                default=1024 * 1024 * 1024)),
+                    max_segments=int(config_service.get_or_default('cache.store.max_segments', default=8)))
+            return cls.instance
+
+    def get_ranges(self, symbol: str) -> DateRangeSet:
+        """
+        This method returns the date ranges for which the store holds data for the symbol
+        :param symbol: ticker symbol
+        :return: DateRangeSet
+        """
+        with self.lock:
+            meta = self.load_meta(symbol)
+            if meta is None:
+                return DateRangeSet()
+            return DateRangeSet.from_list(meta['ranges'])
+
+    def covers(self, symbol: str, start_date: date, end_date: date) -> bool:
+        return self.get_ranges(symbol).contains(start_date, end_date)
+
+    def read(self, symbol: str, start_date: date, end_date: date) -> Optional[np.ndarray]:
+        """
+        This method reads the candles of the symbol between start_date and end_date (inclusive). The base file is
+        memory mapped, so if the ticker is compacted the returned matrix is a view on the file
+        :param symbol: ticker symbol
+        :param start_date: start date
+        :param end_date: end date
+        :return: (6, n) matrix or None if the symbol is not present in the store
+        """
+        matrix, _ = self.read_matrix(symbol)
+        if matrix is None:
+            return None
+        start_index = np.searchsorted(matrix[0], to_epoch_day(start_date), side='left')
+        end_index = np.searchsorted(matrix[0], to_epoch_day(end_date), side='right')
+        return matrix[:, start_index:end_index]
+
+    def load(self, symbol: str) -> tuple[Optional[np.ndarray], DateRangeSet]:
+        """
+        This method reads all the candles of the symbol along with the date ranges they cover
+        :param symbol: ticker symbol
+        :return: tuple of (6, n) matrix (None if the symbol is not present) and DateRangeSet
+        """
+        matrix, meta = self.read_matrix(symbol)
+        if matrix is None:
+            return None, DateRangeSet()
+        return matrix, DateRangeSet.from_list(meta['ranges'])
+
+    def get_intraday(self, symbol: str) -> Optional[list]:
+        """
+        This method returns the day of the symbol whose candle was stored while its session was running
+        :param symbol: ticker symbol
+        :return: [epoch day, epoch seconds after which the day counts as missing], None if every candle is final
+        """
+        with self.lock:
+            meta = self.load_meta(symbol)
+            return None if meta is None else meta.get('intraday')
+
+    def read_matrix(self, symbol: str) -> tuple[Optional[np.ndarray], Optional[dict]]:
+        # another process can compact or evict the symbol while it is read, the meta is loaded again then
+        with self.lock:
+            for _ in range(3):
+                meta = self.load_meta(symbol)
+                if meta is None:
+                    return None, None
+                try:
+                    matrix = self.read_all(symbol, meta)
+                    # touch the directory of the symbol, its modification time is used for LRU eviction
+                    os.utime(self.get_dir(symbol))
+                    return matrix, meta
+                except FileNotFoundError:
+                    self.meta_cache.pop(symbol, None)
+            return None, None
+
+    def write(self, symbol: str, start_date: date, end_date: date, matrix: np.ndarray,
+              intraday_until: float = None) -> None:
+        """
+        This method stores the candles fetched for the symbol between start_date and end_date (inclusive)
+        :param symbol: ticker symbol
+        :param start_date: start date of the fetched range
+        :param end_date: end date of the fetched range
+        :param matrix: (6, n) matrix of candles
+        :param intraday_until: set when the candle of end_date belongs to a running session, epoch seconds after
+        which that day counts as missing again (the close of the session)
+        :return: None
+        """
+        with self.writing():
+            os.makedirs(self.get_dir(symbol), exist_ok=True)
+            meta = self.load_meta(symbol) or {'ranges': [], 'segments': [], 'next_segment': 0}
+            if not os.path.exists(self.get_file(symbol, BASE_FILE)):
+                self.save_matrix(self.get_file(symbol, BASE_FILE), matrix)
+            else:
+                segment = f"seg_{meta['next_segment']}.npy"
+                self.save_matrix(self.get_file(symbol, segment), matrix)
+                meta['segments'].append(segment)
+                meta['next_segment'] += 1
+            ranges = DateRangeSet.from_list(meta['ranges'])
+            ranges.add(start_date, end_date)
+            meta['ranges'] = ranges.to_list()
+            intraday = update_intraday(meta.get('intraday'), start_date, end_date, intraday_until)
+            if intraday is None:
+                meta.pop('intraday', None)
+            else:
+                meta['intraday'] = intraday
+            # meta is written after the data, so that the store never claims data it does not have
+            self.save_meta(symbol, meta)
+            if len(meta['segments']) >= self.max_segments:
+                self.compact(symbol)
+            self.update_size(symbol)
+            self.evict(keep=symbol)
+
+    def compact(self, symbol: str) -> None:
+        """
+        This method merges the appended segments of the symbol into its base file
+        :param symbol: ticker symbol
+        :return: None
+        """
+        with self.writing():
+            meta = self.load_meta(symbol)
+            if meta is None or not meta['segments']:
+                return
+            self.logger.info('Compacting %s segments of %s', len(meta['segments']), symbol)
+            matrix = np.array(self.read_all(symbol, meta))
+            self.save_matrix(self.get_file(symbol, BASE_FILE), matrix)
+            segments = meta['segments']
+            meta['segments'] = []
+            self.save_meta(symbol, meta)
+            for segment in segments:
+                os.remove(self.get_file(symbol, segment))
+            self.update_size(symbol)
+
+    def compact_all(self) -> None:
+        for symbol in self.get_symbols():
+            self.compact(symbol)
+
+    def evict(self, keep: str = None) -> None:
+        """
+        This method evicts the least recently used symbols until the store fits in max_bytes
+        :param keep: symbol that must not be evicted
+        :return: None
+        """
+        with self.writing():
+            sizes = self.get_sizes()
+            total_bytes = sum(sizes.values())
+            if total_bytes <= self.max_bytes:
+                return
+            last_access = {}
+            for symbol in sizes:
+                symbol_dir = self.get_dir(symbol)
+                last_access[symbol] = os.path.getmtime(symbol_dir) if os.path.exists(symbol_dir) else 0
+            for symbol in sorted(last_access, key=last_access.get):
+                if total_bytes <= self.max_bytes:
+                    break
+                if symbol == keep:
+                    continue
+                self.logger.info('Evicting %s from the store', symbol)
+                total_bytes -= sizes.pop(symbol)
+                self.meta_cache.pop(symbol, None)
+                shutil.rmtree(self.get_dir(symbol), ignore_errors=True)
+
+    def fetch_lock(self, symbol: str) -> FileLock:
+        """
+        This method returns the lock taken while the candles of the symbol are fetched, so that only one worker
+        process fetches a symbol at a time and the others read the result from the store
+        :param symbol: ticker symbol
+        :return: FileLock
+        """
+        return FileLock(os.path.join(self.path, FETCH_LOCKS_DIR, quote(symbol, safe='') + '.lock'))
+
+    @contextmanager
+    def writing(self):
+        # holds the write lock of the store. The cached sizes are dropped if another process wrote since the last
+        # write of this process, the generation file counts the writes
+        with self.lock, self.write_lock:
+            generation = self.read_generation()
+            if generation != self.generation:
+                self.sizes = None
+            yield
+            self.generation = generation + 1
+            self.atomic_write(os.path.join(self.path, GENERATION_FILE),
+                              lambda f: f.write(str(self.generation).encode('utf-8')))
+
+    def read_generation(self) -> int:
+        try:
+            with open(os.path.join(self.path, GENERATION_FILE), 'r', encoding='utf-8') as text_file:
+                return int(text_file.read() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def read_all(self, symbol: str, meta: dict) -> np.ndarray:
+        matrix = np.load(self.get_file(symbol, BASE_FILE), mmap_mode='r')
+        if not meta['segments']:
+            return matrix
+        matrices = [matrix] + [np.load(self.get_file(symbol, segment)) for segment in meta['segments']]
+        return merge_matrices(matrices)
+
+    def load_meta(self, symbol: str) -> Optional[dict]:
+        # the cached meta is used as long as no process replaced the meta file
+        meta_file = self.get_file(symbol, META_FILE)
+        try:
+            stamp = get_stamp(meta_file)
+            cached = self.meta_cache.get(symbol)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+            with open(meta_file, 'r', encoding='utf-8') as text_file:
+                meta = json.load(text_file)
+        except FileNotFoundError:
+            self.meta_cache.pop(symbol, None)
+            return None
+        self.meta_cache[symbol] = (stamp, meta)
+        return meta
+
+    def save_meta(self, symbol: str, meta: dict) -> None:
+        meta_file = self.get_file(symbol, META_FILE)
+        self.atomic_write(meta_file, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+        self.meta_cache[symbol] = (get_stamp(meta_file), meta)
+
+    def save_matrix(self, file: str, matrix: np.ndarray) -> None:
+        self.atomic_write(file, lambda f: np.save(f, np.ascontiguousarray(matrix, dtype=np.float64)))
+
+    @staticmethod
+    def atomic_write(file: str, writer) -> None:
+        # write to a temporary file and rename it, so that readers never see a partially written file
+        file_descriptor, temp_file = tempfile.mkstemp(dir=os.path.dirname(file), suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as binary_file:
+            writer(binary_file)
+        os.replace(temp_file, file)
+
+    def get_sizes(self) -> dict[str, int]:
+        if self.sizes is None:
+            self.sizes = {symbol: self.get_dir_size(symbol) for symbol in self.get_symbols()}
+        return self.sizes
+
+    def update_size(self, symbol: str) -> None:
+        self.get_sizes()[symbol] = self.get_dir_size(symbol)
+
+    def get_dir_size(self, symbol: str) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.get_dir(symbol)) if entry.is_file())
+
+    def get_symbols(self) -> list[str]:
+        # lock files live in dot directories
+        return [unquote(entry.name) for entry in os.scandir(self.path)
+                if entry.is_dir() and not entry.name.startswith('.')]
+
+    def get_dir(self, symbol: str) -> str:
+        # symbols like 'M&M' or 'NIFTY 50' are quoted to get a safe directory name
+        return os.path.join(self.path, quote(symbol, safe=''))
+
+    def get_file(self, symbol: str, file_name: str) -> str:
+        return os.path.join(self.get_dir(symbol), file_name)
+
+
+def merge_matrices(matrices: list[np.ndarray]) -> np.ndarray:
+    """
+    This function merges candle matrices into one matrix sorted by date. If a date is present in more than one
+    matrix, the candle from the last matrix wins
+    :param matrices: list of (6, n) matrices
+    :return: merged (6, n) matrix
+    """
+    merged = np.concatenate(matrices[::-1], axis=1)
+    _, first_indices = np.unique(merged[0], return_index=True)
+    return merged[:, first_indices]
+
+
+def update_intraday(intraday: Optional[list], start_date: date, end_date: date,
+                    intraday_until: float = None) -> Optional[list]:
+    """
+    This function returns the intraday marker of a symbol after the candles between start_date and end_date were
+    saved: the marker of a day fetched again is dropped, and end_date is marked when intraday_until is given
+    :param intraday: [epoch day, expiry in epoch seconds] or None
+    :param start_date: start date of the saved range
+    :param end_date: end date of the saved range
+    :param intraday_until: expiry of the candle of end_date, None if the candles are final
+    :return: new marker or None
+    """
+    if intraday_until is not None:
+        return [to_epoch_day(end_date), intraday_until]
+    if intraday is not None and to_epoch_day(start_date) <= intraday[0] <= to_epoch_day(end_date):
+        return None
+    return intraday
+
+
+def get_stamp(file: str) -> tuple:
+    # identifies a version of a file, files are replaced atomically so a new version is a new inode
+    stat = os.stat(file)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def to_epoch_day(day: date) -> int:
+    return (day - EPOCH).days
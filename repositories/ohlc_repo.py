@@ -1,6 +1,102 @@
+import io
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from model.Ohlcv import OhlcData
 from repositories.base_repository import BaseRepository
 
+OHLC_TABLE = 'ohlc'
+
+CREATE_TABLE_QUERY = f"""
+CREATE TABLE IF NOT EXISTS {OHLC_TABLE} (
+    symbol TEXT NOT NULL,
+    trade_date DATE NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    volume DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (symbol, trade_date)
+)
+"""
+
+UPSERT_FROM_STAGING_QUERY = f"""
+INSERT INTO {OHLC_TABLE} (symbol, trade_date, open, high, low, close, volume)
+SELECT symbol, trade_date, open, high, low, close, volume FROM ohlc_staging
+ON CONFLICT (symbol, trade_date) DO UPDATE SET
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    volume = EXCLUDED.volume
+"""
+
+# dates are returned as days since epoch, so that they can be decoded straight into the candle matrix
+SELECT_RANGE_QUERY = f"""
+SELECT symbol, trade_date - DATE '1970-01-01', open, high, low, close, volume
+FROM {OHLC_TABLE}
+WHERE symbol = ANY(%s) AND trade_date BETWEEN %s AND %s
+ORDER BY symbol, trade_date
+"""
+
 
 class OhlcRepository(BaseRepository):
-    def get_data_from_db(self, ticker, start_date, end_date):
-        pass
+    def create_schema(self) -> None:
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(CREATE_TABLE_QUERY)
+
+    def save_data(self, ohlc_dataset: list[OhlcData]) -> None:
+        # candles are streamed into a staging table using COPY and then upserted in a single statement
+        frames = []
+        for ohlc_data in ohlc_dataset:
+            matrix = ohlc_data.to_matrix()
+            frames.append(pd.DataFrame({
+                'symbol': ohlc_data.ticker,
+                'trade_date': matrix[0].astype(np.int64).astype('datetime64[D]').astype(str),
+                'open': matrix[1],
+                'high': matrix[2],
+                'low': matrix[3],
+                'close': matrix[4],
+                'volume': matrix[5]
+            }))
+        if not frames:
+            return
+        # a candle saved twice in the batch would make the upsert update the same row twice, which postgres
+        # refuses, so only the last one is kept
+        data_frame = pd.concat(frames).drop_duplicates(['symbol', 'trade_date'], keep='last')
+        buffer = io.StringIO()
+        data_frame.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        with self.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(f'CREATE TEMP TABLE ohlc_staging (LIKE {OHLC_TABLE} INCLUDING DEFAULTS) ON COMMIT DROP')
+            cursor.copy_expert('COPY ohlc_staging (symbol, trade_date, open, high, low, close, volume) '
+                               'FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.execute(UPSERT_FROM_STAGING_QUERY)
+
+    def get_data_from_db(self, ticker, start_date, end_date) -> OhlcData:
+        return self.get_data_many_from_db([ticker], start_date, end_date)[ticker]
+
+    def get_data_many_from_db(self, tickers: list[str], start_date: date, end_date: date) -> dict[str, OhlcData]:
+        # the whole universe is read in one round trip using COPY and decoded into one matrix per ticker
+        buffer = io.StringIO()
+        with self.connection() as conn, conn.cursor() as cursor:
+            query = cursor.mogrify(SELECT_RANGE_QUERY, (list(tickers), start_date, end_date)).decode('utf-8')
+            cursor.copy_expert(f'COPY ({query}) TO STDOUT WITH (FORMAT csv)', buffer)
+        buffer.seek(0)
+        result = {ticker: OhlcData.default_obj(ticker) for ticker in tickers}
+        if buffer.getvalue() == '':
+            return result
+        data_df = pd.read_csv(buffer, header=None, dtype={0: str},
+                              names=['symbol', 'date', 'open', 'high', 'low', 'close', 'volume'])
+        symbols = data_df['symbol'].to_numpy()
+        matrix = data_df[['date', 'open', 'high', 'low', 'close', 'volume']].to_numpy(dtype=np.float64).T
+        # rows are grouped by symbol, so every symbol is a contiguous block of columns
+        unique_symbols, start_indices = np.unique(symbols, return_index=True)
+        order = np.argsort(start_indices)
+        unique_symbols, start_indices = unique_symbols[order], start_indices[order]
+        end_indices = np.append(start_indices[1:], len(symbols))
+        for symbol, start_index, end_index in zip(unique_symbols, start_indices, end_indices):
+            result[symbol] = OhlcData.from_matrix(symbol, matrix[:, start_index:end_index])
+        return result
@@ -0,0 +1,117 @@
+"""
+This module contains BacktestService class which runs the momentum strategy over a historical date range
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Optional
+
+from constants import constants as constants
+from model.backtest.backtest_data import BacktestData
+from model.backtest.backtest_result import BacktestResult
+from model.backtest.backtester import Backtester, BacktestParameters
+from model.index_membership import IndexMembership
+from model.scheduling.frequency import DayOfWeek
+from services.config_service import ConfigService
+from services.constituents_service import ConstituentsService
+from services.index_service import IndexDataService
+from services.ticker_historical_data import TickerDataService
+
+INDEX = 'NIFTY 50'
+
+
+class BacktestService:
+    """
+    This service loads the history of the stock universe (from the candle cache, only missing candles are fetched)
+    and replays the strategy configured in app.properties over it
+    """
+
+    def __init__(self, ticker_data_service: TickerDataService = None) -> None:
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.config_service = ConfigService.get_instance()
+        self.ticker_data_service = ticker_data_service or TickerDataService()
+        self.index_service = IndexDataService()
+
+    def get_parameters(self) -> BacktestParameters:
+        """
+        This method reads the strategy parameters from app.properties, with the defaults of StrategyExecutor
+        :return: BacktestParameters
+        """
+        config_service = self.config_service
+        return BacktestParameters(
+            num_days=int(config_service.get_or_default('num_days', default=90)),
+            top_n_percent=int(config_service.get_or_default('top_n_percent', default=20)),
+            risk_factor=float(config_service.get_or_default('risk_factor', default=0.003)),
+            ticker_ema_span=int(config_service.get_or_default('ticker_ema_span', default=100)),
+            atr_period=int(config_service.get_or_default('atr_period', default=20)),
+            index_ema_span=int(config_service.get_or_default('index_ema_span', default=200)),
+            threshold=float(config_service.get_or_default('threshold', default=0.0025)),
+            max_gap_percent=float(config_service.get_or_default('max_gap_percent', default=19.1)),
+            num_historical_lookup_days=int(config_service.get_or_default('num_historical_lookup_days', default=365)),
+            default_historical_lookup_days=int(
+                config_service.get_or_default('default_historical_lookup_days', default=365)),
+            trade_day=DayOfWeek.from_string(config_service.get(constants.TRADE_DAY_KEY), default=DayOfWeek.WEDNESDAY))
+
+    def get_stock_universe(self) -> list[str]:
+        index = self.config_service.get(constants.STOCK_UNIVERSE_INDEX_KEY)
+        return self.index_service.get_index_constituents(index)
+
+    def get_membership(self, start_date: date) -> Optional[IndexMembership]:
+        """
+        This method returns the point-in-time membership of the configured index if the stored snapshots go back to
+        start_date, so that the backtest ranks only the constituents of each date
+        :param start_date: first date of the backtest
+        :return: IndexMembership, None if the history of the index does not cover the backtest
+        """
+        index = self.config_service.get(constants.STOCK_UNIVERSE_INDEX_KEY)
+        membership = ConstituentsService.get_instance().get_membership(index)
+        if membership is None or membership.first_date > start_date:
+            self.logger.warning('Constituents of %s are not known on %s, the backtest uses today\'s constituents and '
+                                'has survivorship bias', index, start_date)
+            return None
+        return membership
+
+    def load_data(self, stock_universe: list[str], start_date: date, end_date: date,
+                  lookup_days: int) -> BacktestData:
+        """
+        This method loads the candles of the universe and of the index, starting lookup_days before start_date so
+        that the indicators are warmed up on the first day of the backtest
+        :param stock_universe: tickers of the universe
+        :param start_date: first date of the backtest
+        :param end_date: last date of the backtest
+        :param lookup_days: number of calendar days of history needed before start_date
+        :return: BacktestData
+        """
+        history_start_date = start_date - timedelta(lookup_days)
+        self.logger.info('Loading %s tickers from %s to %s', len(stock_universe), history_start_date, end_date)
+        fetch_result = self.ticker_data_service.get_data_many(stock_universe, history_start_date, end_date)
+        for ticker, reason in fetch_result.failures.items():
+            self.logger.error('Skipping %s as data could not be fetched: %s', ticker, reason)
+        index_data = self.ticker_data_service.get_data(INDEX, history_start_date, end_date)
+        return BacktestData.from_ohlc_data(fetch_result.get_data(), index_data)
+
+    def run(self, start_date: date, end_date: date, initial_capital: float,
+            parameters: BacktestParameters = None, stock_universe: list[str] = None) -> BacktestResult:
+        """
+        This method runs a backtest
+        :param start_date: first date of the backtest
+        :param end_date: last date of the backtest
+        :param initial_capital: cash at the start of the backtest
+        :param parameters: strategy parameters, defaults to the ones in app.properties
+        :param stock_universe: tickers of the universe, defaults to every ticker that was a constituent of the
+        configured index during the backtest, ranked only while it was a constituent
+        :return: BacktestResult
+        """
+        parameters = parameters or self.get_parameters()
+        membership = None
+        if stock_universe is None:
+            membership = self.get_membership(start_date)
+            if membership is not None:
+                stock_universe = membership.members_between(start_date, end_date)
+            else:
+                stock_universe = self.get_stock_universe()
+        lookup_days = max(parameters.num_historical_lookup_days, parameters.default_historical_lookup_days)
+        data = self.load_data(stock_universe, start_date, end_date, lookup_days)
+        self.logger.info('Running backtest from %s to %s', start_date, end_date)
+        return Backtester(data, parameters, membership=membership).run(start_date, end_date, initial_capital)
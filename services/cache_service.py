@@ -1,34 +1,199 @@
 import logging
-from datetime import date
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
 
+import numpy as np
+
+from model.date_range_set import DateRangeSet
 from model.Ohlcv import OhlcData
+from repositories.ohlc_file_store import EPOCH, OhlcFileStore, merge_matrices, to_epoch_day, update_intraday
+from model.scheduling.trading_calendar import MARKET_TIMEZONE, TradingCalendar
+from services.config_service import ConfigService
+from services.memory_cache import MemoryCache
+
+
+class CacheEntry:
+    """
+    Candles held for a symbol along with the date ranges they cover
+    """
+
+    def __init__(self, matrix: np.ndarray, ranges: DateRangeSet, intraday: list = None) -> None:
+        super().__init__()
+        self.matrix = matrix
+        self.ranges = ranges
+        # [epoch day, expiry] of a candle saved while its session was running, see OhlcFileStore.get_intraday
+        self.intraday = intraday
+
+    def missing(self, start_date: date, end_date: date, now: float = None) -> list[tuple[date, date]]:
+        """
+        Returns the parts of the date range that are not covered. The day of an intraday candle is covered until
+        the close of its session
+        """
+        missing_ranges = self.ranges.missing(start_date, end_date)
+        if self.intraday is None or (now if now is not None else time.time()) < self.intraday[1]:
+            return missing_ranges
+        day = EPOCH + timedelta(days=int(self.intraday[0]))
+        if start_date <= day <= end_date and not any(start <= day <= end for start, end in missing_ranges):
+            missing_ranges = sorted(missing_ranges + [(day, day)])
+        return missing_ranges
 
 
 class CacheService:
+    """
+    Range aware candle cache. For every symbol the cache keeps the candles it has seen merged into one matrix and
+    the date ranges these candles cover, so any sub-range can be served from the cache and only the missing days
+    need to be fetched. When the server runs several worker processes they share the candles through the store:
+    a range missing in memory is looked up in the store before it is reported missing, and fetch_lock makes sure
+    only one worker fetches a symbol at a time.
+
+    The entries in memory are bounded by cache.memory.max_bytes, the least recently used symbols are evicted. An
+    entry expires at the next market close and is reloaded from the store, in the background during the first
+    cache.memory.stale_seconds after the close (the expired entry is served meanwhile).
+    """
     instance = None
+    instance_lock = threading.Lock()
 
-    def __init__(self) -> None:
+    def __init__(self, store: OhlcFileStore = None, trading_calendar: TradingCalendar = None) -> None:
+        """
+        This method initializes CacheService object
+        :param store: store of the candles, OhlcFileStore.get_instance() if cache.store.enabled by default
+        :param trading_calendar: calendar telling which candles are final, TradingCalendar.get_instance() by default
+        """
         super().__init__()
         self.logger = logging.getLogger(__name__)
-        self.cache = {}
+        self.lock = threading.RLock()
+        # symbol -> lock used by fetch_lock when there is no store
+        self.fetch_locks: dict[str, threading.Lock] = {}
+        config_service = ConfigService.get_instance()
+        self.trading_calendar = trading_calendar or TradingCalendar.get_instance()
+        self.cache = MemoryCache(
+            'candles',
+            max_bytes=int(config_service.get_or_default('cache.memory.max_bytes', default=256 * 1024 * 1024)),
+            expiry=self.trading_calendar.next_close,
+            stale_seconds=float(config_service.get_or_default('cache.memory.stale_seconds', default=3600)))
+        # candles are also persisted on disk, so that they survive a restart
+        if store is None:
+            store_enabled = str(config_service.get_or_default('cache.store.enabled', default='True')) == 'True'
+            store = OhlcFileStore.get_instance() if store_enabled else None
+        self.store = store
+
+    def get_missing_ranges(self, symbol: str, start_date: date, end_date: date) -> list[tuple[date, date]]:
+        """
+        Returns the parts of the date range that are not present in the cache
+        """
+        entry = self.get_entry(symbol)
+        if entry is None:
+            return [(start_date, end_date)]
+        missing_ranges = entry.missing(start_date, end_date)
+        if missing_ranges and self.store is not None:
+            # another worker process may have stored the missing days since the entry was loaded
+            entry = self.refresh_entry(symbol)
+            if entry is None:
+                return [(start_date, end_date)]
+            missing_ranges = entry.missing(start_date, end_date)
+        return missing_ranges
 
     def is_data_present(self, symbol: str, start_date: date, end_date: date) -> bool:
-        self.logger.info(f'Checking if data is present in cache for {symbol} from {start_date} to {end_date}')
-        key = f'{symbol}_{start_date}_{end_date}'
-        return key in self.cache
+        self.logger.info('Checking if data is present in cache for %s from %s to %s', symbol, start_date, end_date)
+        return len(self.get_missing_ranges(symbol, start_date, end_date)) == 0
 
     def get_data(self, symbol: str, start_date: date, end_date: date) -> OhlcData:
-        self.logger.info(f'Fetching data from cache for {symbol} from {start_date} to {end_date}')
-        key = f'{symbol}_{start_date}_{end_date}'
-        return self.cache[key]
+        self.logger.info('Fetching data from cache for %s from %s to %s', symbol, start_date, end_date)
+        entry = self.get_entry(symbol)
+        if entry is None:
+            return OhlcData.default_obj(symbol)
+        dates = entry.matrix[0]
+        start_index = np.searchsorted(dates, to_epoch_day(start_date), side='left')
+        end_index = np.searchsorted(dates, to_epoch_day(end_date), side='right')
+        return OhlcData.from_matrix(symbol, entry.matrix[:, start_index:end_index])
+
+    def get_last_price(self, symbol: str, min_date: date) -> Optional[float]:
+        """
+        Returns the close of the latest candle in the cache, None if there is no candle on or after min_date
+        """
+        entry = self.get_entry(symbol)
+        if entry is None or entry.matrix.shape[1] == 0 or entry.matrix[0, -1] < to_epoch_day(min_date):
+            return None
+        # rows of the matrix are date, open, high, low, close and volume
+        return float(entry.matrix[4, -1])
 
     def save_data(self, symbol: str, start_date: date, end_date: date, data: OhlcData) -> None:
-        self.logger.info(f'Saving data to cache for {symbol} from {start_date} to {end_date}')
-        key = f'{symbol}_{start_date}_{end_date}'
-        self.cache[key] = data
+        self.logger.info('Saving data to cache for %s from %s to %s', symbol, start_date, end_date)
+        matrix = data.to_matrix()
+        # Days after today have no candle yet and are left uncovered. The candle of a running session can still
+        # change: it is covered until the close, after which the day counts as missing and is fetched again. Once
+        # the market has closed, and on days without a session, the candles up to today are final.
+        now = time.time()
+        last_closed_day = self.trading_calendar.last_closed_day(now)
+        today = datetime.fromtimestamp(now, MARKET_TIMEZONE).date()
+        covered_end_date = min(end_date, today)
+        intraday_until = self.trading_calendar.next_close(now) if covered_end_date > last_closed_day else None
+        if covered_end_date < start_date:
+            return
+        with self.lock:
+            entry = self.get_entry(symbol)
+            if entry is None:
+                entry = CacheEntry(matrix, DateRangeSet())
+            else:
+                entry.matrix = merge_matrices([entry.matrix, matrix])
+            entry.ranges.add(start_date, covered_end_date)
+            entry.intraday = update_intraday(entry.intraday, start_date, covered_end_date, intraday_until)
+            # put again so that the memory budget accounts for the merged matrix
+            self.cache.put(symbol, entry)
+        if self.store is not None:
+            self.store.write(symbol, start_date, covered_end_date, matrix, intraday_until=intraday_until)
+
+    def fetch_lock(self, symbol: str):
+        """
+        This method returns the lock to hold while the candles of the symbol are fetched and saved. Callers check
+        the missing ranges again once they hold it, another thread or worker may have fetched them meanwhile
+        :param symbol: ticker symbol
+        :return: a lock usable as a context manager
+        """
+        if self.store is not None:
+            return self.store.fetch_lock(symbol)
+        with self.lock:
+            return self.fetch_locks.setdefault(symbol, threading.Lock())
+
+    def refresh_entry(self, symbol: str) -> Optional[CacheEntry]:
+        # the store holds everything this process saved, so its candles replace the entry when it covers more days
+        with self.lock:
+            entry = self.get_entry(symbol)
+            if entry is not None and self.store.get_ranges(symbol).ranges == entry.ranges.ranges and \
+                    self.store.get_intraday(symbol) == entry.intraday:
+                return entry
+            stored_entry = self.load_entry(symbol)
+            if stored_entry is not None:
+                entry = stored_entry
+                self.cache.put(symbol, entry)
+            return entry
+
+    def get_entry(self, symbol: str) -> Optional[CacheEntry]:
+        return self.cache.get_or_load(symbol, lambda: self.load_entry(symbol))
+
+    def load_entry(self, symbol: str) -> Optional[CacheEntry]:
+        if self.store is None:
+            return None
+        matrix, ranges = self.store.load(symbol)
+        if matrix is None:
+            return None
+        return CacheEntry(matrix, ranges, self.store.get_intraday(symbol))
+
+    def get_stats(self) -> dict:
+        """
+        Returns the size of the cache in memory and its hit, miss and eviction counters
+        """
+        return self.cache.get_stats()
 
     @classmethod
-    def get_instance(cls):
-        if cls.instance is None:
-            cls.instance = CacheService()
-        return cls.instance
+    def get_instance(cls) -> 'CacheService':
+        """
+        This method returns the singleton instance of CacheService
+        :return: CacheService instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                cls.instance = CacheService()
+            return cls.instance
@@ -0,0 +1,131 @@
+"""
+This module contains ConstituentsService class which serves the constituents of the indices from the local store
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Optional
+
+from clients.nse_client import NSEClient, parse_stock_universe
+from model.index_membership import IndexMembership
+from repositories.constituents_store import ConstituentsStore
+from services.config_service import ConfigService
+
+
+class ConstituentsService:
+    """
+    This service returns the constituents of an index from the ConstituentsStore. Index lists change only at the
+    reconstitutions, so a list older than max_age_seconds is still served and refreshed in the background with a
+    conditional request (ETag / Last-Modified). NSE is called in the foreground only the first time an index is seen
+    """
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self, store: ConstituentsStore = None, nse_client: NSEClient = None,
+                 max_age_seconds: float = None) -> None:
+        """
+        This method initializes ConstituentsService object
+        :param store: store of the constituents
+        :param nse_client: client used to download the constituents
+        :param max_age_seconds: age after which the constituents are refreshed, constituents.max_age_hours by default
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.store = store or ConstituentsStore.get_instance()
+        self.nse_client = nse_client or NSEClient.get_instance()
+        if max_age_seconds is None:
+            config_service = ConfigService.get_instance()
+            max_age_seconds = float(config_service.get_or_default('constituents.max_age_hours', default=24)) * 3600
+        self.max_age_seconds = max_age_seconds
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='constituents-refresh')
+        self.lock = threading.Lock()
+        # indices being refreshed in the background
+        self.refreshing: set[str] = set()
+
+    @classmethod
+    def get_instance(cls) -> 'ConstituentsService':
+        """
+        This method returns the singleton instance of ConstituentsService
+        :return: ConstituentsService instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                cls.instance = ConstituentsService()
+            return cls.instance
+
+    def get_constituents(self, index: str) -> list[str]:
+        """
+        This method returns the latest constituents of an index
+        :param index: index name (e.g. NIFTY 50)
+        :return: list of symbols
+        """
+        meta = self.store.get_meta(index)
+        if meta is None or not meta['snapshots']:
+            self.refresh(index)
+            return self.store.get(index)
+        if time.time() - meta.get('fetched_at', 0) > self.max_age_seconds:
+            self.refresh_in_background(index)
+        return self.store.get(index)
+
+    def get_constituents_as_of(self, index: str, day: date) -> Optional[list[str]]:
+        """
+        This method returns the constituents of an index as of a past date from the dated snapshots, without a
+        network call
+        :param index: index name
+        :param day: date
+        :return: list of symbols, None if there is no snapshot on or before the date
+        """
+        return self.store.get_as_of(index, day)
+
+    def get_membership(self, index: str) -> Optional[IndexMembership]:
+        """
+        This method returns the point-in-time membership of an index built from its dated snapshots
+        :param index: index name
+        :return: IndexMembership, None if the index is not in the store
+        """
+        snapshot_dates = self.store.get_snapshot_dates(index)
+        if not snapshot_dates:
+            return None
+        return IndexMembership.from_snapshots(index, [(snapshot_date, self.store.read_snapshot(index, snapshot_date))
+                                                      for snapshot_date in snapshot_dates])
+
+    def refresh(self, index: str) -> bool:
+        """
+        This method downloads the constituents of an index if they changed since the last download
+        :param index: index name
+        :return: True if the constituents changed
+        """
+        meta = self.store.get_meta(index) or {}
+        response = self.nse_client.fetch_stock_universe(index, etag=meta.get('etag'),
+                                                        last_modified=meta.get('last_modified'))
+        if response.status_code == 304:
+            self.logger.info('Constituents of %s did not change', index)
+            self.store.touch(index)
+            return False
+        changed = self.store.save(index, parse_stock_universe(response.content),
+                                  sha256=hashlib.sha256(response.content).hexdigest(),
+                                  etag=response.headers.get('ETag'),
+                                  last_modified=response.headers.get('Last-Modified'))
+        self.logger.info('Constituents of %s %s', index, 'changed' if changed else 'did not change')
+        return changed
+
+    def refresh_in_background(self, index: str) -> None:
+        with self.lock:
+            if index in self.refreshing:
+                return
+            self.refreshing.add(index)
+        self.executor.submit(self.run_refresh, index)
+
+    def run_refresh(self, index: str) -> None:
+        try:
+            self.refresh(index)
+        except Exception as e:
+            # the stored constituents are served until a refresh succeeds
+            self.logger.warning('Could not refresh the constituents of %s: %s', index, e)
+        finally:
+            with self.lock:
+                self.refreshing.discard(index)
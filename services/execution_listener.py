@@ -0,0 +1,113 @@
+"""
+This module contains ExecutionListener class which is notified as a strategy run moves through its stages
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from services.metrics import MetricsRegistry
+
+# stages of a strategy run, in the order they start
+STAGES = ['constituents', 'company_info', 'fetch', 'rank', 'rebalance', 'size', 'regime', 'persist']
+
+
+class ExecutionListener:
+    """
+    This class receives the progress of a strategy run. The methods do nothing, subclasses override the ones they
+    need. Listeners are called from the threads doing the work and must be thread safe
+    """
+
+    def on_stage_start(self, stage: str) -> None:
+        pass
+
+    def on_stage_end(self, stage: str, elapsed: float, error: str = None) -> None:
+        """
+        :param stage: name of the stage
+        :param elapsed: seconds spent in the stage
+        :param error: error message if the stage failed
+        """
+        pass
+
+    def on_progress(self, stage: str, done: int, total: int) -> None:
+        """
+        :param stage: name of the stage
+        :param done: number of items processed so far
+        :param total: number of items to process
+        """
+        pass
+
+    def on_ticker_fetched(self, ticker: str, from_cache: Optional[bool], done: int, total: int) -> None:
+        """
+        This method is called as the candles of every ticker arrive during the fetch stage. By default it reports
+        the progress of the fetch stage
+        :param ticker: ticker symbol
+        :param from_cache: whether the candles came from the cache without a network call, None if unknown
+        :param done: number of tickers fetched so far
+        :param total: number of tickers to fetch
+        """
+        self.on_progress('fetch', done, total)
+
+    def on_ranking_rows(self, rows: list[dict]) -> None:
+        """
+        This method receives ranking rows as soon as they are scored, in the order of the ranking
+        :param rows: rows with the ranking columns and their rank (1 is the best)
+        """
+        pass
+
+    @contextmanager
+    def stage(self, stage: str):
+        """
+        This method reports the start and the end of a stage around a block of code
+        :param stage: name of the stage
+        """
+        self.on_stage_start(stage)
+        start_time = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.on_stage_end(stage, time.perf_counter() - start_time, str(e))
+            raise
+        self.on_stage_end(stage, time.perf_counter() - start_time)
+
+
+class MetricsExecutionListener(ExecutionListener):
+    """
+    This listener records the duration of every stage and the source of the candles of every ticker in the
+    MetricsRegistry, and forwards every notification to the listener it wraps
+    """
+
+    def __init__(self, listener: ExecutionListener = None) -> None:
+        """
+        This method initializes MetricsExecutionListener object
+        :param listener: listener the notifications are forwarded to
+        """
+        super().__init__()
+        self.listener = listener or ExecutionListener()
+        registry = MetricsRegistry.get_instance()
+        self.stage_duration = registry.histogram('strategy_stage_duration_seconds',
+                                                 'Seconds spent in every stage of a strategy run', ('stage',))
+        self.stage_errors = registry.counter('strategy_stage_errors', 'Stages of strategy runs that failed',
+                                             ('stage',))
+        self.ticker_fetches = registry.counter('ticker_fetches',
+                                               'Tickers whose candles were fetched, by source (cache or network)',
+                                               ('source',))
+
+    def on_stage_start(self, stage: str) -> None:
+        self.listener.on_stage_start(stage)
+
+    def on_stage_end(self, stage: str, elapsed: float, error: str = None) -> None:
+        self.stage_duration.observe(elapsed, stage=stage)
+        if error is not None:
+            self.stage_errors.inc(stage=stage)
+        self.listener.on_stage_end(stage, elapsed, error)
+
+    def on_progress(self, stage: str, done: int, total: int) -> None:
+        self.listener.on_progress(stage, done, total)
+
+    def on_ticker_fetched(self, ticker: str, from_cache: Optional[bool], done: int, total: int) -> None:
+        self.ticker_fetches.inc(source='unknown' if from_cache is None else 'cache' if from_cache else 'network')
+        self.listener.on_ticker_fetched(ticker, from_cache, done, total)
+
+    def on_ranking_rows(self, rows: list[dict]) -> None:
+        self.listener.on_ranking_rows(rows)
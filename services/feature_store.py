@@ -0,0 +1,213 @@
+"""
+This module contains FeatureStore class which shares candles and indicators between the stages of a strategy run
+"""
+
+import logging
+import threading
+from datetime import date, timedelta
+from typing import Callable, Optional
+
+import numpy as np
+
+from model import indicators
+from model.bulk_fetch_result import BulkFetchResult
+from model.Ohlcv import OhlcData
+from model.panel import PricePanel, right_align
+from services.execution_listener import ExecutionListener
+from services.ticker_historical_data import TickerDataService
+
+
+class FeatureStore:
+    """
+    This class is created once per strategy run and is read by the ranking, position sizing and market regime
+    stages. Candles and indicators are computed lazily, at most once per ticker, parameter set and lookup window,
+    and are memoized for the rest of the run. Every lookup window ends at the as-of date of the run.
+
+    The returned arrays are shared between the stages and must not be modified.
+    """
+
+    def __init__(self, ticker_data_service: TickerDataService = None, as_of: date = None,
+                 listener: ExecutionListener = None) -> None:
+        """
+        This method initializes FeatureStore object
+        :param ticker_data_service: service used to fetch the candles, a new one is created if not given
+        :param as_of: last date of every lookup window, defaults to today
+        :param listener: receives the progress of the fetches of the run
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.ticker_data_service = ticker_data_service
+        self.as_of = as_of or date.today()
+        self.listener = listener or ExecutionListener()
+        self.lock = threading.RLock()
+        # (ticker, start date, end date) -> candles
+        self.ohlc_data: dict[tuple, OhlcData] = {}
+        # (feature name, ticker, lookup days, parameters...) -> feature
+        self.features: dict[tuple, object] = {}
+
+    def get_ticker_data_service(self) -> TickerDataService:
+        # created on first use, stores that never fetch candles do not need one
+        with self.lock:
+            if self.ticker_data_service is None:
+                self.ticker_data_service = TickerDataService()
+            return self.ticker_data_service
+
+    def get_window(self, lookup_days: int) -> tuple[date, date]:
+        """
+        This method returns the start and end date of a lookup window
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :return: tuple of start date and end date
+        """
+        return self.as_of - timedelta(lookup_days), self.as_of
+
+    def get_data(self, ticker: str, lookup_days: int) -> OhlcData:
+        """
+        This method returns the candles of the ticker for the lookup window
+        :param ticker: ticker symbol
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :return: OhlcData
+        """
+        start_date, end_date = self.get_window(lookup_days)
+        key = (ticker, start_date, end_date)
+        with self.lock:
+            ohlc_data = self.ohlc_data.get(key)
+        if ohlc_data is None:
+            ohlc_data = self.get_ticker_data_service().get_data(ticker, start_date, end_date)
+            with self.lock:
+                ohlc_data = self.ohlc_data.setdefault(key, ohlc_data)
+        return ohlc_data
+
+    def get_data_many(self, tickers: list[str], lookup_days: int) -> BulkFetchResult:
+        """
+        This method returns the candles of many tickers for the lookup window. Only the tickers that were not
+        fetched before in this run are requested from the data service
+        :param tickers: ticker symbols
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :return: BulkFetchResult in the order of tickers
+        """
+        start_date, end_date = self.get_window(lookup_days)
+        fetch_result = BulkFetchResult(tickers)
+        with self.lock:
+            missing = []
+            for ticker in tickers:
+                ohlc_data = self.ohlc_data.get((ticker, start_date, end_date))
+                if ohlc_data is None:
+                    missing.append(ticker)
+                else:
+                    fetch_result.add_result(ticker, ohlc_data)
+        if missing:
+            num_cached = len(tickers) - len(missing)
+
+            def on_progress(done: int, total: int, ticker: str, from_cache: Optional[bool]) -> None:
+                self.listener.on_ticker_fetched(ticker, from_cache, num_cached + done, num_cached + total)
+
+            missing_result = self.get_ticker_data_service().get_data_many(missing, start_date, end_date,
+                                                                          on_progress=on_progress)
+            with self.lock:
+                for ticker, ohlc_data in missing_result.results.items():
+                    self.ohlc_data[(ticker, start_date, end_date)] = ohlc_data
+                    fetch_result.add_result(ticker, ohlc_data)
+            for ticker, reason in missing_result.failures.items():
+                fetch_result.add_failure(ticker, reason)
+        return fetch_result
+
+    def get_panel(self, tickers: list[str], lookup_days: int, fields: list[str] = None) -> PricePanel:
+        """
+        This method returns the aligned candles of the tickers. Tickers whose candles could not be fetched are
+        left out of the panel
+        :param tickers: ticker symbols
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :param fields: fields to align, defaults to all the fields
+        :return: PricePanel
+        """
+        def build() -> PricePanel:
+            fetch_result = self.get_data_many(tickers, lookup_days)
+            for ticker, reason in fetch_result.failures.items():
+                self.logger.error('Skipping %s as data could not be fetched: %s', ticker, reason)
+            return PricePanel.from_ohlc_data(fetch_result.get_data(), fields=fields)
+
+        key = ('panel', tuple(tickers), lookup_days, tuple(fields) if fields else None)
+        return self.get_feature(key, build)
+
+    def close(self, ticker: str, lookup_days: int) -> np.ndarray:
+        """
+        This method returns the closes of the ticker
+        :param ticker: ticker symbol
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :return: array of closes (oldest first)
+        """
+        return self.get_data(ticker, lookup_days).close
+
+    def ema(self, ticker: str, lookup_days: int, span: int) -> np.ndarray:
+        """
+        This method returns the exponential moving average of the closes of the ticker
+        :param ticker: ticker symbol
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :param span: span of the moving average
+        :return: array of averages (oldest first)
+        """
+        return self.get_feature(('ema', ticker, lookup_days, span),
+                                lambda: indicators.ema(self.close(ticker, lookup_days), span))
+
+    def percent_change(self, ticker: str, lookup_days: int) -> np.ndarray:
+        """
+        This method returns the daily percent change of the closes of the ticker
+        :param ticker: ticker symbol
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :return: array of percent changes (oldest first), the first one is NaN
+        """
+        return self.get_feature(('percent_change', ticker, lookup_days),
+                                lambda: indicators.percent_change(self.close(ticker, lookup_days)))
+
+    def atr(self, ticker: str, lookup_days: int, period: int) -> np.ndarray:
+        """
+        This method returns the average true range of the ticker
+        :param ticker: ticker symbol
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :param period: number of days to average
+        :return: array of average true ranges (oldest first)
+        """
+        def build() -> np.ndarray:
+            ohlc_data = self.get_data(ticker, lookup_days)
+            return indicators.atr(ohlc_data.high, ohlc_data.low, ohlc_data.close, period)
+
+        return self.get_feature(('atr', ticker, lookup_days, period), build)
+
+    def get_atr_and_close(self, tickers: list[str], lookup_days: int,
+                          period: int) -> tuple[list[str], np.ndarray, np.ndarray]:
+        """
+        This method returns the latest average true range and close of many tickers. The ATR of all the tickers is
+        computed at once from their last candles
+        :param tickers: ticker symbols
+        :param lookup_days: number of calendar days to look back from the as-of date
+        :param period: number of days to average
+        :return: tuple of tickers (those with candles), latest ATRs and latest closes
+        """
+        panel = self.get_panel(tickers, lookup_days, fields=['high', 'low', 'close'])
+        if len(panel.dates) == 0:
+            return [], np.empty(0), np.empty(0)
+        high, low, close = (right_align(panel.get(field)) for field in ['high', 'low', 'close'])
+        return panel.tickers, indicators.atr(high, low, close, period)[-1], close[-1]
+
+    def get_feature(self, key: tuple, build: Callable[[], object]) -> object:
+        with self.lock:
+            feature = self.features.get(key)
+        if feature is None:
+            feature = build()
+            if isinstance(feature, np.ndarray):
+                feature.flags.writeable = False
+            with self.lock:
+                feature = self.features.setdefault(key, feature)
+        return feature
+
+    def clear(self, as_of: Optional[date] = None) -> None:
+        """
+        This method drops every memoized candle and feature, optionally moving the as-of date
+        :param as_of: new as-of date
+        :return: None
+        """
+        with self.lock:
+            self.ohlc_data.clear()
+            self.features.clear()
+            if as_of is not None:
+                self.as_of = as_of
@@ -6,8 +6,11 @@ import logging
 
 from clients.nse_client import NSEClient
 from services.config_service import ConfigService
+from services.constituents_service import ConstituentsService
 from model.company_info import CompanyInfo
 from model.filter.filters import IndexConstituentsFilter
+from services.execution_listener import ExecutionListener
+from services.market_cap_service import MarketCapService
 
 APP_PROPERTIES = 'app.properties'
 
@@ -25,15 +28,18 @@ class IndexDataService:
 
     def get_index_constituents(self,
                                index: str,
-                               index_filter: IndexConstituentsFilter = None):
+                               index_filter: IndexConstituentsFilter = None,
+                               listener: ExecutionListener = None):
         """
         This method fetches index constituents for a given index
         :param index_filter: filter criteria for index constituents
         :param index: index_name (e.g. NIFTY 50)
+        :param listener: receives the progress of the company info stage
         :return: list of stocks in the index
         """
         self.logger.info("Getting index constituents for index: %s", index)
-        stock_universe = self.nse_client.get_stock_universe(index)
+        # the constituents come from the local store, NSE is checked in the background
+        stock_universe = ConstituentsService.get_instance().get_constituents(index)
         # if PATANJALI is present in stock_universe, remove it
         if 'PATANJALI' in stock_universe:
             stock_universe.remove('PATANJALI')  # Some issue with this stock
@@ -41,7 +47,9 @@ class IndexDataService:
         # stock_universe.append('SBIN')
         filtered_stock_universe = stock_universe
         if index_filter:
-            company_info_list = self.get_company_info(stock_universe)
+            listener = listener or ExecutionListener()
+            with listener.stage('company_info'):
+                company_info_list = self.get_company_info(stock_universe, listener)
             if index_filter.min_market_cap:
                 filtered_stock_universe = [company_info.symbol for company_info in company_info_list if
                                            company_info.market_cap >= index_filter.min_market_cap]
@@ -51,14 +59,12 @@ class IndexDataService:
         return filtered_stock_universe
         # return ['JBMA']
 
-    def get_company_info(self, stock_universe: list[str]) -> list[CompanyInfo]:
+    def get_company_info(self, stock_universe: list[str], listener: ExecutionListener = None) -> list[CompanyInfo]:
         """
         This method fetches company info for a given stock universe
         :param stock_universe: list of stocks to fetch company info for
+        :param listener: receives the number of stocks done
         :return: list of company info
         """
-        company_info_list = []
-        for ticker in stock_universe:
-            company_info = self.nse_client.try_to_get_company_info(ticker)
-            company_info_list.append(company_info)
-        return company_info_list
+        # the market caps come from the snapshot of the day or the bulk source, only the rest is fetched from NSE
+        return MarketCapService(nse_client=self.nse_client).get_company_info(stock_universe, listener)
@@ -0,0 +1,177 @@
+"""
+This module contains InstrumentIndex class which resolves ticker symbols to kite instrument tokens
+"""
+
+import logging
+import os
+import pickle
+import threading
+
+import pandas as pd
+from pandas import DataFrame
+
+from services.config_service import ConfigService
+
+SNAPSHOT_VERSION = 1
+
+# series suffixes tried (in order) when the bare symbol is not a tradingsymbol, e.g. IRFC-EQ or SUZLON-BE
+SERIES = ['EQ', 'BE', 'SM', 'RR', 'RE', 'RT']
+
+
+class InstrumentIndex:
+    """
+    This class is a process wide index of the instrument master. Instruments are keyed by tradingsymbol and by
+    base symbol plus series, so that a lookup is a couple of dictionary reads. The index is loaded from a binary
+    snapshot which is rebuilt from instruments.csv only when the csv changes.
+    """
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self, csv_file: str, snapshot_file: str) -> None:
+        """
+        This method initializes the index
+        :param csv_file: instruments csv downloaded from kite
+        :param snapshot_file: binary snapshot of the index
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.csv_file = csv_file
+        self.snapshot_file = snapshot_file
+        self.lock = threading.Lock()
+        self.csv_mtime = None
+        # exchange -> tradingsymbol -> instrument token
+        self.by_symbol: dict[str, dict[str, int]] = {}
+        # exchange -> base symbol -> series -> instrument token
+        self.by_base: dict[str, dict[str, dict[str, int]]] = {}
+        self.load()
+
+    @classmethod
+    def get_instance(cls) -> 'InstrumentIndex':
+        """
+        This method returns the singleton instance of InstrumentIndex
+        :return: InstrumentIndex instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                config_service = ConfigService.get_instance()
+                cls.instance = InstrumentIndex(
+                    csv_file=config_service.get_or_default('instruments.file', default='instruments.csv'),
+                    snapshot_file=config_service.get_or_default('instruments.snapshot', default='instruments.idx'))
+            return cls.instance
+
+    def get_instrument_token(self, ticker: str, exchange: str = "NSE") -> int:
+        """
+        This method returns the instrument token of the ticker
+        :param ticker: tradingsymbol or base symbol of the instrument
+        :param exchange: exchange of the instrument
+        :return: instrument token
+        """
+        token = self.by_symbol.get(exchange, {}).get(ticker)
+        if token is not None:
+            return token
+        series_tokens = self.by_base.get(exchange, {}).get(ticker, {})
+        for series in SERIES:
+            if series in series_tokens:
+                return series_tokens[series]
+        raise Exception(f'Instrument token not found for {ticker}')
+
+    def load(self) -> None:
+        """
+        This method loads the index from the snapshot if it is up-to-date with the csv, otherwise it builds the
+        index from the csv and saves a new snapshot
+        :return: None
+        """
+        csv_mtime = os.path.getmtime(self.csv_file) if os.path.exists(self.csv_file) else None
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, 'rb') as binary_file:
+                snapshot = pickle.load(binary_file)
+            if snapshot.get('version') == SNAPSHOT_VERSION and \
+                    (csv_mtime is None or snapshot.get('csv_mtime') == csv_mtime):
+                self.by_symbol = snapshot['by_symbol']
+                self.by_base = snapshot['by_base']
+                self.csv_mtime = snapshot.get('csv_mtime')
+                return
+        if csv_mtime is None:
+            self.logger.warning('Instruments file %s not found', self.csv_file)
+            return
+        self.logger.info('Building instrument index from %s', self.csv_file)
+        # lines starting with '#' are instruments that were commented out by hand
+        instruments_df = pd.read_csv(self.csv_file, usecols=['instrument_token', 'tradingsymbol', 'exchange'],
+                                     comment='#')
+        for exchange, exchange_df in instruments_df.groupby('exchange'):
+            self.by_symbol[exchange], self.by_base[exchange] = self.build(exchange_df)
+        self.save_snapshot(csv_mtime)
+
+    def refresh(self, instruments_df: DataFrame, exchange: str = "NSE") -> None:
+        """
+        This method applies a freshly downloaded instrument master of an exchange to the index. Only the instruments
+        that were added, changed or removed are touched and the snapshot is rewritten
+        :param instruments_df: instrument master with tradingsymbol and instrument_token columns
+        :param exchange: exchange of the instrument master
+        :return: None
+        """
+        new_symbols = dict(zip(instruments_df['tradingsymbol'].astype(str),
+                               instruments_df['instrument_token'].astype(int)))
+        with self.lock:
+            symbols = dict(self.by_symbol.get(exchange, {}))
+            removed = [symbol for symbol in symbols if symbol not in new_symbols]
+            changed = {symbol: token for symbol, token in new_symbols.items() if symbols.get(symbol) != token}
+            csv_mtime = os.path.getmtime(self.csv_file) if os.path.exists(self.csv_file) else None
+            if not removed and not changed:
+                if csv_mtime != self.csv_mtime:
+                    self.save_snapshot(csv_mtime)
+                return
+            self.logger.info('Refreshing instrument index for %s: %s changed, %s removed',
+                             exchange, len(changed), len(removed))
+            base = {base_symbol: dict(series_tokens)
+                    for base_symbol, series_tokens in self.by_base.get(exchange, {}).items()}
+            for symbol in removed:
+                del symbols[symbol]
+                base_symbol, series = split_series(symbol)
+                if series is not None and base_symbol in base:
+                    base[base_symbol].pop(series, None)
+            for symbol, token in changed.items():
+                symbols[symbol] = token
+                base_symbol, series = split_series(symbol)
+                if series is not None:
+                    base.setdefault(base_symbol, {})[series] = token
+            # swap the dictionaries, readers never see a partially updated index
+            self.by_symbol = {**self.by_symbol, exchange: symbols}
+            self.by_base = {**self.by_base, exchange: base}
+            self.save_snapshot(csv_mtime)
+
+    @staticmethod
+    def build(instruments_df: DataFrame) -> tuple[dict[str, int], dict[str, dict[str, int]]]:
+        by_symbol = dict(zip(instruments_df['tradingsymbol'].astype(str),
+                             instruments_df['instrument_token'].astype(int)))
+        by_base = {}
+        for symbol, token in by_symbol.items():
+            base_symbol, series = split_series(symbol)
+            if series is not None:
+                by_base.setdefault(base_symbol, {})[series] = token
+        return by_symbol, by_base
+
+    def save_snapshot(self, csv_mtime) -> None:
+        self.csv_mtime = csv_mtime
+        snapshot = {
+            'version': SNAPSHOT_VERSION,
+            'csv_mtime': csv_mtime,
+            'by_symbol': self.by_symbol,
+            'by_base': self.by_base
+        }
+        temp_file = self.snapshot_file + '.tmp'
+        with open(temp_file, 'wb') as binary_file:
+            pickle.dump(snapshot, binary_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, self.snapshot_file)
+
+
+def split_series(symbol: str) -> tuple[str, str]:
+    """
+    This function splits a tradingsymbol like IRFC-EQ into its base symbol and series
+    :param symbol: tradingsymbol
+    :return: tuple of base symbol and series (None if the symbol has no known series suffix)
+    """
+    base_symbol, separator, series = symbol.rpartition('-')
+    if separator and series in SERIES:
+        return base_symbol, series
+    return symbol, None
@@ -0,0 +1,335 @@
+"""
+This module contains JobService class which runs strategy executions in the background
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Optional
+
+from model.job import Job
+from repositories.file_lock import FileLock
+from repositories.ohlc_file_store import OhlcFileStore
+from services.config_service import ConfigService
+from services.execution_listener import ExecutionListener
+from services.metrics import MetricsRegistry
+from services.strategy_executor import StrategyExecutor
+
+
+# seconds between two snapshots of a job saved for its progress, the other workers report the progress from them
+PROGRESS_INTERVAL = 1.0
+KEY_LOCK_FILE_PATTERN = re.compile(r'^active-([0-9]{4}-[0-9]{2}-[0-9]{2})-[0-9a-f]{32}\.lock$')
+
+
+class JobExecutionListener(ExecutionListener):
+    """
+    This listener records the progress of the stages on the job
+    """
+
+    def __init__(self, job: Job, on_change=None, progress_interval: float = PROGRESS_INTERVAL) -> None:
+        """
+        This method initializes JobExecutionListener object
+        :param job: job of the run
+        :param on_change: called with the job when a stage starts or ends, and at most once every
+        progress_interval seconds while a stage progresses
+        :param progress_interval: seconds between two on_change calls for progress
+        """
+        super().__init__()
+        self.job = job
+        self.on_change = on_change
+        self.progress_interval = progress_interval
+        self.lock = threading.Lock()
+        self.cache_hits = 0
+        self.network = 0
+        self.last_change = time.monotonic()
+
+    def on_stage_start(self, stage: str) -> None:
+        self.job.start_stage(stage)
+        self.notify(force=True)
+
+    def on_stage_end(self, stage: str, elapsed: float, error: str = None) -> None:
+        self.job.end_stage(stage, elapsed, error)
+        self.notify(force=True)
+
+    def on_progress(self, stage: str, done: int, total: int) -> None:
+        self.job.update_progress(stage, done, total)
+        self.notify()
+
+    def on_ticker_fetched(self, ticker: str, from_cache: Optional[bool], done: int, total: int) -> None:
+        # tickers fetched by a client that cannot tell where the candles came from are counted as network fetches
+        source = None if from_cache is None else ('cache' if from_cache else 'network')
+        # the lock keeps the counters of consecutive events in order
+        with self.lock:
+            if from_cache:
+                self.cache_hits += 1
+            else:
+                self.network += 1
+            self.job.update_progress('fetch', done, total, event='ticker_fetched', ticker=ticker, source=source,
+                                     cache_hits=self.cache_hits, network=self.network)
+        self.notify()
+
+    def notify(self, force: bool = False) -> None:
+        if self.on_change is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_change < self.progress_interval:
+                return
+            self.last_change = now
+        self.on_change(self.job)
+
+    def on_ranking_rows(self, rows: list[dict]) -> None:
+        self.job.add_ranking_rows(rows)
+
+
+class JobService:
+    """
+    This service runs strategy executions on a background worker and keeps track of them as jobs. Submitting
+    the same run (same day and parameters) while it is pending or running returns the existing job. When the
+    server runs several worker processes, a job lives in the worker it was submitted to. A snapshot of it is saved
+    in jobs_dir as it moves forward so that any worker can answer /api/jobs/<id>, and an active marker file per key
+    (under a lock file of the key) lets a worker return the job of an identical submission running in another one
+    """
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self, max_workers: int, max_history: int, jobs_dir: str = None) -> None:
+        """
+        This method initializes JobService object
+        :param max_workers: number of runs executed at the same time
+        :param max_history: number of finished jobs kept for /api/jobs
+        :param jobs_dir: directory of the job snapshots, None to not save them
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.max_history = max_history
+        self.jobs_dir = jobs_dir
+        if jobs_dir is not None:
+            os.makedirs(jobs_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        # job id -> job, in the order of submission
+        self.jobs: dict[str, Job] = {}
+        # key -> job that is pending or running
+        self.active_jobs: dict[tuple, Job] = {}
+
+    @classmethod
+    def get_instance(cls) -> 'JobService':
+        """
+        This method returns the singleton instance of JobService
+        :return: JobService instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                config_service = ConfigService.get_instance()
+                cls.instance = JobService(
+                    max_workers=int(config_service.get_or_default('jobs.max_workers', default=1)),
+                    max_history=int(config_service.get_or_default('jobs.max_history', default=100)),
+                    jobs_dir=config_service.get_or_default('jobs.dir', default='data/jobs'))
+            return cls.instance
+
+    def submit_strategy_execution(self, cash_flow: float = 0.0) -> str:
+        """
+        This method submits a strategy execution
+        :param cash_flow: the amount of cash to be invested
+        :return: id of the new job, or of the pending or running job of an identical submission, which may run in
+        another worker process (see get_job_snapshot)
+        """
+        parameters = {'cash_flow': cash_flow}
+        key = ('strategy_execution', date.today().isoformat(), tuple(sorted(parameters.items())))
+        with self.lock:
+            job = self.active_jobs.get(key)
+            if job is not None:
+                self.logger.info('Strategy execution %s is already %s', job.id, job.state.name)
+                return job.id
+            with self.get_key_lock(key):
+                active_job_id = self.get_active_job_id(key)
+                if active_job_id is not None:
+                    self.logger.info('Strategy execution %s is already running in another worker', active_job_id)
+                    return active_job_id
+                job = Job(key, parameters)
+                self.jobs[job.id] = job
+                self.active_jobs[key] = job
+                # the snapshot is saved before the marker, so that the id returned to other workers can be polled
+                self.save_snapshot(job)
+                self.save_active_marker(job)
+            self.prune()
+        self.executor.submit(self.run, job, lambda listener: StrategyExecutor().execute(cash_flow, listener))
+        return job.id
+
+    def run(self, job: Job, task) -> None:
+        job.start()
+        self.save_snapshot(job)
+        try:
+            job.succeed(task(JobExecutionListener(job, on_change=self.save_snapshot)))
+        except Exception as e:
+            self.logger.exception('Job %s failed', job.id)
+            job.fail(str(e))
+        finally:
+            with self.lock:
+                if self.active_jobs.get(job.key) is job:
+                    del self.active_jobs[job.key]
+            self.save_snapshot(job)
+            self.remove_active_marker(job)
+            MetricsRegistry.get_instance().counter('jobs', 'Finished jobs by state', ('state',)).inc(
+                state=job.state.name.lower())
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def get_job_snapshot(self, job_id: str) -> Optional[dict]:
+        """
+        This method returns the last snapshot saved for a job, which may run in another worker process
+        :param job_id: id of the job
+        :return: the job as a dict, None if there is no snapshot
+        """
+        # job ids are uuid hex strings, anything else is not a file name of ours
+        if self.jobs_dir is None or not re.fullmatch('[0-9a-f]{32}', job_id):
+            return None
+        try:
+            with open(self.get_snapshot_file(job_id), 'r', encoding='utf-8') as text_file:
+                return json.load(text_file)
+        except FileNotFoundError:
+            return None
+
+    def save_snapshot(self, job: Job) -> None:
+        if self.jobs_dir is None:
+            return
+        try:
+            data = json.dumps(job.to_dict(), default=str).encode('utf-8')
+            OhlcFileStore.atomic_write(self.get_snapshot_file(job.id), lambda f: f.write(data))
+        except Exception as e:
+            # the snapshot is for the other workers, it must not fail the run
+            self.logger.warning('Could not save the snapshot of job %s: %s', job.id, e)
+
+    def get_snapshot_file(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+
+    def get_key_file(self, key: tuple, extension: str) -> str:
+        # the day of the key is part of the name, so that prune can tell the files of past days
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.jobs_dir, f'active-{key[1]}-{digest}.{extension}')
+
+    def get_key_lock(self, key: tuple):
+        # without jobs_dir the jobs are deduplicated within this process only
+        if self.jobs_dir is None:
+            return contextlib.nullcontext()
+        return FileLock(self.get_key_file(key, 'lock'))
+
+    def get_active_job_id(self, key: tuple) -> Optional[str]:
+        """
+        This method returns the job of a key that is pending or running in another worker process, callers hold
+        the lock of the key
+        :param key: key of the job
+        :return: job id, None if no worker runs the job
+        """
+        if self.jobs_dir is None:
+            return None
+        return self.read_live_marker(self.get_key_file(key, 'json'))
+
+    def read_live_marker(self, marker_file: str) -> Optional[str]:
+        # returns the job id of a marker whose job is pending or running in another worker process
+        try:
+            with open(marker_file, 'r', encoding='utf-8') as text_file:
+                marker = json.load(text_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        snapshot = self.get_job_snapshot(marker['job_id'])
+        if snapshot is None or snapshot['state'] not in ('PENDING', 'RUNNING'):
+            return None
+        # the marker of a worker that died, or of an earlier worker of this pid, is stale
+        if marker['pid'] == os.getpid() or not is_process_alive(marker['pid']):
+            return None
+        return marker['job_id']
+
+    def save_active_marker(self, job: Job) -> None:
+        if self.jobs_dir is None:
+            return
+        data = json.dumps({'job_id': job.id, 'pid': os.getpid()}).encode('utf-8')
+        OhlcFileStore.atomic_write(self.get_key_file(job.key, 'json'), lambda f: f.write(data))
+
+    def remove_active_marker(self, job: Job) -> None:
+        if self.jobs_dir is None:
+            return
+        try:
+            with self.get_key_lock(job.key):
+                marker_file = self.get_key_file(job.key, 'json')
+                try:
+                    with open(marker_file, 'r', encoding='utf-8') as text_file:
+                        job_id = json.load(text_file).get('job_id')
+                except (FileNotFoundError, ValueError):
+                    return
+                if job_id == job.id:
+                    os.remove(marker_file)
+        except Exception as e:
+            # a marker left behind is ignored once the snapshot of its job is finished
+            self.logger.warning('Could not remove the active marker of job %s: %s', job.id, e)
+
+    def prune(self) -> None:
+        # drop the oldest finished jobs beyond max_history, callers hold the lock
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[job_id]
+            if self.jobs_dir is not None and os.path.exists(self.get_snapshot_file(job_id)):
+                os.remove(self.get_snapshot_file(job_id))
+        self.prune_key_locks()
+
+    def prune_key_locks(self) -> None:
+        # keys hold the day of the submission, so the lock files of past days are not taken again. Lock files of
+        # today are kept, a worker may be waiting on one and removing it would let another worker lock a new file.
+        # Callers hold the lock
+        if self.jobs_dir is None:
+            return
+        today = date.today().isoformat()
+        active_job_ids = {job.id for job in self.active_jobs.values()}
+        for file_name in os.listdir(self.jobs_dir):
+            match = KEY_LOCK_FILE_PATTERN.match(file_name)
+            if match is None or match.group(1) >= today:
+                continue
+            lock_file = os.path.join(self.jobs_dir, file_name)
+            marker_file = lock_file[:-len('.lock')] + '.json'
+            if os.path.exists(marker_file):
+                # the marker of a job still running since a past day is removed by the job, the marker of a job
+                # whose worker died is removed here
+                with FileLock(lock_file):
+                    if self.read_live_marker(marker_file) is not None:
+                        continue
+                    try:
+                        with open(marker_file, 'r', encoding='utf-8') as text_file:
+                            if json.load(text_file).get('job_id') in active_job_ids:
+                                continue
+                    except (FileNotFoundError, ValueError):
+                        pass
+                    remove_file(marker_file)
+            remove_file(lock_file)
+
+
+def remove_file(file: str) -> None:
+    try:
+        os.remove(file)
+    except FileNotFoundError:
+        pass
+
+
+def is_process_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        # os.kill terminates the process on windows, the marker is trusted there
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists but belongs to another user
+        return True
+    except OSError:
+        return False
+    return True
@@ -1,15 +1,20 @@
 import datetime
 import logging
+import threading
 import time
 from abc import ABC, abstractmethod
-import pandas as pd
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from kiteconnect import KiteConnect
 from pandas import DataFrame
 
 from services.config_service import ConfigService
+from model.bulk_fetch_result import BulkFetchResult
 from model.Ohlcv import OhlcData
 from services.cache_service import CacheService
+from services.instrument_index import InstrumentIndex
+from services.quote_source import get_quote_source
+from services.metrics import instrumented_request
+from services.rate_limiter import TokenBucketRateLimiter
 from services.config_service import ConfigService
 
 
@@ -22,11 +27,30 @@ class KiteClient(ABC):
     def get_data(self, symbol, start_date, end_date, interval="day") -> OhlcData:
         pass
 
+    def get_data_many(self, tickers: list[str], start_date, end_date, interval="day",
+                      on_progress=None) -> BulkFetchResult:
+        # default implementation fetches one ticker at a time
+        result = BulkFetchResult(tickers)
+        for done, ticker in enumerate(tickers, start=1):
+            try:
+                result.add_result(ticker, self.get_data(ticker, start_date, end_date, interval))
+            except Exception as ex:
+                self.logger.error("Error fetching data for %s: %s", ticker, ex)
+                result.add_failure(ticker, str(ex))
+            if on_progress is not None:
+                # the default client cannot tell whether the candles came from a cache
+                on_progress(done, len(tickers), ticker, None)
+        return result
+
 
 class HttpKiteClient(KiteClient):
+    rate_limiter = None
+    rate_limiter_lock = threading.Lock()
+
     def __init__(self) -> None:
         super().__init__()
         config_service = ConfigService.get_instance()
+        self.max_workers = int(config_service.get_or_default('kite.max_workers', default=8))
         self.base_url = config_service.get('kite.ui.base_url')
         self.session = config_service.get('kite.ui.cookies.session')
         self.csrf_token = config_service.get('kite.ui.csrf_token')
@@ -34,36 +58,56 @@ class HttpKiteClient(KiteClient):
         self.public_token = config_service.get('kite.ui.public_token')
         self.enc_token = config_service.get('kite.ui.enctoken')
 
-        # load instruments.csv into a dataframe
-        self.instruments_df = pd.read_csv('instruments.csv')
+        # instruments are resolved through the process wide index instead of scanning instruments.csv
+        self.instrument_index = InstrumentIndex.get_instance()
         self.cache_service = CacheService.get_instance()
+        self.quote_source = get_quote_source(self)
         self.logger = logging.getLogger(__name__)
 
     def get_data(self, symbol, start_date, end_date, interval="day") -> OhlcData:
+        return self.get_data_with_source(symbol, start_date, end_date, interval)[0]
+
+    def get_data_with_source(self, symbol, start_date, end_date, interval="day") -> tuple[OhlcData, bool]:
+        # returns the candles and whether they were served from the cache without calling kite
         self.logger.info(f'Fetching data from kite for {symbol} from {start_date} to {end_date}')
-        # check if the data is present in cache. If yes, return it, else fetch from api
-        if self.cache_service.is_data_present(symbol, start_date, end_date):
-            return self.cache_service.get_data(symbol, start_date, end_date)
-        else:
-            ohlc_data = self.fetch_data(symbol, start_date, end_date)
-            self.cache_service.save_data(symbol, start_date, end_date, ohlc_data)
-            return ohlc_data
+        from_cache = True
+        # fetch only the days that are not present in the cache and serve the whole range from the cache
+        if self.cache_service.get_missing_ranges(symbol, start_date, end_date):
+            # one worker fetches the symbol, the others wait and then find the days in the cache
+            with self.cache_service.fetch_lock(symbol):
+                for missing_start_date, missing_end_date in self.cache_service.get_missing_ranges(symbol, start_date,
+                                                                                                  end_date):
+                    ohlc_data = self.fetch_data(symbol, missing_start_date, missing_end_date)
+                    self.cache_service.save_data(symbol, missing_start_date, missing_end_date, ohlc_data)
+                    from_cache = False
+        return self.cache_service.get_data(symbol, start_date, end_date), from_cache
+
+    def get_data_many(self, tickers: list[str], start_date, end_date, interval="day",
+                      on_progress=None) -> BulkFetchResult:
+        # fetch the tickers concurrently. The rate limiter shared by all the workers makes sure that
+        # we do not cross kite's rate limit, so the fetch is bounded by the rate limit and not by round trips
+        self.logger.info('Fetching data from kite for %s tickers from %s to %s', len(tickers), start_date, end_date)
+        result = BulkFetchResult(tickers)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.get_data_with_source, ticker, start_date, end_date, interval): ticker
+                       for ticker in dict.fromkeys(tickers)}
+            # results are collected as they complete, BulkFetchResult keeps the order of tickers
+            for done, future in enumerate(as_completed(futures), start=1):
+                ticker = futures[future]
+                from_cache = None
+                try:
+                    ohlc_data, from_cache = future.result()
+                    result.add_result(ticker, ohlc_data)
+                except Exception as ex:
+                    self.logger.error("Error fetching data for %s: %s", ticker, ex)
+                    result.add_failure(ticker, str(ex))
+                if on_progress is not None:
+                    on_progress(done, len(futures), ticker, from_cache)
+        self.logger.info('Fetched data from kite. %s', result)
+        return result
 
     def get_instrument_token(self, ticker, exchange="NSE"):
-        ticker_name_1 = ticker + '-EQ'
-        ticker_name_2 = ticker + '-BE'
-        ticker_name_3 = ticker + '-SM'
-        ticker_name_4 = ticker + '-RR'
-        ticker_name_5 = ticker + '-RE'
-        ticker_name_6 = ticker + '-RT'
-        # fetch instrument token using ticker name until you get a match. Use for loop
-        instrument_token = None
-        for ticker_name in [ticker, ticker_name_1, ticker_name_2, ticker_name_3, ticker_name_4, ticker_name_5,
-                            ticker_name_6]:
-            matching_rows = self.instruments_df.loc[self.instruments_df['tradingsymbol'] == ticker_name]
-            if len(matching_rows.index) > 0:
-                return matching_rows['instrument_token'].values[0]
-        raise Exception(f'Instrument token not found for {ticker}')
+        return self.instrument_index.get_instrument_token(ticker, exchange)
 
     def get_headers(self):
         # cookie = str(f'user_id={self.client_id}; public_token={self.public_token}; kf_session={self.session}')
@@ -88,9 +132,19 @@ class HttpKiteClient(KiteClient):
         }
         return headers
 
+    @classmethod
+    def get_rate_limiter(cls) -> TokenBucketRateLimiter:
+        # the rate limiter is shared by all the clients in the process since kite's limit is per user
+        with cls.rate_limiter_lock:
+            if cls.rate_limiter is None:
+                config_service = ConfigService.get_instance()
+                requests_per_second = float(config_service.get_or_default('kite.requests_per_second', default=3))
+                cls.rate_limiter = TokenBucketRateLimiter(rate=requests_per_second, name='kite')
+            return cls.rate_limiter
+
     def fetch_data(self, ticker, start_date, end_date):
-        # sleep for 1 second to avoid rate limit
-        time.sleep(1)
+        # wait for the rate limiter to avoid hitting kite's rate limit
+        self.get_rate_limiter().acquire()
         url_template = "{base_url}/oms/instruments/historical/{instrument_token}/day?user_id={client_id}&oi={oi}&from={start_date}&to={end_date}"
         start_date_str = start_date.strftime("%Y-%m-%d")
         end_date_str = end_date.strftime("%Y-%m-%d")
@@ -104,7 +158,7 @@ class HttpKiteClient(KiteClient):
             oi=0)
         headers = self.get_headers()
         payload = {}
-        response = requests.request("GET", url, headers=headers, data=payload)
+        response = instrumented_request('kite', 'historical', "GET", url, headers=headers, data=payload)
         if response.status_code not in [200]:
             self.logger.error("Error while fetching data from kite api. Status code: %s, response: %s",
                               response.status_code, response.text)
@@ -115,12 +169,30 @@ class HttpKiteClient(KiteClient):
         return OhlcData.from_json(ticker, candles_data)
 
     def get_current_prices(self, tickers: list[str]):
+        # one batched quote request for all the tickers. Tickers without a quote get the last close from the
+        # candle cache, only the tickers missing there are fetched
         price_map = {}
+        try:
+            price_map.update(self.quote_source.get_ltp(tickers))
+        except Exception as ex:
+            self.logger.warning('Quotes are unavailable, falling back to the candle cache: %s', ex)
+        end_date = datetime.date.today()
+        start_date = end_date - datetime.timedelta(days=10)
+        missing = []
         for ticker in tickers:
-            start_date = datetime.date.today() - datetime.timedelta(days=10)
-            end_date = datetime.date.today()
-            data = self.get_data(ticker, start_date, end_date)
-            price_map.update({ticker: data.get_last_price()})
+            if ticker in price_map:
+                continue
+            last_price = self.cache_service.get_last_price(ticker, start_date)
+            if last_price is None:
+                missing.append(ticker)
+            else:
+                price_map[ticker] = last_price
+        if missing:
+            result = self.get_data_many(missing, start_date, end_date)
+            for ticker in missing:
+                if ticker not in result.results:
+                    raise Exception(f'Could not get the price of {ticker}: {result.failures.get(ticker)}')
+                price_map[ticker] = result.results[ticker].get_last_price()
         return price_map
 
 
@@ -151,17 +223,16 @@ class KiteSDKClient(KiteClient):
         self.kite = kite
 
         instruments_df = self.get_instruments()
-        # save instruments_df
+        # save instruments_df and apply the changes to the instrument index
         instruments_df.to_csv('instruments.csv', index=False)
-        self.instruments_df = instruments_df
+        self.instrument_index = InstrumentIndex.get_instance()
+        self.instrument_index.refresh(instruments_df)
 
     def get_data(self, ticker, start_date, end_date, interval="day") -> OhlcData:
         # Sleep for 500 ms
         time.sleep(0.5)
         print("Fetching data for symbol: " + ticker)
-        df = self.instruments_df
-        filtered_row = df[df['tradingsymbol'] == ticker]
-        instrument_token = int(filtered_row['instrument_token'].iloc[0])
+        instrument_token = self.get_instrument_token(ticker)
         response = self.kite.historical_data(
             instrument_token=instrument_token,
             from_date=start_date,
@@ -171,11 +242,7 @@ class KiteSDKClient(KiteClient):
         return OhlcData.from_kite_trade_api_response(ticker, response)
 
     def get_instrument_token(self, ticker, exchange="NSE"):
-        response = self.kite.instruments(exchange=exchange)
-        for instrument in response:
-            if instrument['tradingsymbol'] == ticker:
-                return instrument['instrument_token']
-        return None
+        return self.instrument_index.get_instrument_token(ticker, exchange)
 
     def get_instruments(self, exchange="NSE"):
         response = self.kite.instruments(exchange=exchange)
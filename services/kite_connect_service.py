@@ -1,3 +1,4 @@
+from model.bulk_fetch_result import BulkFetchResult
 from model.Ohlcv import OhlcData
 from services.kite_client import KiteClient, HttpKiteClient, KiteSDKClient
 
@@ -11,5 +12,8 @@ class KiteConnectService:
     def get_data(self, ticker, start_date, end_date) -> OhlcData:
         return self.kite_client.get_data(ticker, start_date, end_date)
 
+    def get_data_many(self, tickers: list[str], start_date, end_date, on_progress=None) -> BulkFetchResult:
+        return self.kite_client.get_data_many(tickers, start_date, end_date, on_progress=on_progress)
+
     def get_current_prices(self, tickers: list[str]):
         return self.kite_client.get_current_prices(tickers)
@@ -0,0 +1,219 @@
+"""
+This module contains MarketCapService class which returns the market caps of a stock universe in bulk
+"""
+
+import glob
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import pandas as pd
+
+from clients.nse_client import NSEClient
+from exceptions.nse_client_exceptions import NSEClientException
+from model.company_info import CompanyInfo
+from repositories.ohlc_file_store import OhlcFileStore
+from services.config_service import ConfigService
+from services.execution_listener import ExecutionListener
+from services.metrics import count_retries
+from services.rate_limiter import AdaptiveRateLimiter
+
+SNAPSHOT_COLUMNS = ['symbol', 'market_cap', 'free_float_market_cap']
+# snapshots older than this are deleted
+SNAPSHOT_RETENTION_DAYS = 7
+# a ticker is tried this many times, the cookie is renewed between the attempts
+MAX_ATTEMPTS = 3
+
+
+class MarketCapSource(ABC):
+    """
+    This class returns the market caps of many tickers with one request
+    """
+
+    @abstractmethod
+    def get_company_info(self, tickers: list[str]) -> dict[str, CompanyInfo]:
+        """
+        This method returns the company info of the tickers
+        :param tickers: ticker symbols
+        :return: ticker -> company info. Tickers the source does not know are left out
+        """
+        pass
+
+
+class CsvMarketCapSource(MarketCapSource):
+    """
+    This class reads the market caps from a csv file or url with symbol and market_cap columns (and optionally
+    free_float_market_cap), in the unit NSE uses (lakhs). It is the bulk source and the local stand-in in tests
+    """
+
+    def __init__(self, location: str) -> None:
+        """
+        This method initializes CsvMarketCapSource object
+        :param location: path or url of the csv
+        """
+        super().__init__()
+        self.location = location
+
+    def get_company_info(self, tickers: list[str]) -> dict[str, CompanyInfo]:
+        market_cap_df = pd.read_csv(self.location)
+        market_cap_df.columns = [column.strip().lower() for column in market_cap_df.columns]
+        if 'free_float_market_cap' not in market_cap_df.columns:
+            market_cap_df['free_float_market_cap'] = 0.0
+        market_cap_df = market_cap_df[market_cap_df['symbol'].isin(tickers)]
+        return {symbol: CompanyInfo(symbol, float(market_cap), float(free_float_market_cap))
+                for symbol, market_cap, free_float_market_cap in
+                zip(market_cap_df['symbol'], market_cap_df['market_cap'], market_cap_df['free_float_market_cap'])}
+
+
+class MarketCapService:
+    """
+    This service returns the company info (market caps) of a stock universe. The market caps are looked up, in this
+    order, in the snapshot of the day, in the bulk source and finally fetched from NSE, concurrently and behind an
+    adaptive rate limiter. Everything found is saved in the snapshot of the day, so later runs on the same day do
+    not fetch again
+    """
+
+    def __init__(self,
+                 nse_client: NSEClient = None,
+                 bulk_source: MarketCapSource = None,
+                 snapshot_dir: str = None,
+                 max_workers: int = None,
+                 rate_limiter: AdaptiveRateLimiter = None,
+                 retry_delay: float = 2.0) -> None:
+        """
+        This method initializes MarketCapService object. Arguments that are not given are read from the config
+        :param nse_client: client used to fetch the tickers missing in the snapshot and the bulk source
+        :param bulk_source: source of the market caps of the whole universe, None to fetch every ticker from NSE
+        :param snapshot_dir: directory of the daily snapshots
+        :param max_workers: number of tickers fetched from NSE at the same time
+        :param rate_limiter: rate limiter of the NSE requests
+        :param retry_delay: seconds waited before the second attempt, doubled for every further attempt
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        config_service = ConfigService.get_instance()
+        self.nse_client = nse_client or NSEClient.get_instance()
+        if bulk_source is None:
+            market_cap_file = config_service.get_or_default('market_cap.file', default='')
+            bulk_source = CsvMarketCapSource(market_cap_file) if market_cap_file else None
+        self.bulk_source = bulk_source
+        self.snapshot_dir = snapshot_dir or config_service.get_or_default('market_cap.snapshot_dir',
+                                                                          default='data/market_cap')
+        self.max_workers = max_workers or int(config_service.get_or_default('market_cap.max_workers', default=4))
+        if rate_limiter is None:
+            requests_per_second = float(config_service.get_or_default('market_cap.requests_per_second', default=2))
+            rate_limiter = AdaptiveRateLimiter(rate=requests_per_second,
+                                               min_rate=0.2,
+                                               max_rate=requests_per_second * 2,
+                                               name='nse')
+        self.rate_limiter = rate_limiter
+        self.retry_delay = retry_delay
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+
+    def get_company_info(self, tickers: list[str], listener: ExecutionListener = None) -> list[CompanyInfo]:
+        """
+        This method returns the company info of the tickers
+        :param tickers: ticker symbols
+        :param listener: receives the number of tickers done
+        :return: list of company info in the order of tickers
+        """
+        listener = listener or ExecutionListener()
+        today = date.today()
+        company_info = self.load_snapshot(today)
+        num_known = len(company_info)
+        missing = [ticker for ticker in dict.fromkeys(tickers) if ticker not in company_info]
+        if missing and self.bulk_source is not None:
+            try:
+                company_info.update(self.bulk_source.get_company_info(missing))
+            except Exception as e:
+                self.logger.warning('Could not read the bulk market caps, fetching them from NSE: %s', e)
+            missing = [ticker for ticker in missing if ticker not in company_info]
+        total = len(set(tickers))
+        listener.on_progress('company_info', total - len(missing), total)
+        self.logger.info('Market caps of %s out of %s tickers are known, fetching %s from NSE', total - len(missing),
+                         total, len(missing))
+
+        def on_fetched(done: int) -> None:
+            listener.on_progress('company_info', total - len(missing) + done, total)
+
+        failures = {}
+        if missing:
+            fetched, failures = self.fetch_many(missing, on_fetched)
+            company_info.update(fetched)
+        if len(company_info) > num_known:
+            self.save_snapshot(today, company_info)
+        if failures:
+            raise NSEClientException(f'Error fetching company info for symbols: {sorted(failures)}')
+        return [company_info[ticker] for ticker in tickers]
+
+    def fetch_many(self, tickers: list[str], on_fetched) -> tuple[dict[str, CompanyInfo], dict[str, str]]:
+        """
+        This method fetches the company info of the tickers from NSE concurrently. Failed tickers are tried again
+        after a delay with a new cookie
+        :param tickers: ticker symbols
+        :param on_fetched: called with the number of tickers fetched so far
+        :return: ticker -> company info and ticker -> reason of the tickers that failed every attempt
+        """
+        company_info = {}
+        failures = {}
+        pending = tickers
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='market-cap') as executor:
+            for attempt in range(MAX_ATTEMPTS):
+                if attempt > 0:
+                    self.logger.info('Retrying %s tickers (attempt %s)', len(pending), attempt + 1)
+                    count_retries('nse', 'company_info', len(pending))
+                    time.sleep(self.retry_delay * 2 ** (attempt - 1))
+                    self.nse_client.cookie = None
+                failures = {}
+                futures = {executor.submit(self.fetch, ticker): ticker for ticker in pending}
+                for future in as_completed(futures):
+                    ticker = futures[future]
+                    try:
+                        company_info[ticker] = future.result()
+                        on_fetched(len(company_info))
+                    except Exception as e:
+                        failures[ticker] = str(e)
+                pending = list(failures)
+                if not pending:
+                    break
+        for ticker, reason in failures.items():
+            self.logger.error('Error fetching company info for %s: %s', ticker, reason)
+        return company_info, failures
+
+    def fetch(self, ticker: str) -> CompanyInfo:
+        self.rate_limiter.acquire()
+        try:
+            company_info = self.nse_client.fetch_company_info(ticker, wait=False)
+        except Exception:
+            self.rate_limiter.on_failure()
+            raise
+        self.rate_limiter.on_success()
+        # the per ticker lookups of the client see it as well
+        self.nse_client.cache.put(ticker, company_info)
+        return company_info
+
+    def load_snapshot(self, day: date) -> dict[str, CompanyInfo]:
+        file_name = self.get_snapshot_file(day)
+        if not os.path.exists(file_name):
+            return {}
+        snapshot_df = pd.read_csv(file_name)
+        return {symbol: CompanyInfo(symbol, float(market_cap), float(free_float_market_cap))
+                for symbol, market_cap, free_float_market_cap in
+                zip(snapshot_df['symbol'], snapshot_df['market_cap'], snapshot_df['free_float_market_cap'])}
+
+    def save_snapshot(self, day: date, company_info: dict[str, CompanyInfo]) -> None:
+        snapshot_df = pd.DataFrame([[info.symbol, info.market_cap, info.free_float_market_cap]
+                                    for info in company_info.values()], columns=SNAPSHOT_COLUMNS)
+        data = snapshot_df.to_csv(index=False).encode('utf-8')
+        OhlcFileStore.atomic_write(self.get_snapshot_file(day), lambda f: f.write(data))
+        oldest_day = day - timedelta(days=SNAPSHOT_RETENTION_DAYS)
+        for file_name in glob.glob(os.path.join(self.snapshot_dir, '*.csv')):
+            file_day = os.path.splitext(os.path.basename(file_name))[0]
+            if file_day < oldest_day.isoformat():
+                os.remove(file_name)
+
+    def get_snapshot_file(self, day: date) -> str:
+        return os.path.join(self.snapshot_dir, f'{day.isoformat()}.csv')
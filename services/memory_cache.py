@@ -0,0 +1,230 @@
+"""
+This module contains MemoryCache class, an in-memory cache with a byte budget, expiry and stale-while-revalidate
+"""
+
+import logging
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable, Optional
+
+import numpy as np
+
+from services.metrics import MetricsRegistry
+
+
+class CacheItem:
+    __slots__ = ('value', 'size', 'expires_at')
+
+    def __init__(self, value: Any, size: int, expires_at: float) -> None:
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+
+
+class MemoryCache:
+    """
+    This class keeps values in memory within a byte budget. The least recently used values are evicted when the
+    budget is exceeded. A value expires at the time returned by expiry when it is stored (e.g. the next market
+    close). An expired value is still served for stale_seconds by get_or_load, which reloads it in the background
+    meanwhile (stale-while-revalidate). The counters returned by get_stats help to size the budget
+    """
+
+    def __init__(self, name: str, max_bytes: int, expiry: Callable[[float], float] = None,
+                 stale_seconds: float = 0.0, sizeof: Callable[[Any], int] = None) -> None:
+        """
+        This method initializes MemoryCache object
+        :param name: name of the cache, used in logs and stats
+        :param max_bytes: memory budget of the values
+        :param expiry: returns the expiry time (epoch seconds) of a value stored at the given time, None to never
+        expire values
+        :param stale_seconds: how long an expired value is served while it is reloaded
+        :param sizeof: returns the size of a value in bytes, estimate_size by default
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        self.stale_seconds = stale_seconds
+        self.sizeof = sizeof or estimate_size
+        self.lock = threading.RLock()
+        self.items: OrderedDict[Hashable, CacheItem] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.refresh_failures = 0
+        # keys being reloaded in the background
+        self.refreshing: set = set()
+        self.refresh_executor: Optional[ThreadPoolExecutor] = None
+        caches.add(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        This method returns the value of the key if it is present and has not expired
+        """
+        with self.lock:
+            item = self.get_item(key, time.time())
+            if item is None or item.expires_at <= time.time():
+                self.misses += 1
+                return default
+            self.hits += 1
+            return item.value
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        This method returns the value of the key. A missing value is loaded and stored. An expired value that is
+        still within stale_seconds is returned as it is and reloaded in the background
+        :param key: key
+        :param loader: loads the value, values that are None are not stored
+        :return: value
+        """
+        now = time.time()
+        with self.lock:
+            item = self.get_item(key, now)
+            if item is not None:
+                if now < item.expires_at:
+                    self.hits += 1
+                    return item.value
+                self.stale_hits += 1
+                self.refresh(key, loader)
+                return item.value
+            self.misses += 1
+        value = loader()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        This method stores the value and evicts the least recently used values beyond the budget. Values that
+        change in place must be put again so that their size is accounted
+        """
+        now = time.time()
+        expires_at = self.expiry(now) if self.expiry is not None else float('inf')
+        size = self.sizeof(value)
+        with self.lock:
+            previous = self.items.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous.size
+            self.items[key] = CacheItem(value, size, expires_at)
+            self.bytes += size
+            # the value just stored stays even if it is larger than the budget on its own
+            while self.bytes > self.max_bytes and len(self.items) > 1:
+                _, evicted = self.items.popitem(last=False)
+                self.bytes -= evicted.size
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Any:
+        with self.lock:
+            item = self.items.pop(key, None)
+            if item is None:
+                return None
+            self.bytes -= item.size
+            return item.value
+
+    def clear(self) -> None:
+        with self.lock:
+            self.items.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def get_item(self, key: Hashable, now: float) -> Optional[CacheItem]:
+        # returns the item (fresh or stale) and marks it as recently used. Items past the stale window are dropped.
+        # Callers hold the lock
+        item = self.items.get(key)
+        if item is None:
+            return None
+        if now >= item.expires_at + self.stale_seconds:
+            self.pop(key)
+            self.expirations += 1
+            return None
+        self.items.move_to_end(key)
+        return item
+
+    def refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        # reloads a stale value once in the background, callers hold the lock
+        if key in self.refreshing:
+            return
+        if self.refresh_executor is None:
+            self.refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f'{self.name}-refresh')
+        self.refreshing.add(key)
+        self.refresh_executor.submit(self.reload, key, loader)
+
+    def reload(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        try:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        except Exception as e:
+            # the stale value is served until it leaves the stale window
+            self.logger.warning('Could not refresh %s in %s cache: %s', key, self.name, e)
+            with self.lock:
+                self.refresh_failures += 1
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'entries': len(self.items),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'refresh_failures': self.refresh_failures
+            }
+
+
+def estimate_size(value: Any) -> int:
+    """
+    This function estimates the memory used by a value: the bytes of numpy arrays, otherwise the shallow size of the
+    object and of its attributes
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    attributes = getattr(value, '__dict__', None)
+    if attributes is None:
+        return sys.getsizeof(value)
+    return sys.getsizeof(value) + sum(estimate_size(attribute) for attribute in attributes.values())
+
+
+# the caches of the process, their stats are reported by the metrics registry
+caches: 'weakref.WeakSet[MemoryCache]' = weakref.WeakSet()
+
+# stats reported as counters and gauges: stat -> (metric name, type, help)
+CACHE_METRICS = {
+    'entries': ('cache_entries', 'gauge', 'Values in the cache'),
+    'bytes': ('cache_bytes', 'gauge', 'Estimated memory used by the values of the cache'),
+    'max_bytes': ('cache_max_bytes', 'gauge', 'Memory budget of the cache'),
+    'hits': ('cache_hits_total', 'counter', 'Lookups answered with a fresh value'),
+    'stale_hits': ('cache_stale_hits_total', 'counter', 'Lookups answered with an expired value being reloaded'),
+    'misses': ('cache_misses_total', 'counter', 'Lookups that had to load the value'),
+    'hit_ratio': ('cache_hit_ratio', 'gauge', 'Share of the lookups answered from the cache'),
+    'evictions': ('cache_evictions_total', 'counter', 'Values evicted to stay within the budget'),
+    'expirations': ('cache_expirations_total', 'counter', 'Values dropped after the stale window')
+}
+
+
+def collect_cache_metrics() -> list:
+    stats = [(cache.name, cache.get_stats()) for cache in list(caches)]
+    return [(name, metric_type, documentation, [({'cache': cache_name}, cache_stats[stat])
+                                                 for cache_name, cache_stats in stats])
+            for stat, (name, metric_type, documentation) in CACHE_METRICS.items()]
+
+
+MetricsRegistry.get_instance().add_collector(collect_cache_metrics)
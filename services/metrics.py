@@ -0,0 +1,310 @@
+"""
+This module contains MetricsRegistry class which keeps counters and latency histograms of the app and renders them in
+the Prometheus text format
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import requests
+
+from repositories.ohlc_file_store import OhlcFileStore
+
+# upper bounds (seconds) of the latency buckets, from a cache lookup to a slow upstream call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# name, type, help and samples (labels, value) of a metric, as returned by the collectors. Samples of histograms
+# carry the suffix of their series (_bucket, _sum, _count) as a third item
+MetricFamily = tuple[str, str, str, list[tuple]]
+
+WORKER_FILE_PATTERN = re.compile(r'^([0-9]+)\.json$')
+# a worker file not written for this many flush intervals belongs to a worker that is gone
+STALE_FLUSH_INTERVALS = 3
+
+
+class Counter:
+    """
+    This class counts events, one value per combination of label values
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()) -> None:
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def collect(self) -> list[MetricFamily]:
+        with self.lock:
+            samples = [(dict(zip(self.label_names, key)), value) for key, value in self.values.items()]
+        return [(f'{self.name}_total', 'counter', self.documentation, samples)]
+
+
+class Histogram:
+    """
+    This class counts observations (e.g. latencies) in cumulative buckets, one set of buckets per combination of
+    label values, along with their sum and count
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS) -> None:
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # label values -> (count per bucket, +Inf last, sum)
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.label_names)
+        position = next((position for position, bound in enumerate(self.buckets) if value <= bound),
+                        len(self.buckets))
+        with self.lock:
+            counts, total = self.values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[position] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        This method observes the seconds spent in a block of code, also when it raises
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def collect(self) -> list[MetricFamily]:
+        samples = []
+        with self.lock:
+            values = [(key, list(counts), total[0]) for key, (counts, total) in self.values.items()]
+        for key, counts, total in values:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                samples.append(({**labels, 'le': format_value(bound)}, cumulative, '_bucket'))
+            samples.append((labels, total, '_sum'))
+            samples.append((labels, cumulative, '_count'))
+        return [(self.name, 'histogram', self.documentation, samples)]
+
+
+class MetricsRegistry:
+    """
+    This class holds the metrics of the process. Counters and histograms are created once by name and updated by the
+    code they measure. Collectors return metrics computed on demand (e.g. the stats of the caches). Every sample is
+    labelled with the pid, so the series of the gunicorn workers stay apart.
+
+    A scrape reaches one arbitrary worker, so once share() is called every worker writes its samples to <pid>.json
+    in a shared directory every flush_interval seconds, and render() returns the samples of all the live workers
+    """
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.metrics: dict[str, object] = {}
+        self.collectors: list[Callable[[], list[MetricFamily]]] = []
+        self.metrics_dir: Optional[str] = None
+        self.flush_interval = 5.0
+
+    @classmethod
+    def get_instance(cls) -> 'MetricsRegistry':
+        """
+        This method returns the singleton instance of MetricsRegistry
+        :return: MetricsRegistry instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                cls.instance = MetricsRegistry()
+            return cls.instance
+
+    def share(self, metrics_dir: str, flush_interval: float = 5.0) -> None:
+        """
+        This method makes the worker processes of the server share their metrics through a directory. It is
+        called by the web app, processes that serve no scrape (e.g. the sweep workers) keep their metrics
+        :param metrics_dir: directory shared by the worker processes
+        :param flush_interval: seconds between two writes of the samples of this process
+        """
+        with self.lock:
+            if self.metrics_dir is not None:
+                return
+            os.makedirs(metrics_dir, exist_ok=True)
+            self.metrics_dir = metrics_dir
+            self.flush_interval = flush_interval
+        threading.Thread(target=self.run_flush, name='metrics-flush', daemon=True).start()
+
+    def counter(self, name: str, documentation: str, label_names: tuple = ()) -> Counter:
+        return self.get_or_create(name, lambda: Counter(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.get_or_create(name, lambda: Histogram(name, documentation, label_names, buckets))
+
+    def get_or_create(self, name: str, factory: Callable):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = factory()
+            return metric
+
+    def add_collector(self, collector: Callable[[], list[MetricFamily]]) -> None:
+        """
+        This method adds a function returning metrics computed when they are rendered
+        :param collector: returns a list of (name, type, help, [(labels, value)])
+        """
+        with self.lock:
+            self.collectors.append(collector)
+
+    def collect(self) -> list[MetricFamily]:
+        """
+        This method returns the metrics of this process, every sample labelled with the pid
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        families = [family for metric in metrics for family in metric.collect()]
+        for collector in collectors:
+            families.extend(collector())
+        pid = str(os.getpid())
+        return [(name, metric_type, documentation, [({'pid': pid, **sample[0]},) + tuple(sample[1:])
+                                                    for sample in samples])
+                for name, metric_type, documentation, samples in families]
+
+    def render(self) -> str:
+        """
+        This method renders every metric in the Prometheus text exposition format (version 0.0.4)
+        :return: text
+        """
+        families = self.collect()
+        if self.metrics_dir is not None:
+            self.flush(families)
+            families = merge_families(families + self.read_other_workers())
+        lines = []
+        for name, metric_type, documentation, samples in sorted(families, key=lambda family: family[0]):
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for sample in samples:
+                labels, value = sample[0], sample[1]
+                suffix = sample[2] if len(sample) > 2 else ''
+                lines.append(f'{name}{suffix}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def run_flush(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush(self.collect())
+            except Exception as e:
+                # the metrics must not take the worker down, the next flush tries again
+                self.logger.warning('Could not write the metrics of worker %s: %s', os.getpid(), e)
+
+    def flush(self, families: list[MetricFamily]) -> None:
+        data = json.dumps(families).encode('utf-8')
+        OhlcFileStore.atomic_write(os.path.join(self.metrics_dir, f'{os.getpid()}.json'), lambda f: f.write(data))
+
+    def read_other_workers(self) -> list[MetricFamily]:
+        families = []
+        now = time.time()
+        for file_name in os.listdir(self.metrics_dir):
+            match = WORKER_FILE_PATTERN.match(file_name)
+            if match is None or int(match.group(1)) == os.getpid():
+                continue
+            file = os.path.join(self.metrics_dir, file_name)
+            try:
+                if now - os.path.getmtime(file) > STALE_FLUSH_INTERVALS * self.flush_interval:
+                    # the worker exited, its series end
+                    os.remove(file)
+                    continue
+                with open(file, 'r', encoding='utf-8') as json_file:
+                    families.extend(tuple(family) for family in json.load(json_file))
+            except (FileNotFoundError, ValueError):
+                continue
+        return families
+
+
+def merge_families(families: list[MetricFamily]) -> list[MetricFamily]:
+    """
+    This function merges the families of the same name (the same metric of several workers) into one family
+    """
+    merged: dict[str, MetricFamily] = {}
+    for name, metric_type, documentation, samples in families:
+        if name in merged:
+            merged[name][3].extend(samples)
+        else:
+            merged[name] = (name, metric_type, documentation, list(samples))
+    return list(merged.values())
+
+
+def format_labels(labels: dict) -> str:
+    escaped = (f'{name}="{escape(value)}"' for name, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value: Optional[float]) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def instrumented_request(upstream: str, endpoint: str, method: str, url: str, session: requests.Session = None,
+                         **kwargs) -> requests.Response:
+    """
+    This function sends an HTTP request and records its latency and its outcome (status code, or error if no
+    response came back). Responses with status 429 are counted as rate limited as well
+    :param upstream: name of the upstream (kite, nse)
+    :param endpoint: name of the call, not the url, to keep the number of series small
+    :param method: HTTP method
+    :param url: url
+    :param session: session to send the request with, a new connection by default
+    :param kwargs: arguments of requests.request
+    :return: response
+    """
+    registry = MetricsRegistry.get_instance()
+    start_time = time.perf_counter()
+    status = 'error'
+    try:
+        response = (session or requests).request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        registry.histogram('upstream_request_duration_seconds', 'Latency of the HTTP calls to the upstreams',
+                           ('upstream', 'endpoint')).observe(time.perf_counter() - start_time,
+                                                             upstream=upstream, endpoint=endpoint)
+        registry.counter('upstream_requests', 'HTTP calls to the upstreams by status code',
+                         ('upstream', 'endpoint', 'status')).inc(upstream=upstream, endpoint=endpoint, status=status)
+        if status == '429':
+            registry.counter('upstream_rate_limited', 'HTTP calls refused by the upstreams with status 429',
+                             ('upstream', 'endpoint')).inc(upstream=upstream, endpoint=endpoint)
+
+
+def count_retries(upstream: str, operation: str, amount: int = 1) -> None:
+    MetricsRegistry.get_instance().counter('upstream_retries', 'Upstream calls tried again after a failure',
+                                           ('upstream', 'operation')).inc(amount, upstream=upstream,
+                                                                          operation=operation)
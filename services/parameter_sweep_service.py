@@ -0,0 +1,177 @@
+"""
+This module contains ParameterSweepService class which backtests many strategy configurations in parallel
+"""
+
+import itertools
+import logging
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import Optional
+
+import pandas as pd
+from pandas import DataFrame
+
+from model.backtest.backtest_data import BacktestData
+from model.backtest.backtester import Backtester, BacktestFeatureStore, BacktestParameters
+from model.index_membership import IndexMembership
+from services.config_service import ConfigService
+
+# the parameters a search space can contain
+SWEEP_PARAMETERS = ['num_days', 'top_n_percent', 'risk_factor', 'ticker_ema_span', 'atr_period', 'index_ema_span',
+                    'threshold', 'max_gap_percent']
+
+MEMBERSHIP_FILE = 'membership.npz'
+
+METRIC_COLUMNS = ['total_return', 'cagr', 'max_drawdown', 'annual_turnover', 'final_value', 'num_rebalances']
+
+# state of a worker process, set by init_worker
+worker_feature_store: Optional[BacktestFeatureStore] = None
+
+
+def init_worker(data_dir: str) -> None:
+    """
+    This function runs once in every worker process. The history is memory-mapped read-only, so all the workers
+    share the pages of one copy, and the feature store keeps the matrices a worker computed for the next
+    configurations with the same parameters
+    """
+    global worker_feature_store
+    membership_file = os.path.join(data_dir, MEMBERSHIP_FILE)
+    membership = IndexMembership.load(membership_file) if os.path.exists(membership_file) else None
+    worker_feature_store = BacktestFeatureStore(BacktestData.load(data_dir, mmap_mode='r'), membership)
+
+
+def run_configuration(parameters: BacktestParameters, start_date: date, end_date: date,
+                      initial_capital: float) -> dict:
+    row = {name: getattr(parameters, name) for name in SWEEP_PARAMETERS}
+    try:
+        backtester = Backtester(worker_feature_store.data, parameters, feature_store=worker_feature_store)
+        row.update(backtester.run(start_date, end_date, initial_capital).get_metrics())
+        row['error'] = None
+    except Exception as e:
+        row['error'] = str(e)
+    return row
+
+
+class ParameterSweepService:
+    """
+    This service evaluates a grid or a random sample of strategy configurations with the backtester, in a
+    process pool, and ranks them by return, drawdown and turnover
+    """
+
+    def __init__(self, max_workers: int = None, data_dir: str = None) -> None:
+        """
+        This method initializes ParameterSweepService object
+        :param max_workers: number of worker processes, defaults to sweep.max_workers or the number of cores
+        :param data_dir: directory where the history is saved for the workers, defaults to sweep.data_dir
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        config_service = ConfigService.get_instance()
+        self.max_workers = max_workers or int(config_service.get_or_default('sweep.max_workers',
+                                                                              default=os.cpu_count() or 1))
+        self.data_dir = data_dir or config_service.get_or_default('sweep.data_dir', default='data/sweep')
+
+    @staticmethod
+    def grid(base: BacktestParameters, space: dict[str, list]) -> list[BacktestParameters]:
+        """
+        This method returns every combination of the values of the search space
+        :param base: parameters that are not part of the search space
+        :param space: parameter name -> values to try
+        :return: list of configurations
+        """
+        validate_space(space)
+        names = list(space.keys())
+        return [base.replace(**dict(zip(names, values))) for values in itertools.product(*space.values())]
+
+    @staticmethod
+    def random(base: BacktestParameters, space: dict[str, list], num_samples: int,
+               seed: int = None) -> list[BacktestParameters]:
+        """
+        This method returns distinct random combinations of the values of the search space
+        :param base: parameters that are not part of the search space
+        :param space: parameter name -> values to sample from
+        :param num_samples: number of configurations
+        :param seed: seed of the random generator
+        :return: list of configurations
+        """
+        validate_space(space)
+        names = list(space.keys())
+        num_combinations = 1
+        for values in space.values():
+            num_combinations *= len(values)
+        generator = random.Random(seed)
+        samples = set()
+        while len(samples) < min(num_samples, num_combinations):
+            samples.add(tuple(generator.randrange(len(space[name])) for name in names))
+        return [base.replace(**{name: space[name][index] for name, index in zip(names, sample)})
+                for sample in sorted(samples)]
+
+    def run(self, data: BacktestData, configurations: list[BacktestParameters], start_date: date, end_date: date,
+            initial_capital: float, file_name: str = 'sweep_results.csv',
+            membership: IndexMembership = None) -> DataFrame:
+        """
+        This method backtests every configuration and writes the ranked results
+        :param data: history of the universe and of the index
+        :param configurations: configurations to evaluate
+        :param start_date: first date of the backtests
+        :param end_date: last date of the backtests
+        :param initial_capital: cash at the start of the backtests
+        :param file_name: csv file the ranked results are written to (None to skip)
+        :param membership: point-in-time membership of the index, None if every ticker is always eligible
+        :return: ranked results, one row per configuration
+        """
+        data.save(self.data_dir)
+        membership_file = os.path.join(self.data_dir, MEMBERSHIP_FILE)
+        if membership is not None:
+            membership.save(membership_file)
+        elif os.path.exists(membership_file):
+            os.remove(membership_file)
+        # configurations sharing the indicator parameters run next to each other, so a worker reuses its matrices
+        configurations = sorted(configurations, key=lambda parameters: (
+            parameters.num_days, parameters.ticker_ema_span, parameters.atr_period, parameters.index_ema_span))
+        num_configurations = len(configurations)
+        self.logger.info('Running %s configurations on %s workers', num_configurations, self.max_workers)
+        chunk_size = max(1, num_configurations // (self.max_workers * 4))
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_worker,
+                                 initargs=(self.data_dir,)) as executor:
+            rows = list(executor.map(run_configuration, configurations,
+                                     itertools.repeat(start_date, num_configurations),
+                                     itertools.repeat(end_date, num_configurations),
+                                     itertools.repeat(initial_capital, num_configurations),
+                                     chunksize=chunk_size))
+        for row in rows:
+            if row['error'] is not None:
+                self.logger.error('Configuration %s failed: %s',
+                                  {name: row[name] for name in SWEEP_PARAMETERS}, row['error'])
+        results_df = rank_results(pd.DataFrame(rows, columns=SWEEP_PARAMETERS + METRIC_COLUMNS + ['error']))
+        if file_name is not None:
+            results_df.to_csv(file_name, index=False)
+        return results_df
+
+
+def validate_space(space: dict[str, list]) -> None:
+    for name, values in space.items():
+        if name not in SWEEP_PARAMETERS:
+            raise ValueError(f'{name} can not be swept, use one of {SWEEP_PARAMETERS}')
+        if len(values) == 0:
+            raise ValueError(f'No values given for {name}')
+
+
+def rank_results(results_df: DataFrame) -> DataFrame:
+    """
+    This function ranks the configurations by return (higher is better), drawdown (smaller is better) and turnover
+    (lower is better). The configurations are sorted by the average of the three ranks, failed ones last
+    :param results_df: one row per configuration with the metric columns
+    :return: ranked data frame with return_rank, drawdown_rank, turnover_rank and rank columns
+    """
+    results_df = results_df.copy()
+    results_df['return_rank'] = results_df['total_return'].rank(ascending=False, method='min')
+    # max_drawdown is negative, the closest to 0 is the best
+    results_df['drawdown_rank'] = results_df['max_drawdown'].rank(ascending=False, method='min')
+    results_df['turnover_rank'] = results_df['annual_turnover'].rank(ascending=True, method='min')
+    results_df['rank'] = results_df[['return_rank', 'drawdown_rank', 'turnover_rank']].mean(axis=1)
+    results_df.sort_values(by=['rank', 'return_rank'], inplace=True, kind='stable', na_position='last')
+    results_df.reset_index(inplace=True, drop=True)
+    return results_df
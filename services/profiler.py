@@ -0,0 +1,264 @@
+"""
+This module contains ProfilerService class which profiles single requests on demand
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from repositories.ohlc_file_store import OhlcFileStore
+from services.config_service import ConfigService
+
+# number of allocation sites kept in a profile
+NUM_ALLOCATION_SITES = 25
+# number of stack frames tracemalloc keeps per allocation
+TRACEMALLOC_FRAMES = 1
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+
+
+class SamplingProfiler:
+    """
+    This class samples the stacks of every thread of the process at a fixed interval from a background thread and
+    counts the collapsed stacks (thread;outer frame;...;inner frame), the input of flamegraph.pl and speedscope.
+    Every thread is sampled because the work of a request can run elsewhere (e.g. the job of /api/init)
+    """
+
+    def __init__(self, interval: float) -> None:
+        """
+        This method initializes SamplingProfiler object
+        :param interval: seconds between two samples
+        """
+        super().__init__()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.num_samples = 0
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        own_thread_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                frames.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(frames))] += 1
+            self.num_samples += 1
+
+    def get_collapsed_stacks(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfilerService:
+    """
+    This service profiles the requests that ask for it with the X-Profile header or the profile query param, when
+    profiling.enabled is set. A profile holds the collapsed stacks of a SamplingProfiler and the allocation sites
+    that grew the most during the request according to tracemalloc. Both slow the request down, so one request is
+    profiled at a time and the others are served as usual
+    """
+    instance = None
+    instance_lock = threading.Lock()
+
+    def __init__(self, enabled: bool, profiles_dir: str, interval: float, max_profiles: int) -> None:
+        """
+        This method initializes ProfilerService object
+        :param enabled: whether requests can ask to be profiled
+        :param profiles_dir: directory of the profiles
+        :param interval: seconds between two stack samples
+        :param max_profiles: number of profiles kept, the oldest ones are deleted
+        """
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.enabled = enabled
+        self.profiles_dir = profiles_dir
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'ProfilerService':
+        """
+        This method returns the singleton instance of ProfilerService
+        :return: ProfilerService instance
+        """
+        with cls.instance_lock:
+            if cls.instance is None:
+                config_service = ConfigService.get_instance()
+                cls.instance = ProfilerService(
+                    enabled=str(config_service.get_or_default('profiling.enabled', default='False')) == 'True',
+                    profiles_dir=config_service.get_or_default('profiling.dir', default='data/profiles'),
+                    interval=float(config_service.get_or_default('profiling.interval_ms', default=5)) / 1000,
+                    max_profiles=int(config_service.get_or_default('profiling.max_profiles', default=50)))
+            return cls.instance
+
+    def start(self, method: str, path: str, trace_memory: bool = True) -> Optional['Profile']:
+        """
+        This method starts profiling a request
+        :param method: HTTP method of the request
+        :param path: path of the request
+        :param trace_memory: whether to trace the allocations. tracemalloc makes allocation heavy code several times
+        slower, so the timings of the stacks are skewed as well
+        :return: Profile to stop when the response is sent, None if another request is being profiled
+        """
+        if not self.lock.acquire(blocking=False):
+            self.logger.info('Not profiling %s %s, another request is being profiled', method, path)
+            return None
+        try:
+            return Profile(self, method, path, trace_memory)
+        except Exception:
+            self.lock.release()
+            raise
+
+    def save(self, profile: 'Profile', collapsed_stacks: str, meta: dict) -> None:
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        stacks_data = collapsed_stacks.encode('utf-8')
+        OhlcFileStore.atomic_write(self.get_file(profile.id, 'collapsed'), lambda f: f.write(stacks_data))
+        meta_data = json.dumps(meta, indent=2).encode('utf-8')
+        OhlcFileStore.atomic_write(self.get_file(profile.id, 'json'), lambda f: f.write(meta_data))
+        for profile_id in self.get_profile_ids()[self.max_profiles:]:
+            for extension in ['json', 'collapsed']:
+                if os.path.exists(self.get_file(profile_id, extension)):
+                    os.remove(self.get_file(profile_id, extension))
+        self.logger.info('Saved profile %s of %s %s (%.3f seconds)', profile.id, profile.method, profile.path,
+                         meta['elapsed'])
+
+    def get_profile_ids(self) -> list[str]:
+        """
+        This method returns the ids of the saved profiles, the most recent first
+        """
+        if not os.path.isdir(self.profiles_dir):
+            return []
+        profile_ids = [file_name[:-len('.json')] for file_name in os.listdir(self.profiles_dir)
+                       if file_name.endswith('.json') and PROFILE_ID_PATTERN.match(file_name[:-len('.json')])]
+        return sorted(profile_ids, reverse=True)
+
+    def get_profiles(self) -> list[dict]:
+        """
+        This method returns the summary of the saved profiles, the most recent first
+        """
+        profiles = []
+        for profile_id in self.get_profile_ids():
+            meta = self.get_profile(profile_id)
+            if meta is not None:
+                profiles.append({key: meta[key] for key in ['id', 'method', 'path', 'started_at', 'elapsed',
+                                                            'num_samples', 'peak_traced_bytes']})
+        return profiles
+
+    def get_profile(self, profile_id: str) -> Optional[dict]:
+        """
+        This method returns a saved profile without its stacks
+        :param profile_id: id of the profile
+        :return: dict, None if there is no such profile
+        """
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(self.get_file(profile_id, 'json'), 'r', encoding='utf-8') as json_file:
+                return json.load(json_file)
+        except FileNotFoundError:
+            return None
+
+    def get_collapsed_stacks(self, profile_id: str) -> Optional[str]:
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        try:
+            with open(self.get_file(profile_id, 'collapsed'), 'r', encoding='utf-8') as text_file:
+                return text_file.read()
+        except FileNotFoundError:
+            return None
+
+    def get_file(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.profiles_dir, f'{profile_id}.{extension}')
+
+
+class Profile:
+    """
+    This class profiles one request, from its creation to stop()
+    """
+
+    def __init__(self, service: ProfilerService, method: str, path: str, trace_memory: bool = True) -> None:
+        super().__init__()
+        self.service = service
+        self.method = method
+        self.path = path
+        self.trace_memory = trace_memory
+        self.started_at = datetime.now()
+        self.id = f'{self.started_at.strftime("%Y%m%dT%H%M%S")}-{uuid.uuid4().hex[:8]}'
+        # tracemalloc may already be on (e.g. PYTHONTRACEMALLOC), then it is left on
+        self.started_tracemalloc = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.start_snapshot = None
+        if trace_memory:
+            tracemalloc.reset_peak()
+            self.start_snapshot = tracemalloc.take_snapshot()
+        self.sampler = SamplingProfiler(service.interval)
+        self.start_time = time.perf_counter()
+        self.sampler.start()
+        self.stopped = False
+
+    def stop(self, status_code: int = None) -> None:
+        """
+        This method stops profiling and saves the profile. Calling it again does nothing
+        :param status_code: status code of the response
+        """
+        if self.stopped:
+            return
+        self.stopped = True
+        try:
+            self.sampler.stop()
+            elapsed = time.perf_counter() - self.start_time
+            peak_traced_bytes = None
+            allocation_sites = []
+            if self.trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak_traced_bytes = tracemalloc.get_traced_memory()
+                if self.started_tracemalloc:
+                    tracemalloc.stop()
+                # the allocations of the profiler itself are left out
+                statistics = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                     tracemalloc.Filter(False, __file__)]) \
+                    .compare_to(self.start_snapshot, 'lineno')
+                allocation_sites = [{'site': f'{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}',
+                                     'size_diff': statistic.size_diff,
+                                     'count_diff': statistic.count_diff,
+                                     'size': statistic.size}
+                                    for statistic in statistics[:NUM_ALLOCATION_SITES]]
+            meta = {'id': self.id,
+                    'method': self.method,
+                    'path': self.path,
+                    'status_code': status_code,
+                    'started_at': self.started_at.isoformat(timespec='seconds'),
+                    'elapsed': elapsed,
+                    'interval': self.service.interval,
+                    'num_samples': self.sampler.num_samples,
+                    'peak_traced_bytes': peak_traced_bytes,
+                    'allocation_sites': allocation_sites}
+            self.service.save(self, self.sampler.get_collapsed_stacks(), meta)
+        except Exception:
+            self.service.logger.exception('Could not save profile %s', self.id)
+        finally:
+            self.service.lock.release()
@@ -0,0 +1,111 @@
+"""
+This module contains the quote sources used to get the last traded price of many tickers with one request
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+from services.config_service import ConfigService
+from services.metrics import instrumented_request
+
+# kite accepts up to 1000 instruments in one ltp request
+MAX_INSTRUMENTS_PER_REQUEST = 1000
+
+
+class QuoteSource(ABC):
+    """
+    This class returns the last traded price of many tickers at once
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+
+    @abstractmethod
+    def get_ltp(self, tickers: list[str]) -> dict[str, float]:
+        """
+        This method returns the last traded prices
+        :param tickers: ticker symbols
+        :return: ticker -> last traded price. Tickers without a quote are left out
+        """
+        pass
+
+
+class KiteQuoteSource(QuoteSource):
+    """
+    This class reads the last traded prices from kite's ltp endpoint, one request for up to 1000 tickers
+    """
+
+    def __init__(self, kite_client, exchange: str = 'NSE') -> None:
+        """
+        This method initializes KiteQuoteSource object
+        :param kite_client: HttpKiteClient whose session (base url, headers and rate limiter) is used
+        :param exchange: exchange of the tickers
+        """
+        super().__init__()
+        self.kite_client = kite_client
+        self.exchange = exchange
+
+    def get_ltp(self, tickers: list[str]) -> dict[str, float]:
+        prices = {}
+        tickers = list(dict.fromkeys(tickers))
+        for start in range(0, len(tickers), MAX_INSTRUMENTS_PER_REQUEST):
+            prices.update(self.fetch_ltp(tickers[start:start + MAX_INSTRUMENTS_PER_REQUEST]))
+        return prices
+
+    def fetch_ltp(self, tickers: list[str]) -> dict[str, float]:
+        self.kite_client.get_rate_limiter().acquire()
+        instruments = [f'{self.exchange}:{ticker}' for ticker in tickers]
+        response = instrumented_request('kite', 'quote_ltp', 'GET', f'{self.kite_client.base_url}/oms/quote/ltp',
+                                        params={'i': instruments}, headers=self.kite_client.get_headers(), timeout=10)
+        if response.status_code not in [200]:
+            raise Exception(
+                f'Error while fetching quotes from kite api. Status code: {response.status_code}, '
+                f'response: {response.text}')
+        quotes = response.json()['data']
+        prices = {}
+        for ticker, instrument in zip(tickers, instruments):
+            quote = quotes.get(instrument)
+            if quote is not None and quote.get('last_price') is not None:
+                prices[ticker] = float(quote['last_price'])
+        self.logger.info('Fetched quotes of %s out of %s tickers from kite', len(prices), len(tickers))
+        return prices
+
+
+class FileQuoteSource(QuoteSource):
+    """
+    This class reads the prices from a csv file with ticker and last_price columns. It stands in for kite in tests
+    and when working offline
+    """
+
+    def __init__(self, file_name: str) -> None:
+        """
+        This method initializes FileQuoteSource object
+        :param file_name: csv file with ticker and last_price columns
+        """
+        super().__init__()
+        self.file_name = file_name
+
+    def get_ltp(self, tickers: list[str]) -> dict[str, float]:
+        if not os.path.exists(self.file_name):
+            self.logger.warning('Quote file %s not found', self.file_name)
+            return {}
+        quotes_df = pd.read_csv(self.file_name)
+        prices = dict(zip(quotes_df['ticker'], quotes_df['last_price'].astype(float)))
+        return {ticker: prices[ticker] for ticker in tickers if ticker in prices}
+
+
+def get_quote_source(kite_client) -> QuoteSource:
+    """
+    This function returns the quote source configured by quotes.source (kite or file)
+    :param kite_client: HttpKiteClient used by the kite quote source
+    :return: QuoteSource
+    """
+    config_service = ConfigService.get_instance()
+    source = config_service.get_or_default('quotes.source', default='kite')
+    if source == 'file':
+        return FileQuoteSource(config_service.get_or_default('quotes.file', default='quotes.csv'))
+    return KiteQuoteSource(kite_client)
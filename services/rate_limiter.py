@@ -0,0 +1,110 @@
+"""
+This module contains a thread safe token bucket rate limiter used to throttle upstream API calls
+"""
+
+import threading
+import time
+import weakref
+
+from services.metrics import MetricsRegistry
+
+
+class TokenBucketRateLimiter:
+    """
+    Token bucket rate limiter. Tokens are added at a constant rate up to a maximum capacity and every call
+    to acquire() consumes one token, blocking until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = None, name: str = None) -> None:
+        """
+        This method initializes the rate limiter
+        :param rate: number of tokens (requests) allowed per second
+        :param capacity: maximum number of tokens that can be accumulated (burst size). Defaults to rate
+        :param name: name of the limiter in the metrics, None to leave it out
+        """
+        super().__init__()
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0")
+        self.rate: float = float(rate)
+        self.capacity: float = float(capacity) if capacity else max(1.0, self.rate)
+        self.tokens: float = self.capacity
+        self.last_refill: float = time.monotonic()
+        self.lock = threading.Lock()
+        self.name = name
+        if name is not None:
+            rate_limiters.add(self)
+
+    def acquire(self) -> float:
+        """
+        This method blocks until a token is available and consumes it
+        :return: number of seconds spent waiting for the token
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if self.name is not None:
+                        MetricsRegistry.get_instance().histogram(
+                            'rate_limiter_wait_seconds', 'Seconds callers waited for a token',
+                            ('limiter',)).observe(waited, limiter=self.name)
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+
+
+class AdaptiveRateLimiter(TokenBucketRateLimiter):
+    """
+    Token bucket rate limiter whose rate follows the upstream. Every success raises the rate a little up to max_rate
+    and every failure (e.g. the upstream started to refuse requests) halves it down to min_rate and drops the
+    accumulated tokens, so the callers back off at once
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float, increase: float = 0.1,
+                 name: str = None) -> None:
+        """
+        This method initializes the rate limiter
+        :param rate: initial number of requests per second
+        :param min_rate: lowest rate after failures
+        :param max_rate: highest rate after successes
+        :param increase: rate added after every success
+        :param name: name of the limiter in the metrics, None to leave it out
+        """
+        super().__init__(rate, name=name)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+
+    def on_success(self) -> None:
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_failure(self) -> None:
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+        if self.name is not None:
+            MetricsRegistry.get_instance().counter('rate_limiter_backoffs', 'Times the rate was halved after a failure',
+                                                   ('limiter',)).inc(limiter=self.name)
+
+
+# the named rate limiters of the process, their current rate is reported by the metrics registry
+rate_limiters: 'weakref.WeakSet[TokenBucketRateLimiter]' = weakref.WeakSet()
+
+
+def collect_rate_limiter_metrics() -> list:
+    samples = [({'limiter': rate_limiter.name}, rate_limiter.rate) for rate_limiter in list(rate_limiters)]
+    return [('rate_limiter_rate', 'gauge', 'Requests per second allowed by the rate limiter', samples)]
+
+
+MetricsRegistry.get_instance().add_collector(collect_rate_limiter_metrics)
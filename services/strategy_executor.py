@@ -10,9 +10,12 @@ from model.position_sizing.position_sizing_strategies import EqualRiskPositionSi
 from model.ranking.ranking_strategies import VolatilityAdjustedReturnsRankingStrategy
 from model.scheduling.frequency import Frequency, DayOfWeek
 from model.scheduling.schedule import Schedule
+from repositories.file_lock import FileLock
 from services.config_service import ConfigService
+from services.execution_listener import ExecutionListener, MetricsExecutionListener
+from services.feature_store import FeatureStore
 from services.index_service import IndexDataService
-from services.portfolio_service import PortfolioService
+from services.portfolio_service import PORTFOLIO_FILE_KEY, PortfolioService
 
 
 class StrategyExecutor:
@@ -27,13 +30,16 @@ class StrategyExecutor:
         self.portfolio_service = PortfolioService()
         self.index_service = IndexDataService()
 
-    def execute(self, cash_flow: float = 0.0):
+    def execute(self, cash_flow: float = 0.0, listener: ExecutionListener = None):
         """
         This method executes the strategy
         :param cash_flow: The amount of cash to be invested
+        :param listener: receives the progress of the stages of the run
         :return: Rebalancing result
         """
         self.logger.info('Executing strategy executor')
+        # the stages of every run are timed in the metrics registry
+        listener = MetricsExecutionListener(listener)
 
         current_portfolio = self.portfolio_service.get_portfolio()
         self.logger.info("Current portfolio: \n%s", current_portfolio)
@@ -57,23 +63,30 @@ class StrategyExecutor:
         inception_date = date(2010, 1, 1)
         end_date = inception_date.replace(year=date.today().year + 100)
 
+        # candles and indicators are shared by the ranking, position sizing and market regime stages of this run
+        feature_store = FeatureStore(listener=listener)
+
         ranking_strategy = VolatilityAdjustedReturnsRankingStrategy(
             num_days=num_days,
             default_historical_lookup_days=num_historical_lookup_days,
             max_gap_percent=max_gap_percent,
-            ticker_ema_span=ticker_ema_span
+            ticker_ema_span=ticker_ema_span,
+            feature_store=feature_store,
+            listener=listener
         )
 
         position_size_strategy = EqualRiskPositionSizingStrategy(
             default_historical_lookup_days=num_historical_lookup_days,
             atr_period=atr_period,
-            risk_factor=risk_factor
+            risk_factor=risk_factor,
+            feature_store=feature_store
         )
 
         market_regime_filter = LongTermMovingAverageMarketRegimeFilter(
             index='NIFTY 50',
             index_ema_span=index_ema_span,
-            default_historical_lookup_days=default_historical_lookup_days)
+            default_historical_lookup_days=default_historical_lookup_days,
+            feature_store=feature_store)
 
         position_rebalance_schedule = Schedule(
             start_date=inception_date,
@@ -96,7 +109,8 @@ class StrategyExecutor:
             market_regime_filter=market_regime_filter,
             position_sizing_strategy=position_size_strategy,
             position_rebalance_schedule=position_rebalance_schedule,
-            threshold=threshold
+            threshold=threshold,
+            listener=listener
         )
 
         momentum_strategy = MomentumStrategy(
@@ -104,7 +118,9 @@ class StrategyExecutor:
             ranking_strategy=ranking_strategy,
             market_regime_filter=market_regime_filter,
             portfolio_rebalancing_strategy=portfolio_rebalancing_strategy,
-            portfolio_rebalance_schedule=portfolio_rebalance_schedule
+            portfolio_rebalance_schedule=portfolio_rebalance_schedule,
+            listener=listener,
+            persist_lock=FileLock(f'{self.config_service.get(PORTFOLIO_FILE_KEY)}.lock')
         )
 
         index = self.config_service.get(constants.STOCK_UNIVERSE_INDEX_KEY)
@@ -113,6 +129,9 @@ class StrategyExecutor:
             index_constituents_filter = IndexConstituentsFilter(min_market_cap=min_market_cap)
         else:
             index_constituents_filter = None
-        stock_universe = self.index_service.get_index_constituents(index, index_filter=index_constituents_filter)
+        with listener.stage('constituents'):
+            stock_universe = self.index_service.get_index_constituents(index,
+                                                                       index_filter=index_constituents_filter,
+                                                                       listener=listener)
 
         return momentum_strategy.execute(stock_universe, current_portfolio, cash_flow)
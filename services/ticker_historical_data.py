@@ -1,8 +1,10 @@
 import logging
 from datetime import date
+from typing import Callable, Optional
 
 from pandas import DataFrame
 from clients.nse_client import NSEClient
+from model.bulk_fetch_result import BulkFetchResult
 from model.Ohlcv import OhlcData
 from repositories.ohlc_repo import OhlcRepository
 from services.kite_connect_service import KiteConnectService
@@ -19,10 +21,25 @@ class TickerDataService:
     def get_data(self, ticker: str, start_date: date, end_date: date) -> OhlcData:
         return self.kite_service.get_data(ticker, start_date, end_date)
 
+    def get_data_many(self, tickers: list[str], start_date: date, end_date: date,
+                      on_progress: Callable[[int, int, str, Optional[bool]], None] = None) -> BulkFetchResult:
+        """Get data for many tickers at once. Results are in the order of tickers, failures are reported per ticker.
+        on_progress(done, total, ticker, from_cache) is called as tickers complete, from_cache is None when the
+        client cannot tell"""
+        return self.kite_service.get_data_many(tickers, start_date, end_date, on_progress=on_progress)
+
     def get_data_from_db(self, ticker: str, start_date: date, end_date: date) -> OhlcData:
-        """Get data from database: Not implemented yet"""
+        """Get data from database"""
         return self.repository.get_data_from_db(ticker, start_date, end_date)
 
+    def get_data_many_from_db(self, tickers: list[str], start_date: date, end_date: date) -> dict[str, OhlcData]:
+        """Get data of many tickers from database in a single query"""
+        return self.repository.get_data_many_from_db(tickers, start_date, end_date)
+
+    def save_data_to_db(self, ohlc_dataset: list[OhlcData]) -> None:
+        """Bulk upsert candles into database"""
+        self.repository.save_data(ohlc_dataset)
+
     def get_data_from_api(self, ticker: str, start_date: date, end_date: date) -> OhlcData:
         """Get data from database: There is issue with nsepy library. It is not returning data for some stocks"""
         return self.client.get_data(ticker, start_date, end_date)
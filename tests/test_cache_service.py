@@ -0,0 +1,128 @@
+"""
+Coverage of the candle cache: which days are served from the cache and which are fetched again from kite
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from model.Ohlcv import OhlcData
+from model.date_range_set import DateRangeSet
+from model.scheduling.trading_calendar import MARKET_TIMEZONE, TradingCalendar
+from repositories.ohlc_file_store import EPOCH, OhlcFileStore, to_epoch_day
+from services.cache_service import CacheEntry, CacheService
+from services.config_service import ConfigService
+from services.kite_client import HttpKiteClient, KiteClient
+
+
+def setUpModule() -> None:
+    # the services read their defaults from app.properties, the sample is used when there is none
+    if ConfigService.instance is None and not os.path.exists('app.properties'):
+        work_dir = tempfile.mkdtemp()
+        shutil.copy(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'app.properties.sample'),
+                    os.path.join(work_dir, 'app.properties'))
+        current_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            ConfigService.get_instance()
+        finally:
+            os.chdir(current_dir)
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def make_candles(ticker: str, start_date: date, end_date: date) -> OhlcData:
+    dates = np.arange(to_epoch_day(start_date), to_epoch_day(end_date) + 1, dtype=np.int64)
+    close = np.full(len(dates), 100.0)
+    return OhlcData(ticker, dates, np.vstack([close, close, close, close, close]))
+
+
+class CountingKiteClient(HttpKiteClient):
+    """
+    Kite client whose historical API is replaced by generated candles, it counts the calls
+    """
+
+    def __init__(self, cache_service: CacheService) -> None:
+        KiteClient.__init__(self)
+        self.cache_service = cache_service
+        self.calls = []
+
+    def fetch_data(self, ticker, start_date, end_date):
+        self.calls.append((ticker, start_date, end_date))
+        return make_candles(ticker, start_date, end_date)
+
+
+class CacheServiceTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.store_dir, ignore_errors=True)
+        self.today = datetime.now(MARKET_TIMEZONE).date()
+        self.start_date = self.today - timedelta(days=60)
+        # today is a holiday, so its candle (if any) is final
+        self.calendar = TradingCalendar(holidays=[self.today])
+
+    def new_cache_service(self) -> CacheService:
+        # every cache service has its own memory, like a worker process, and they share the store directory
+        return CacheService(store=OhlcFileStore(self.store_dir, max_bytes=1024 * 1024 * 1024),
+                            trading_calendar=self.calendar)
+
+    def test_range_ending_today_is_covered_on_a_non_session_day(self) -> None:
+        cache_service = self.new_cache_service()
+        cache_service.save_data('ABC', self.start_date, self.today, make_candles('ABC', self.start_date, self.today))
+        self.assertEqual(cache_service.get_missing_ranges('ABC', self.start_date, self.today), [])
+        # a restarted worker reads the coverage from the store
+        self.assertEqual(self.new_cache_service().get_missing_ranges('ABC', self.start_date, self.today), [])
+
+    def test_days_after_today_are_not_covered(self) -> None:
+        cache_service = self.new_cache_service()
+        end_date = self.today + timedelta(days=3)
+        cache_service.save_data('ABC', self.start_date, end_date, make_candles('ABC', self.start_date, self.today))
+        self.assertEqual(cache_service.get_missing_ranges('ABC', self.start_date, end_date),
+                         [(self.today + timedelta(days=1), end_date)])
+
+    def test_second_call_and_second_worker_do_not_call_kite(self) -> None:
+        first_client = CountingKiteClient(self.new_cache_service())
+        ohlc_data, from_cache = first_client.get_data_with_source('ABC', self.start_date, self.today)
+        self.assertEqual(len(first_client.calls), 1)
+        self.assertFalse(from_cache)
+        self.assertEqual(len(ohlc_data), 61)
+
+        ohlc_data, from_cache = first_client.get_data_with_source('ABC', self.start_date, self.today)
+        self.assertEqual(len(first_client.calls), 1)
+        self.assertTrue(from_cache)
+
+        second_client = CountingKiteClient(self.new_cache_service())
+        ohlc_data, from_cache = second_client.get_data_with_source('ABC', self.start_date, self.today)
+        self.assertEqual(second_client.calls, [])
+        self.assertTrue(from_cache)
+        self.assertEqual(len(ohlc_data), 61)
+
+    def test_intraday_candle_is_covered_until_the_close(self) -> None:
+        day = date(2024, 5, 10)
+        close = time.time()
+        entry = CacheEntry(make_candles('ABC', date(2024, 5, 1), day).to_matrix(),
+                           DateRangeSet([(date(2024, 5, 1), day)]), intraday=[to_epoch_day(day), close])
+        self.assertEqual(entry.missing(date(2024, 5, 1), day, now=close - 1), [])
+        self.assertEqual(entry.missing(date(2024, 5, 1), day, now=close), [(day, day)])
+        self.assertEqual(entry.missing(date(2024, 5, 1), day - timedelta(days=1), now=close), [])
+        self.assertEqual(EPOCH + timedelta(days=entry.intraday[0]), day)
+
+    def test_intraday_marker_is_shared_through_the_store_and_cleared_by_the_final_candle(self) -> None:
+        store = OhlcFileStore(self.store_dir, max_bytes=1024 * 1024 * 1024)
+        day = date(2024, 5, 10)
+        store.write('ABC', date(2024, 5, 1), day, make_candles('ABC', date(2024, 5, 1), day).to_matrix(),
+                    intraday_until=time.time() - 1)
+        cache_service = self.new_cache_service()
+        self.assertEqual(cache_service.get_missing_ranges('ABC', date(2024, 5, 1), day), [(day, day)])
+        store.write('ABC', day, day, make_candles('ABC', day, day).to_matrix())
+        self.assertIsNone(store.get_intraday('ABC'))
+        self.assertEqual(cache_service.get_missing_ranges('ABC', date(2024, 5, 1), day), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,7 @@
+"""
+Entry point of the production serving mode: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from main import create_app
+
+app = create_app()